@@ -0,0 +1,238 @@
+"""
+Read-through cache for the Account lookups by account_uuid.
+
+The cache is opt-in and configured with the ACCOUNTS_CACHE setting :
+
+    ACCOUNTS_CACHE = {
+        'BACKEND': 'accounts.account_cache.AccountCache',
+        'CACHE_ALIAS': 'default',
+        'TIMEOUT': 300,
+    }
+
+Without the setting, lookups go straight to the database through NullAccountCache.
+Use a cache shared by all the processes (memcached, redis, database) : with a per-process
+cache such as LocMemCache, an invalidation only reaches the process that issued it.
+
+Every account has a generation number stored in the cache. The cached data key embeds that
+generation, so an invalidation only has to replace the generation : a reader that loaded stale
+data before the invalidation writes it under a key nobody reads anymore.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import router, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from accounts.models import Account
+import hashlib
+import logging
+import time
+import uuid
+
+logger = logging.getLogger('accounts')
+
+DEFAULT_ACCOUNT_CACHE_BACKEND = 'accounts.account_cache.NullAccountCache'
+
+# User fields stored along with the account. The other fields (password, last_login, ...)
+# are deferred on the cached instance and loaded from the database when accessed.
+USER_CACHED_FIELDS = ('id', 'username', 'first_name', 'last_name', 'email', 'is_active', 'is_staff', 'is_superuser', 'date_joined')
+
+
+def _as_uuid(value):
+    if isinstance(value, uuid.UUID):
+        return value
+    try:
+        return uuid.UUID(str(value))
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+class NullAccountCache:
+    """
+    Account lookup without caching. This is the default backend.
+    """
+    enabled = False
+
+    def __init__(self, **kwargs):
+        pass
+
+    def get_account(self, account_uuid):
+        account_uuid = _as_uuid(account_uuid)
+        if account_uuid is None:
+            return None
+        return self.load(account_uuid)
+
+    def load(self, account_uuid):
+        return Account.objects.select_related('user').filter(account_uuid=account_uuid).first()
+
+    def invalidate(self, account_uuid):
+        pass
+
+    def invalidate_many(self, account_uuids):
+        pass
+
+
+class AccountCache(NullAccountCache):
+    """
+    Read-through cache on top of the Django cache framework.
+
+    Accounts are stored in a compact form : a tuple of the raw column values of the account
+    and of the USER_CACHED_FIELDS of its user, instead of the pickled model instances.
+    On a miss, only one process loads the account from the database : the others wait for
+    the value for at most LOCK_WAIT seconds before falling back to the database themselves.
+    """
+    enabled = True
+    key_prefix = 'accounts:account'
+
+    def __init__(self, CACHE_ALIAS='default', TIMEOUT=300, LOCK_TIMEOUT=5, LOCK_WAIT=0.5, LOCK_POLL_INTERVAL=0.02, **kwargs):
+        super().__init__(**kwargs)
+        self.cache_alias = CACHE_ALIAS
+        self.timeout = TIMEOUT
+        self.lock_timeout = LOCK_TIMEOUT
+        self.lock_wait = LOCK_WAIT
+        self.lock_poll_interval = LOCK_POLL_INTERVAL
+        self.account_fields = tuple(f.attname for f in Account._meta.concrete_fields)
+        # Model.from_db() expects the values in the model field order.
+        self.user_fields = tuple(f.attname for f in User._meta.concrete_fields if f.attname in USER_CACHED_FIELDS)
+        # the schema version changes whenever the cached columns change, so entries written
+        # by an older release of the model are never read back.
+        schema = ','.join(self.account_fields + self.user_fields)
+        self.schema_version = hashlib.blake2b(schema.encode(), digest_size=4).hexdigest()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def generation_key(self, account_uuid):
+        return f"{self.key_prefix}:gen:{account_uuid.hex}"
+
+    def data_key(self, account_uuid, generation):
+        return f"{self.key_prefix}:{self.schema_version}:{account_uuid.hex}:{generation}"
+
+    def get_generation(self, account_uuid):
+        key = self.generation_key(account_uuid)
+        generation = self.cache.get(key)
+        if generation is None:
+            generation = time.time_ns()
+            if not self.cache.add(key, generation, None):
+                generation = self.cache.get(key, generation)
+        return generation
+
+    def pack(self, account):
+        user = account.user
+        return (
+            tuple(getattr(account, name) for name in self.account_fields),
+            tuple(getattr(user, name) for name in self.user_fields),
+        )
+
+    def unpack(self, packed):
+        account_values, user_values = packed
+        account = Account.from_db(router.db_for_read(Account), self.account_fields, account_values)
+        account.user = User.from_db(router.db_for_read(User), self.user_fields, user_values)
+        return account
+
+    def get_account(self, account_uuid):
+        account_uuid = _as_uuid(account_uuid)
+        if account_uuid is None:
+            return None
+        data_key = self.data_key(account_uuid, self.get_generation(account_uuid))
+        packed = self.cache.get(data_key)
+        if packed is not None:
+            return self.unpack(packed)
+
+        lock_key = f"{data_key}:lock"
+        if self.cache.add(lock_key, 1, self.lock_timeout):
+            try:
+                return self.fill(data_key, account_uuid)
+            finally:
+                self.cache.delete(lock_key)
+
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            time.sleep(self.lock_poll_interval)
+            packed = self.cache.get(data_key)
+            if packed is not None:
+                return self.unpack(packed)
+        logger.debug("AccountCache : gave up waiting for account %s, reading from database", account_uuid)
+        return self.load(account_uuid)
+
+    def fill(self, data_key, account_uuid):
+        account = self.load(account_uuid)
+        if account is not None:
+            self.cache.set(data_key, self.pack(account), self.timeout)
+        return account
+
+    def invalidate(self, account_uuid):
+        account_uuid = _as_uuid(account_uuid)
+        if account_uuid is None:
+            return
+        key = self.generation_key(account_uuid)
+        self.cache.set(key, time.time_ns(), None)
+        # a reader could refill the cache from the uncommitted state between now and the commit.
+        transaction.on_commit(lambda: self.cache.set(key, time.time_ns(), None))
+
+    def invalidate_many(self, account_uuids):
+        keys = [self.generation_key(u) for u in map(_as_uuid, account_uuids) if u is not None]
+        if keys:
+            generation = time.time_ns()
+            self.cache.set_many(dict.fromkeys(keys, generation), None)
+            transaction.on_commit(lambda: self.cache.set_many(dict.fromkeys(keys, time.time_ns()), None))
+
+
+_backend = None
+
+
+def get_account_cache():
+    global _backend
+    if _backend is None:
+        config = dict(getattr(settings, 'ACCOUNTS_CACHE', None) or {})
+        backend_class = import_string(config.pop('BACKEND', 'accounts.account_cache.AccountCache') if config else DEFAULT_ACCOUNT_CACHE_BACKEND)
+        _backend = backend_class(**config)
+    return _backend
+
+
+def get_account(account_uuid):
+    return get_account_cache().get_account(account_uuid)
+
+
+def invalidate(account_uuid):
+    get_account_cache().invalidate(account_uuid)
+
+
+def invalidate_many(account_uuids):
+    get_account_cache().invalidate_many(account_uuids)
+
+
+@receiver(setting_changed)
+def reset_account_cache(sender, setting, **kwargs):
+    global _backend
+    if setting == 'ACCOUNTS_CACHE':
+        _backend = None
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def invalidate_account(sender, instance, **kwargs):
+    invalidate(instance.account_uuid)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_account(sender, instance, created=False, update_fields=None, **kwargs):
+    """
+    The cached accounts embed some of their user fields, so changing a user invalidates its account.
+    A new user has no cached account yet, and saves limited to fields the cache does not hold
+    (last_login on every login) are ignored. Deleting a user deletes its account, which is
+    invalidated by invalidate_account().
+    """
+    if created or not get_account_cache().enabled:
+        return
+    if update_fields is not None and not set(update_fields) & set(USER_CACHED_FIELDS):
+        return
+    account = instance._state.fields_cache.get('account')
+    if account is not None:
+        account_uuid = account.account_uuid
+    else:
+        account_uuid = Account.objects.filter(user_id=instance.pk).values_list('account_uuid', flat=True).first()
+    invalidate(account_uuid)
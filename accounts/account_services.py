@@ -1,21 +1,28 @@
 from django.contrib import auth
 from django.contrib.auth.models import User
+from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login as django_login, logout as django_logout
-from django.contrib.auth.forms import PasswordChangeForm
-from django.db import IntegrityError
+from django.db import IntegrityError, connection, transaction
 from abc import ABCMeta, ABC
-from accounts.forms import  RegistrationForm, AuthenticationForm, AccountForm, UserSignUpForm, AccountCreationForm
-from accounts.models import Account
+from accounts.forms import  RegistrationForm, AuthenticationForm, AccountForm, UserSignUpForm, AccountCreationForm, AccountPasswordChangeForm
+from accounts.models import Account, get_normalized_email
+from accounts.backends import UsernameOrEmailBackend, aget_users_by_username_or_email, get_users_by_username_or_email
+from accounts import account_cache
+from accounts import bloom
+from accounts import customer_ids as customer_ids_allocator
+from accounts import mail_outbox
+from accounts import hashing
+from accounts import throttling
 from accounts import constants
+from accounts.tokens_gen import ExpiredToken, InvalidToken, validation_token_generator
 from django.db.models import F, Q
 from django.apps import apps
+from django.core.cache import caches
 from django.forms import modelform_factory
 from django.utils import timezone
-from django.utils import crypto
-from django.core.mail import send_mail
 from django.conf import settings
-from django.template.loader import render_to_string
+from asgiref.sync import sync_to_async
 from accounts.resources import ui_strings
 import sys
 import logging
@@ -23,6 +30,7 @@ import numbers
 import uuid
 import secrets
 import datetime
+import time
 
 logger = logging.getLogger('accounts')
 
@@ -30,6 +38,17 @@ logger = logging.getLogger('accounts')
 this = sys.modules[__name__]
 
 
+class EmailInUseError(IntegrityError):
+    """
+    The account of a new user was rejected : its email is already in use.
+    """
+    pass
+
+
+# sentinel telling apart "account not loaded yet" from "user has no account" in the request memo.
+_NOT_LOADED = object()
+
+
 
 
 
@@ -81,21 +100,47 @@ class AccountService(ABC):
     
     @staticmethod
     def get_account(account_uuid=None):
-        account = None
-        try:
-            account = Account.objects.select_related('user').get(account_uuid=account_uuid)
-        except Account.DoesNotExists:
+        account = account_cache.get_account(account_uuid)
+        if account is None:
             logger.error("No Account found with uuid %s", account_uuid)
         
         return account
 
+    @staticmethod
+    def get_request_account(request, account_uuid=None):
+        """
+        Return the Account of the user making the request, memoized on the request.
+        The first call issues at most one query, later calls in the same request reuse the memo.
+        When account_uuid is given, the account with that uuid is returned : the memo is used
+        when it matches, otherwise the account is looked up and memoized if it belongs to request.user.
+        Returns None when no matching account exists.
+        """
+        if not request.user.is_authenticated:
+            return None
+        account = getattr(request, constants.REQUEST_ACCOUNT_ATTR, _NOT_LOADED)
+        if account is _NOT_LOADED:
+            if account_uuid is None:
+                account = Account.objects.filter(user=request.user).first()
+                if account is None:
+                    logger.warning(f"No account found for user {request.user.username}")
+                else:
+                    account.user = request.user
+            else:
+                account = account_cache.get_account(account_uuid)
+                if account is None or account.user_id != request.user.pk:
+                    return account
+            setattr(request, constants.REQUEST_ACCOUNT_ATTR, account)
+        if account_uuid is not None and (account is None or account.account_uuid != account_uuid):
+            return account_cache.get_account(account_uuid)
+        return account
+
     @staticmethod
     def process_change_password_request(request):
         result_dict = {}
         result_dict['changed'] = False
         
         postdata = request.POST.copy()
-        form = PasswordChangeForm(request.user, postdata)
+        form = AccountPasswordChangeForm(request.user, postdata)
         if form.is_valid():
             user = form.save()
             result_dict['changed'] = True
@@ -103,76 +148,192 @@ class AccountService(ABC):
         return result_dict
         
 
+    @staticmethod
+    def get_login_users(username, by_email=False):
+        """
+        Return the users whose username, or validated email with by_email, is username, along with
+        their account : a single joined query per lookup. The lookups the existence index rules
+        out are skipped.
+        """
+        by_email = by_email and '@' in username and bloom.may_contain_email(username)
+        by_username = bloom.may_contain_username(username)
+        if not (by_email or by_username):
+            return []
+        return get_users_by_username_or_email(username, by_email=by_email, by_username=by_username)
+
+    @staticmethod
+    def get_login_backend():
+        """
+        Return the path and the instance of the first ModelBackend of AUTHENTICATION_BACKENDS,
+        or (None, None). The login services do the checks of ModelBackend themselves, hashing
+        the passwords in the executor, and record that backend in the session.
+        """
+        for path in settings.AUTHENTICATION_BACKENDS:
+            backend = auth.load_backend(path)
+            if isinstance(backend, ModelBackend):
+                return path, backend
+        return None, None
+
+    @staticmethod
+    def is_email_validated(user):
+        try:
+            return bool(user.account.email_validated)
+        except Account.DoesNotExist:
+            return False
+
     @staticmethod
     def process_login_request(request):
+        """
+        Log the user in.
+        The user and its account are fetched with one query, so a login costs that query plus
+        the last_login update when it succeeds. A password is hashed for the unknown users too, so
+        that the response time does not tell whether a user exists.
+        Without a ModelBackend in AUTHENTICATION_BACKENDS, the user is authenticated by the
+        configured backends with auth.authenticate().
+        """
         result_dict = {}
         result_dict['user_logged'] = False
-        postdata = request.POST.copy()
-        form = AuthenticationForm(data=postdata)
-        username = postdata.get('username', '')
-        password = postdata.get('password')
+        form = AuthenticationForm(data=request.POST)
+        username = request.POST.get('username', '')
         result_dict['username'] = username
         logger.info("[AccountService.process_login_request] : starting")
-        if form.is_valid():
-            logger.info("Login Form is valid")
-            
-            user = auth.authenticate(username=username, password=password)
-            session_key = request.session.session_key
-            if user is not None:
-                logger.info(f"User {username} authenticated")
-                if not user.account.email_validated and not user.is_superuser:
-                    logger.info(f"User {username} email not validated")
-                    result_dict['login_error'] = ui_strings.LOGIN_ACCOUNT_EMAIL_NON_VALIDATED_ERROR
-                    
-                    return result_dict
-                if user.is_active:
-                    logger.info(f"Trying to log User {username} in.")
-                    session_items = request.session.items()
-                    auth.login(request, user)
-                    logger.debug(f"user {username} logged in")
-                    result_dict['user_logged'] = True
-                    result_dict['user'] = user
-                    result_dict['next_url'] = request.GET.get('next', '/')
-                    if hasattr(settings, 'SEND_USER_LOGGED_IN_SIGNAL') and settings.SEND_USER_LOGGED_IN_SIGNAL:
-                        settings.SIGNA_USER_LOGGED_IN.send(sender=User, session_key=session_key, user=user,request=request, session_items=session_items)
-                else:
-                    result_dict['login_error'] = ui_strings.LOGIN_USER_INACTIVE_ERROR
-            else:
-                logger.warning(f"User {username} could not be found.")
-                result_dict['login_error'] = ui_strings.ACCOUNT_INVALID_FORM_DATA
-        else:
+        if not form.is_valid():
             result_dict['login_error'] = ui_strings.ACCOUNT_INVALID_FORM_DATA
             result_dict['form'] = form
+            return result_dict
+
+        logger.info("Login Form is valid")
+        if not throttling.allow_login(request, username):
+            result_dict['login_error'] = ui_strings.LOGIN_THROTTLED_ERROR
+            result_dict['throttled'] = True
+            return result_dict
+        password = form.cleaned_data['password']
+        backend_path, backend = AccountService.get_login_backend()
+        if backend is None:
+            # auth.authenticate() sends user_login_failed itself.
+            user = auth.authenticate(request, username=username, password=password)
+            authenticated = user is not None
+            if authenticated:
+                backend_path = user.backend
+        else:
+            # the validated emails are accepted as well with UsernameOrEmailBackend.
+            users = AccountService.get_login_users(username, by_email=isinstance(backend, UsernameOrEmailBackend))
+            user = None
+            if not users:
+                hashing.make_password(password)
+            for candidate in users:
+                if hashing.check_password(candidate, password):
+                    user = candidate
+                    break
+            authenticated = user is not None
+            if not authenticated:
+                auth.signals.user_login_failed.send(sender=__name__, credentials={'username': username}, request=request)
+        if not authenticated:
+            logger.warning(f"User {username} could not be authenticated.")
+            result_dict['login_error'] = ui_strings.ACCOUNT_INVALID_FORM_DATA
+            return result_dict
+
+        logger.info(f"User {username} authenticated")
+        if not user.is_superuser and not AccountService.is_email_validated(user):
+            logger.info(f"User {username} email not validated")
+            result_dict['login_error'] = ui_strings.LOGIN_ACCOUNT_EMAIL_NON_VALIDATED_ERROR
+            return result_dict
+        if backend is not None and not backend.user_can_authenticate(user):
+            result_dict['login_error'] = ui_strings.LOGIN_USER_INACTIVE_ERROR
+            return result_dict
+
+        logger.info(f"Trying to log User {username} in.")
+        send_logged_in_signal = getattr(settings, 'SEND_USER_LOGGED_IN_SIGNAL', False)
+        if send_logged_in_signal:
+            session_key = request.session.session_key
+            session_items = request.session.items()
+        auth.login(request, user, backend=backend_path)
+        logger.debug(f"user {username} logged in")
+        result_dict['user_logged'] = True
+        result_dict['user'] = user
+        result_dict['next_url'] = request.GET.get('next', '/')
+        if send_logged_in_signal:
+            settings.SIGNA_USER_LOGGED_IN.send(sender=User, session_key=session_key, user=user,request=request, session_items=session_items)
         logger.debug("[AccountService.process_login_request] : finished")
         return result_dict
     
 
+    @staticmethod
+    def register_user(user_form):
+        """
+        Create the inactive user of a valid UserSignUpForm and its account in one transaction.
+        The user and the account are inserted directly, without the account creation signal.
+        Raises IntegrityError when the username is already in use, EmailInUseError when the email is.
+        """
+        # the password is hashed in the executor, not by user_form.save().
+        user = user_form.instance
+        user.password = hashing.make_password(user_form.cleaned_data['password1'])
+        return AccountService.create_user_account(user)
+
+    @staticmethod
+    def create_user_account(user):
+        """
+        Insert the new user, inactive, and its account in one transaction.
+        user must already hold its hashed password.
+        """
+        user.is_active = False
+        setattr(user, constants.SKIP_ACCOUNT_CREATION_ATTR, True)
+        normalized_email = get_normalized_email(user.email)
+        user_inserted = False
+        try:
+            with transaction.atomic():
+                user.save()
+                user_inserted = True
+                account = Account.objects.create(user=user, normalized_email=normalized_email, validation_token_expire=AccountService.get_token_expire_time())
+        except IntegrityError as e:
+            # the account has other unique columns : the email is only at fault when it is in use,
+            # which is checked once the transaction is rolled back.
+            if user_inserted and normalized_email and Account.objects.filter(normalized_email=normalized_email).exists():
+                raise EmailInUseError(str(e)) from e
+            raise
+        return user, account
+
+    @staticmethod
+    def add_registration_conflict_error(user_form, error):
+        """
+        Report the registration rejected by the database with error on the field at fault.
+        """
+        if isinstance(error, EmailInUseError):
+            user_form.add_error('email', "This email is already in use")
+        else:
+            username = user_form.cleaned_data['username']
+            user_form.add_error('username', f"A user with this username : \"{username}\" is already in use")
+
     @staticmethod
     def process_registration_request(request):
         """
         The form used to fill the data provide data for both the UserSignUpForm and the AccountCreationForm.
         From the data it is possible process many form at the same times just like this code is doing.
+        The username and email uniqueness is enforced by the database : a taken one is reported as a form error.
         """
         result_dict = {}
         result_dict['user_created'] = False
         result_dict['next_url'] = "/"
-        postdata = request.POST.copy()
-        user_form = UserSignUpForm(postdata)
+        user_form = UserSignUpForm(request.POST)
         #account_form = AccountCreationForm(postdata)
         user_form_is_valid = user_form.is_valid()
         #account_form_is_valid = account_form.is_valid()
         if user_form_is_valid :
-            session_key = request.session.session_key
-
-            user = user_form.save()
-            session_items = request.session.items()
-            User.objects.filter(id=user.id).update(is_active=False)
+            send_registered_signal = getattr(settings, 'SEND_USER_REGISTERED_SIGNAL', False)
+            if send_registered_signal:
+                session_key = request.session.session_key
+                session_items = request.session.items()
+            try:
+                user, account = AccountService.register_user(user_form)
+            except IntegrityError as e:
+                AccountService.add_registration_conflict_error(user_form, e)
+                user_form_is_valid = False
 
+        if user_form_is_valid :
             result_dict['user_created'] = True
-            user.refresh_from_db()
-
             result_dict['user'] = user
-            if hasattr(settings, 'SEND_USER_REGISTERED_SIGNAL') and settings.SEND_USER_REGISTERED_SIGNAL:
+            result_dict['account_uuid'] = account.account_uuid
+            if send_registered_signal:
                         settings.SIGNA_USER_REGISTERED.send(sender=User, session_key=session_key, user=user,request=request, session_items=session_items)
             logger.info(f"New User {user.username} has been created")
                 
@@ -198,32 +359,85 @@ class AccountService(ABC):
 
     @staticmethod
     def validate_email(account_uuid, token):
-        logger.info("validating email : ...")
+        """
+        Validate the email of the account account_uuid with the token of a validation link.
+        The token signature and age are checked without any query : only a genuine, unexpired
+        token costs the conditional UPDATE accepting it.
+        """
         validated = False
-        account = None
-        msg = None
-        now = timezone.now()
-        if account_uuid and token:
-            account = AccountService.get_account(account_uuid)
-            logger.debug(f"Validating Account {account} - account token : {account.email_validation_token} -  submitted token : {token}")
-            if account and token and account.email_validation_token == token :
-                logger.debug(f"Account {account} token is valid. Now checking the expiration date has expired.")
-                if account.validation_token_expire >= now :
-                    validated = Account.objects.filter(pk=account.pk, email_validation_token=token).update(is_active=True,email_validated=True, email_validation_token=None) == 1
-                    User.objects.filter(id=account.user.id).update(is_active=True)
-                    msg = "Email validated"
-                    logger.debug(f"Account {account} validated.")
-                else:
-                    msg = "Token has expired"
-                    logger.warn(f"Account {account} not validated. {msg}  - now : {now} - expected expirationdate : {account.validation_token_expire}")
-            else:
-                msg = "Invalid data"
-                logger.warn(f"Account {account} not validated. {msg}")
+        try:
+            nonce = validation_token_generator.check_token(account_uuid, token)
+        except ExpiredToken:
+            msg = "Token has expired"
+        except InvalidToken:
+            msg = "Invalid data"
         else:
-            msg = "Invalid data. Account or token missing"
-            logger.warn(f"Account {account} not validated. {msg}")
+            validated, msg = AccountService.apply_email_validation(account_uuid, nonce)
+        if not validated:
+            logger.warning(f"Account {account_uuid} not validated. {msg}")
+        return {'account_uuid': account_uuid, 'validated': validated, 'message': msg}
 
-        return {'account':account, 'validated' : validated, 'message' : msg}
+    @staticmethod
+    def apply_email_validation(account_uuid, nonce):
+        """
+        Validate the account if nonce is still its validation nonce and has not expired.
+        The account and its user are activated in one transaction of two statements : the
+        conditional UPDATE of the account decides, so concurrent requests validate it once.
+        Returns (validated, message). An account validated earlier, by a double click for
+        instance, counts as validated.
+        """
+        with transaction.atomic():
+            updated = Account.objects.filter(
+                account_uuid=account_uuid,
+                email_validation_token=nonce,
+                email_validated=False,
+                validation_token_expire__gte=timezone.now(),
+            ).update(is_active=True, email_validated=True, email_validation_token=None)
+            if updated:
+                User.objects.filter(account__account_uuid=account_uuid).update(is_active=True)
+        if updated:
+            account_cache.invalidate(account_uuid)
+            return True, "Email validated"
+        # the failure path only : tell an already validated account from a dead link.
+        if Account.objects.filter(account_uuid=account_uuid, email_validated=True).exists():
+            return True, "Email already validated"
+        return False, "Token has expired or was already used"
+
+    @staticmethod
+    def get_validation_email_context(account):
+        return {
+            'template_name': settings.DJANGO_VALIDATION_EMAIL_TEMPLATE,
+            'title': 'Validation de votre adresse mail',
+            'recipient_email': account.user.email,
+            'context':{
+                'SITE_NAME': settings.SITE_NAME,
+                'SITE_HOST': settings.SITE_HOST,
+                'FULL_NAME': account.user.get_full_name(),
+                'validation_url' : settings.SITE_HOST + account.get_validation_url()
+            }
+        }
+
+    @staticmethod
+    def send_validation(account):
+        """
+        Issue a new validation token for account and send it the validation link.
+        A link is sent at most once per cooldown window : a request inside the window is
+        skipped while the token already sent is still valid.
+        Returns True when a link was sent, in the window or now, False when the email is already validated.
+        """
+        if account.email_validated:
+            return False
+        cooldown = get_validation_mail_cooldown()
+        if cooldown and not caches['default'].add(validation_mail_cooldown_key(account), 1, cooldown):
+            if has_valid_validation_token(account):
+                logger.info(f"account {account} : validation link sent less than {cooldown}s ago. Not sending it again")
+                return True
+        logger.debug(f" account {account} not validated. sending validation link now")
+        account.email_validation_token = AccountService.generate_email_validation_token()
+        account.validation_token_expire = AccountService.get_token_expire_time()
+        account.save(update_fields=['email_validation_token', 'validation_token_expire'])
+        send_validation_mail(AccountService.get_validation_email_context(account))
+        return True
 
     @staticmethod
     def create_account(accountdata=None, userdata=None):
@@ -244,43 +458,369 @@ class AccountService(ABC):
         return created
 
 
+    # Async variants of the services, for the views of accounts.async_views.
+    # They rely on the async ORM, and hash the passwords in the executor of accounts.hashing.
+
+    @staticmethod
+    async def aget_account(account_uuid=None):
+        if account_cache.get_account_cache().enabled:
+            account = await sync_to_async(account_cache.get_account)(account_uuid)
+        else:
+            account = await Account.objects.select_related('user').filter(account_uuid=account_uuid).afirst()
+        if account is None:
+            logger.error("No Account found with uuid %s", account_uuid)
+        return account
+
+    @staticmethod
+    async def aget_request_account(request, account_uuid=None):
+        """
+        Async variant of get_request_account(). The memo is shared with the sync variant.
+        """
+        user = await request.auser()
+        if not user.is_authenticated:
+            return None
+        account = getattr(request, constants.REQUEST_ACCOUNT_ATTR, _NOT_LOADED)
+        if account is _NOT_LOADED:
+            if account_uuid is None:
+                account = await Account.objects.filter(user=user).afirst()
+                if account is None:
+                    logger.warning(f"No account found for user {user.username}")
+                else:
+                    account.user = user
+            else:
+                account = await AccountService.aget_account(account_uuid)
+                if account is None or account.user_id != user.pk:
+                    return account
+            setattr(request, constants.REQUEST_ACCOUNT_ATTR, account)
+        if account_uuid is not None and (account is None or account.account_uuid != account_uuid):
+            return await AccountService.aget_account(account_uuid)
+        return account
+
+    @staticmethod
+    async def aget_login_users(username, by_email=False):
+        by_email = by_email and '@' in username and await sync_to_async(bloom.may_contain_email)(username)
+        by_username = await sync_to_async(bloom.may_contain_username)(username)
+        if not (by_email or by_username):
+            return []
+        return await aget_users_by_username_or_email(username, by_email=by_email, by_username=by_username)
+
+    @staticmethod
+    async def aprocess_login_request(request):
+        """
+        Async variant of process_login_request().
+        """
+        result_dict = {}
+        result_dict['user_logged'] = False
+        form = AuthenticationForm(data=request.POST)
+        username = request.POST.get('username', '')
+        result_dict['username'] = username
+        if not form.is_valid():
+            result_dict['login_error'] = ui_strings.ACCOUNT_INVALID_FORM_DATA
+            result_dict['form'] = form
+            return result_dict
+
+        if not await sync_to_async(throttling.allow_login)(request, username):
+            result_dict['login_error'] = ui_strings.LOGIN_THROTTLED_ERROR
+            result_dict['throttled'] = True
+            return result_dict
+        password = form.cleaned_data['password']
+        backend_path, backend = AccountService.get_login_backend()
+        if backend is None:
+            user = await auth.aauthenticate(request, username=username, password=password)
+            authenticated = user is not None
+            if authenticated:
+                backend_path = user.backend
+                # the account is read below, outside of a thread.
+                user = await User.objects.select_related('account').aget(pk=user.pk)
+        else:
+            users = await AccountService.aget_login_users(username, by_email=isinstance(backend, UsernameOrEmailBackend))
+            user = None
+            if not users:
+                await hashing.amake_password(password)
+            for candidate in users:
+                if await hashing.acheck_password(candidate, password):
+                    user = candidate
+                    break
+            authenticated = user is not None
+            if not authenticated:
+                await auth.signals.user_login_failed.asend(sender=__name__, credentials={'username': username}, request=request)
+        if not authenticated:
+            logger.warning(f"User {username} could not be authenticated.")
+            result_dict['login_error'] = ui_strings.ACCOUNT_INVALID_FORM_DATA
+            return result_dict
+
+        if not user.is_superuser and not AccountService.is_email_validated(user):
+            logger.info(f"User {username} email not validated")
+            result_dict['login_error'] = ui_strings.LOGIN_ACCOUNT_EMAIL_NON_VALIDATED_ERROR
+            return result_dict
+        if backend is not None and not backend.user_can_authenticate(user):
+            result_dict['login_error'] = ui_strings.LOGIN_USER_INACTIVE_ERROR
+            return result_dict
+
+        send_logged_in_signal = getattr(settings, 'SEND_USER_LOGGED_IN_SIGNAL', False)
+        if send_logged_in_signal:
+            session_key = request.session.session_key
+            session_items = await sync_to_async(request.session.items)()
+        await auth.alogin(request, user, backend=backend_path)
+        logger.debug(f"user {username} logged in")
+        result_dict['user_logged'] = True
+        result_dict['user'] = user
+        result_dict['next_url'] = request.GET.get('next', '/')
+        if send_logged_in_signal:
+            await sync_to_async(settings.SIGNA_USER_LOGGED_IN.send)(sender=User, session_key=session_key, user=user,request=request, session_items=session_items)
+        return result_dict
+
+    @staticmethod
+    async def aprocess_registration_request(request):
+        """
+        Async variant of process_registration_request().
+        The form validation runs in a thread as it queries the database, the password is
+        hashed in the executor and the user and its account are inserted in one transaction.
+        """
+        result_dict = {}
+        result_dict['user_created'] = False
+        result_dict['next_url'] = "/"
+        user_form = UserSignUpForm(request.POST)
+        user_form_is_valid = await sync_to_async(user_form.is_valid)()
+        if user_form_is_valid:
+            send_registered_signal = getattr(settings, 'SEND_USER_REGISTERED_SIGNAL', False)
+            if send_registered_signal:
+                session_key = request.session.session_key
+                session_items = await sync_to_async(request.session.items)()
+            user = user_form.instance
+            user.password = await hashing.amake_password(user_form.cleaned_data['password1'])
+            try:
+                user, account = await sync_to_async(AccountService.create_user_account)(user)
+            except IntegrityError as e:
+                AccountService.add_registration_conflict_error(user_form, e)
+                user_form_is_valid = False
+
+        if user_form_is_valid:
+            result_dict['user_created'] = True
+            result_dict['user'] = user
+            result_dict['account_uuid'] = account.account_uuid
+            if send_registered_signal:
+                await sync_to_async(settings.SIGNA_USER_REGISTERED.send)(sender=User, session_key=session_key, user=user,request=request, session_items=session_items)
+            logger.info(f"New User {user.username} has been created")
+        else:
+            logger.error( f"User form data invalid: {user_form.errors}")
+            result_dict['form'] = user_form
+        return result_dict
+
+    @staticmethod
+    async def avalidate_email(account_uuid, token):
+        """
+        Async variant of validate_email().
+        """
+        validated = False
+        try:
+            nonce = validation_token_generator.check_token(account_uuid, token)
+        except ExpiredToken:
+            msg = "Token has expired"
+        except InvalidToken:
+            msg = "Invalid data"
+        else:
+            # the async ORM has no transactions : the two UPDATEs run in a thread.
+            validated, msg = await sync_to_async(AccountService.apply_email_validation)(account_uuid, nonce)
+        if not validated:
+            logger.warning(f"Account {account_uuid} not validated. {msg}")
+        return {'account_uuid': account_uuid, 'validated': validated, 'message': msg}
+
+    @staticmethod
+    async def asend_validation(account):
+        """
+        Async variant of send_validation().
+        """
+        if account.email_validated:
+            return False
+        cooldown = get_validation_mail_cooldown()
+        if cooldown and not await caches['default'].aadd(validation_mail_cooldown_key(account), 1, cooldown):
+            if has_valid_validation_token(account):
+                logger.info(f"account {account} : validation link sent less than {cooldown}s ago. Not sending it again")
+                return True
+        account.email_validation_token = AccountService.generate_email_validation_token()
+        account.validation_token_expire = AccountService.get_token_expire_time()
+        await account.asave(update_fields=['email_validation_token', 'validation_token_expire'])
+        email_context = AccountService.get_validation_email_context(account)
+        await mail_outbox.aenqueue(email_context['template_name'], email_context['title'], email_context['recipient_email'], context=email_context['context'])
+        return True
+
+
+def get_validation_mail_cooldown():
+    return getattr(settings, 'ACCOUNTS_VALIDATION_MAIL_COOLDOWN', constants.VALIDATION_MAIL_COOLDOWN)
+
+
+def validation_mail_cooldown_key(account):
+    return f"accounts:validation-mail:{account.account_uuid.hex}"
+
+
+def has_valid_validation_token(account):
+    return bool(account.email_validation_token) and account.validation_token_expire is not None and account.validation_token_expire > timezone.now()
+
 def get_validation_url(account):
     if isinstance(account, Account):
         return account.get_validation_url()
     return None
 
-def generate_customer_id():
-    return crypto.get_random_string(length=9, allowed_chars=constants.RANDOM_CUSTOMER_ID_CHARACTERS)
 
-def generate_customer_ids():
-    queryset = Account.objects.all()
-    for acc in queryset:
-        acc.customer_id = generate_customer_id()
-        acc.save()
+def generate_customer_ids(batch_size=1000, start_after=None, only_missing=False, dry_run=False, progress=None):
+    """
+    Assign a new customer_id to the accounts.
+    The accounts are streamed in primary key order and written back in batches of batch_size,
+    each batch with a single bulk_update in its own transaction. No signal is sent.
+
+    :arg start_after: resume after the account with this primary key
+    :arg only_missing: only process the accounts without customer_id
+    :arg dry_run: generate the ids without writing them
+    :arg progress: callable called with (last_pk, processed) after each batch
+    :returns the number of processed accounts
+    :rtype: int
+    """
+    queryset = Account.objects.order_by('pk').only('pk', 'account_uuid', 'customer_id')
+    if start_after is not None:
+        queryset = queryset.filter(pk__gt=start_after)
+    if only_missing:
+        queryset = queryset.filter(customer_id__isnull=True)
+    processed = 0
+    batch = []
+    for account in queryset.iterator(chunk_size=batch_size):
+        batch.append(account)
+        if len(batch) == batch_size:
+            processed += _assign_customer_ids(batch, dry_run)
+            if progress:
+                progress(batch[-1].pk, processed)
+            batch = []
+    if batch:
+        processed += _assign_customer_ids(batch, dry_run)
+        if progress:
+            progress(batch[-1].pk, processed)
+    return processed
+
+
+def _assign_customer_ids(accounts, dry_run=False):
+    if dry_run:
+        customer_ids = customer_ids_allocator.get_allocator().preview_many(len(accounts))
+    else:
+        # allocated ids never collide with each other, but they can collide with the random
+        # ids given before the allocator existed, until this command has processed the whole table.
+        customer_ids = customer_ids_allocator.allocate_customer_ids(len(accounts), check_taken=True)
+    for account, customer_id in zip(accounts, customer_ids):
+        account.customer_id = customer_id
+    if not dry_run:
+        with transaction.atomic():
+            Account.objects.bulk_update(accounts, ['customer_id'])
+        account_cache.invalidate_many(account.account_uuid for account in accounts)
+    return len(accounts)
+
+
+TOKEN_PURGE_MODES = ('clear', 'reissue', 'delete')
+
+
+def purge_validation_tokens(mode='clear', grace_period=None, batch_size=500, time_budget=None, pause=0, notify=False, dry_run=False, progress=None):
+    """
+    Process the unvalidated accounts whose validation token has expired, in batches of batch_size.
+    The accounts are found through the accounts_token_expire_idx partial index, and every batch is
+    processed in its own short transaction, skipping the rows locked by a concurrent validation
+    where the database supports it.
+
+    :arg mode: 'clear' removes the tokens and keeps their expiry, 'reissue' gives the accounts a
+               new token and expiry, 'delete' deletes the inactive users, with their account, whose
+               token expired more than grace_period ago
+    :arg grace_period: timedelta, only used by the 'delete' mode
+    :arg time_budget: seconds after which no new batch is started
+    :arg pause: seconds to sleep between two batches
+    :arg notify: with 'reissue', send the new validation link through the mail outbox
+    :arg dry_run: only count the accounts that would be processed
+    :arg progress: callable called with the summary after each batch
+    :returns a summary dict : processed, batches, elapsed, and finished, False when the time budget ran out
+    :rtype: dict
+    """
+    if mode not in TOKEN_PURGE_MODES:
+        raise ValueError(f"unknown mode {mode}, expected one of {TOKEN_PURGE_MODES}")
+    started_at = time.monotonic()
+    cutoff = timezone.now()
+    if mode == 'delete':
+        cutoff -= grace_period or datetime.timedelta(0)
+    queryset = Account.objects.filter(validation_token_expire__lt=cutoff, email_validated=False)
+    if mode == 'clear':
+        # the cleared accounts keep their expiry : it is what the 'delete' mode looks at.
+        queryset = queryset.filter(email_validation_token__isnull=False)
+    elif mode == 'delete':
+        queryset = queryset.filter(user__is_active=False)
+    summary = {'mode': mode, 'processed': 0, 'batches': 0, 'elapsed': 0.0, 'finished': True}
+    if dry_run:
+        summary['processed'] = queryset.count()
+        summary['elapsed'] = time.monotonic() - started_at
+        return summary
+
+    queryset = queryset.order_by('validation_token_expire')
+    while True:
+        if time_budget is not None and time.monotonic() - started_at >= time_budget:
+            summary['finished'] = False
+            break
+        with transaction.atomic():
+            batch = queryset
+            if connection.features.has_select_for_update_skip_locked:
+                batch = batch.select_for_update(skip_locked=True, of=('self',))
+            if notify and mode == 'reissue':
+                # the mails need the names and email of the users.
+                batch = batch.select_related('user').only('pk', 'account_uuid', 'user__email', 'user__first_name', 'user__last_name')
+            else:
+                batch = batch.only('pk', 'account_uuid', 'user_id')
+            accounts = list(batch[:batch_size])
+            if not accounts:
+                break
+            _purge_batch(mode, accounts, notify)
+        account_cache.invalidate_many(account.account_uuid for account in accounts)
+        summary['processed'] += len(accounts)
+        summary['batches'] += 1
+        summary['elapsed'] = time.monotonic() - started_at
+        if progress:
+            progress(summary)
+        if len(accounts) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    summary['elapsed'] = time.monotonic() - started_at
+    return summary
+
+
+def _purge_batch(mode, accounts, notify=False):
+    pks = [account.pk for account in accounts]
+    if mode == 'clear':
+        Account.objects.filter(pk__in=pks).update(email_validation_token=None)
+    elif mode == 'reissue':
+        expire = AccountService.get_token_expire_time()
+        for account in accounts:
+            account.email_validation_token = AccountService.generate_email_validation_token()
+            account.validation_token_expire = expire
+        Account.objects.bulk_update(accounts, ['email_validation_token', 'validation_token_expire'])
+        if notify:
+            for account in accounts:
+                send_validation_mail(AccountService.get_validation_email_context(account))
+    else:
+        # the accounts go with their users.
+        User.objects.filter(pk__in=[account.user_id for account in accounts], is_active=False).delete()
 
     
 
 
 def send_validation_mail(email_context):
+    """
+    Add the validation mail to the outbox. The mail is rendered and sent by the drain_mail_outbox command.
+    """
     if email_context is not None and isinstance(email_context, dict):
-        logger.debug("email_context available. Running send_mail now")
+        logger.debug("email_context available. Adding the mail to the outbox")
         try:
             template_name = email_context['template_name']
         except KeyError as e:
             logger.error(f"send_validation : template_name not available. Mail not send. email_context : {email_context}")
             return
-        html_message = render_to_string(template_name, email_context['context'])
-        send_mail(
+        mail_outbox.enqueue(
+            template_name,
             email_context['title'],
-            None,
-            settings.DEFAULT_FROM_EMAIL,
-            [email_context['recipient_email']],
-            html_message=html_message
+            email_context['recipient_email'],
+            context=email_context['context'],
         )
     else:
         logger.warn(f"send_validation: email_context missing or is not a dict. email_context : {email_context}")
-
-    
-
-
-    
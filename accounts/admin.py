@@ -1,7 +1,14 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from accounts.models import Account
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.core.exceptions import PermissionDenied
+from django.db.models import Q
+from django.urls import path
+from django.utils import timezone
+from accounts.models import Account, OutgoingMail
+from accounts import exports
+from accounts.paginators import EstimatedCountPaginator
 
 # Register your models here.
 
@@ -10,11 +17,25 @@ class AccountInline(admin.StackedInline):
     can_delete = False
     fk_name = 'user'
     verbose_name_plural = 'Profile'
+    # a select would list every user.
+    raw_id_fields = ['created_by']
     
 
 class AccountAdmin(admin.ModelAdmin):
     inlines = [AccountInline]
-    #list_display = [ 'telefon', 'created_by']
+    list_display = ['username', 'email', 'first_name', 'last_name', 'is_active', 'is_staff', 'date_joined']
+    list_filter = ['is_active', 'is_staff']
+    search_fields = ['username']
+    search_help_text = "Username prefix"
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if search_term:
+            queryset = queryset.filter(username__startswith=search_term)
+        return queryset, False
+
     def get_inline_instances(self, request, obj=None):
         if not obj:
             return list()
@@ -24,4 +45,76 @@ class AccountAdmin(admin.ModelAdmin):
 
 admin.site.unregister(User)
 admin.site.register(User ,AccountAdmin)
-admin.site.register(Account)
+
+
+class AccountProfileAdmin(admin.ModelAdmin):
+    change_list_template = 'admin/accounts/account/change_list.html'
+    list_display = ['customer_id', 'username', 'email', 'account_type', 'email_validated', 'is_active', 'newsletter', 'created_at']
+    list_display_links = ['customer_id', 'username']
+    # Account.__str__ reads the user : without the join, every row would query it.
+    list_select_related = ['user']
+    list_filter = ['account_type', 'email_validated', 'is_active']
+    search_fields = ['user__username']
+    search_help_text = "Username prefix, or customer id"
+    raw_id_fields = ['user', 'created_by']
+    readonly_fields = ['account_uuid', 'customer_id', 'created_at', 'modified_at']
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    @admin.display(ordering='user__username')
+    def username(self, account):
+        return account.user.username
+
+    @admin.display(ordering='user__email')
+    def email(self, account):
+        return account.user.email
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Only search with indexed lookups : a username prefix (auth_user.username is unique, with a
+        pattern index on PostgreSQL), or the exact customer_id for a numeric term.
+        """
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        condition = Q(user__username__startswith=search_term)
+        if search_term.isdigit():
+            condition |= Q(customer_id=int(search_term))
+        return queryset.filter(condition), False
+
+    def get_urls(self):
+        urls = [
+            path('export/', self.admin_site.admin_view(self.export_view), name='accounts_account_export'),
+        ]
+        return urls + super().get_urls()
+
+    def export_view(self, request):
+        """
+        Stream the accounts as CSV or JSONL. The query string takes the format and
+        the account_type, email_validated and newsletter filters.
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        format = request.GET.get('format', 'csv')
+        try:
+            filters = exports.parse_filters(request.GET)
+            chunks = exports.export_accounts(format, **filters)
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+        content_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(chunks, content_type=f'{content_type}; charset=utf-8')
+        filename = f"accounts-{timezone.now():%Y%m%d-%H%M%S}.{format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+admin.site.register(Account, AccountProfileAdmin)
+
+
+class OutgoingMailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'recipient', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status']
+    readonly_fields = ['created_at', 'sent_at', 'last_error']
+
+
+admin.site.register(OutgoingMail, OutgoingMailAdmin)
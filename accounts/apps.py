@@ -2,5 +2,10 @@ from django.apps import AppConfig
 
 
 class AccountsConfig(AppConfig):
+    default_auto_field = 'django.db.models.AutoField'
     name = 'accounts'
     verbose_name = "Accounts"
+
+    def ready(self):
+        # connect the signal handlers keeping the account cache and the existence index consistent.
+        from accounts import account_cache, bloom
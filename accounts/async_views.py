@@ -0,0 +1,169 @@
+"""
+Native async variants of the accounts views.
+
+They are served by accounts.async_urls and need Django >= 5.1 and an ASGI server.
+The database is queried with the async ORM and passwords are hashed in the executor of
+accounts.hashing, so a worker keeps serving other requests while a password is checked.
+Templates are rendered in a thread, as the context processors may query the database.
+"""
+from asgiref.sync import sync_to_async
+from django.shortcuts import redirect
+from django.http import Http404
+from django.contrib import messages
+from django.utils.translation import gettext as _
+from django.contrib.auth.decorators import login_required
+from accounts.forms import UserSignUpForm
+from accounts.decorators import shed_hashing_overload
+from accounts.instrumentation import render
+from accounts.account_services import AccountService
+from accounts.resources import ui_strings
+import logging
+
+logger = logging.getLogger('accounts')
+
+arender = sync_to_async(render)
+
+
+@shed_hashing_overload
+async def login(request):
+    """
+    Log in view
+    """
+    page_title = _("Login")
+    template_name = 'accounts/registration/login.html'
+    context = {}
+    status = 200
+    if request.method == 'POST':
+        next_url = request.POST.get('next', '/')
+        result = await AccountService.aprocess_login_request(request)
+        if result['user_logged']:
+            user = result['user']
+            logger.info(f"User {user.username} logged in")
+            return redirect(next_url)
+        else:
+            username = result['username']
+            error_msg = result['login_error']
+            logger.warning(f"User {username} could not be logged in. Error : {error_msg}")
+            messages.error(request, error_msg)
+            context['has_login_error'] = True
+            context['login_error'] = error_msg
+            form = result.get('form')
+            if result.get('throttled'):
+                status = 429
+    else:
+        form = AccountService.get_authentication_form()
+
+    register_form = AccountService.get_registration_form()
+    next_url = request.GET.get('next', '/')
+    context.update({
+        'page_title':page_title,
+        'template_name':template_name,
+        'next_url': next_url,
+        'form': form,
+        'registration_form': register_form,
+    })
+    return await arender(request, template_name, context, status=status)
+
+
+@shed_hashing_overload
+async def register(request):
+    """
+    User registration view
+    """
+    template_name = "accounts/registration/register.html"
+    page_title = _('Registration')
+    logger.info("New registration request")
+    if request.method == 'POST':
+        result = await AccountService.aprocess_registration_request(request)
+        if result['user_created']:
+            messages.add_message(request, messages.SUCCESS, ui_strings.ACCOUNT_REGISTRATION_SUCCESS_MESSAGE)
+            return redirect("accounts:registration-complete", account_uuid=result['account_uuid'])
+        else:
+            messages.add_message(request, messages.ERROR, ui_strings.ACCOUNT_REGISTRATION_ERROR_MESSAGE)
+            user_form = result['form']
+    else:
+        user_form = UserSignUpForm()
+    context = {
+        'page_title': page_title,
+        'template_name': template_name,
+        'form': user_form,
+        'user_form': user_form,
+    }
+    return await arender(request, template_name, context)
+
+
+async def send_validation(request, account_uuid):
+    account = await AccountService.aget_account(account_uuid)
+    if account is None:
+        raise Http404("No Account found")
+    email_sent = await AccountService.asend_validation(account)
+
+    if email_sent:
+        messages.add_message(request, messages.INFO, "Validation has been sent")
+        logger.debug(f" account {account} not validated. Validation link sent")
+    else:
+        messages.add_message(request, messages.WARNING, "Validation could not be sent")
+        logger.warning(f" account {account} not validated. Validation link not sent")
+
+    return redirect('home')
+
+
+async def email_validation(request, account_uuid=None, token=None):
+    logger.info("Account email validation...")
+    template_name = "registration/email_validation.html"
+    page_title = "Email Validation"
+    result = await AccountService.avalidate_email(account_uuid=account_uuid, token=token)
+    context = {
+        'account_uuid': account_uuid,
+        'validated' : result['validated'],
+        'msg'       : result['message'],
+        'page_title': page_title
+    }
+    return await arender(request, template_name, context)
+
+
+async def registration_complete(request, account_uuid=None):
+    new_user = None
+    if account_uuid is not None:
+        account = await AccountService.aget_account(account_uuid)
+        if account is not None:
+            new_user = account.user
+    template_name = "registration/registration_complete.html"
+    page_title = _('Registration Confirmation')
+    context = {
+        'page_title': page_title,
+        'template_name': template_name,
+        'new_user': new_user
+    }
+    return await arender(request, template_name, context)
+
+
+@login_required
+async def user_account(request):
+    template_name = "accounts/account.html"
+    page_title = _('My Account')
+    user = await request.auser()
+    current_account = await AccountService.aget_request_account(request)
+    if current_account is None:
+        raise Http404("No Account found")
+    context = {
+        'name'          : user.get_full_name(),
+        'page_title'    : page_title,
+        'account'       : current_account
+    }
+    return await arender(request, template_name, context)
+
+
+@login_required
+async def account_details(request, account_uuid=None):
+    page_title = _("Account Details")
+    instance = await AccountService.aget_request_account(request, account_uuid)
+    if instance is None:
+        raise Http404("No Account found")
+    template_name = "accounts/account_detail.html"
+    context = {
+        'page_title':page_title,
+        'template_name':template_name,
+        'account': instance
+    }
+    return await arender(request, template_name, context)
@@ -0,0 +1,86 @@
+"""
+Authentication by username or email.
+
+Django usernames may contain an @ : an identifier containing one is looked up both as a
+username and as the email of a validated account, on the unique index of
+Account.normalized_email. The password is checked against every user found, the username
+first, so that nobody can take over the login of a user by registering its username as email.
+Every lookup is a single indexed query returning the user along with its account.
+
+    AUTHENTICATION_BACKENDS = [
+        'accounts.backends.UsernameOrEmailBackend',
+    ]
+"""
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from accounts.models import Account, get_normalized_email
+
+
+def _user_of(account):
+    user = account.user
+    # the reverse side of the one-to-one, so that user.account costs no query.
+    User.account.related.set_cached_value(user, account)
+    return user
+
+
+def _email_lookup(identifier):
+    return Account.objects.select_related('user').filter(normalized_email=get_normalized_email(identifier), email_validated=True)
+
+
+def get_users_by_username_or_email(identifier, by_email=True, by_username=True):
+    """
+    Return the users whose username or validated email is identifier, with their account :
+    the user of the username first, then the one of the email.
+    by_email and by_username allow the caller to skip a lookup it knows would find nothing.
+    """
+    users = []
+    if not identifier:
+        return users
+    if by_username:
+        user = User.objects.select_related('account').filter(username=identifier).first()
+        if user is not None:
+            users.append(user)
+    if by_email and '@' in identifier:
+        account = _email_lookup(identifier).first()
+        if account is not None and account.user_id not in [user.pk for user in users]:
+            users.append(_user_of(account))
+    return users
+
+
+async def aget_users_by_username_or_email(identifier, by_email=True, by_username=True):
+    """
+    Async variant of get_users_by_username_or_email().
+    """
+    users = []
+    if not identifier:
+        return users
+    if by_username:
+        user = await User.objects.select_related('account').filter(username=identifier).afirst()
+        if user is not None:
+            users.append(user)
+    if by_email and '@' in identifier:
+        account = await _email_lookup(identifier).afirst()
+        if account is not None and account.user_id not in [user.pk for user in users]:
+            users.append(_user_of(account))
+    return users
+
+
+class UsernameOrEmailBackend(ModelBackend):
+    """
+    ModelBackend accepting the username or the validated email of the user.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        users = get_users_by_username_or_email(username)
+        if not users:
+            # hash the password anyway, so that the response time does not tell whether the user exists.
+            User().set_password(password)
+            return None
+        for user in users:
+            if user.check_password(password) and self.user_can_authenticate(user):
+                return user
+        return None
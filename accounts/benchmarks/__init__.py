@@ -0,0 +1,10 @@
+"""
+Benchmarks of the accounts hot paths on SQLite databases of realistic sizes.
+
+    python -m accounts.benchmarks --sizes 10000,100000,1000000
+    python -m accounts.benchmarks --sizes 10000 --save-baseline
+
+Every size gets its own database in --data-dir, seeded on the first run and reused afterwards.
+The latency percentiles and the queries per call of every operation are compared with the
+baseline file : the command exits with status 1 when one of them regressed.
+"""
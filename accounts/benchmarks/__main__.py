@@ -0,0 +1,62 @@
+import argparse
+import os
+import sys
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m accounts.benchmarks', description="Benchmark the accounts hot paths.")
+    parser.add_argument('--sizes', default='10000,100000,1000000', help="Comma separated numbers of seeded accounts.")
+    parser.add_argument('--operations', help="Comma separated operations to measure. Defaults to all of them.")
+    parser.add_argument('--iterations', type=int, default=200, help="Measured calls per operation.")
+    parser.add_argument('--warmup', type=int, default=10, help="Calls per operation run before measuring.")
+    parser.add_argument('--data-dir', default=os.environ.get('ACCOUNTS_BENCHMARK_DATA_DIR', '.benchmarks'), help="Directory of the seeded databases.")
+    parser.add_argument('--baseline', help="Baseline file. Defaults to accounts/benchmarks/baseline.json.")
+    parser.add_argument('--save-baseline', action='store_true', help="Store the results as the new baseline instead of comparing them.")
+    parser.add_argument('--check-latency', action='store_true', help="Also fail on latency regressions. Only meaningful against a baseline recorded on the same host.")
+    parser.add_argument('--tolerance', type=float, help="With --check-latency, accepted latency increase, 0.25 for 25%%.")
+    args = parser.parse_args(argv)
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'accounts.benchmarks.settings'
+    import django
+    django.setup()
+    from accounts.benchmarks import runner
+    from accounts.benchmarks.operations import OPERATIONS
+
+    try:
+        sizes = [int(size) for size in args.sizes.split(',')]
+    except ValueError:
+        parser.error("--sizes must be a comma separated list of numbers")
+    names = args.operations.split(',') if args.operations else list(OPERATIONS)
+    unknown = set(names) - set(OPERATIONS)
+    if unknown:
+        parser.error(f"unknown operations {', '.join(sorted(unknown))}, expected some of {', '.join(OPERATIONS)}")
+    baseline_path = args.baseline or runner.DEFAULT_BASELINE
+    tolerance = runner.LATENCY_TOLERANCE if args.tolerance is None else args.tolerance
+
+    results = {}
+    for size in sizes:
+        print(f"{size} accounts : preparing {runner.database_path(args.data_dir, size)}")
+        runner.prepare_database(args.data_dir, size, progress=lambda count: print(f"  {count} accounts seeded", end='\r'))
+        print()
+        print(f"{'operation':<30} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'queries':>8}")
+
+        def progress(name, measure):
+            print(f"{name:<30} {measure['p50']:>8.3f} {measure['p90']:>8.3f} {measure['p99']:>8.3f} {measure['max']:>8.3f} {measure['queries']:>8.2f}")
+
+        results[str(size)] = runner.run(size, names, iterations=args.iterations, warmup=args.warmup, progress=progress)
+
+    if args.save_baseline:
+        runner.save_baseline(baseline_path, results)
+        print(f"baseline saved to {baseline_path}")
+        return 0
+    regressions = runner.compare(results, runner.load_baseline(baseline_path), tolerance=tolerance, latency=args.check_latency)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        return 1
+    print("no regression")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+The measured operations.
+
+prepare() builds the inputs of every iteration outside of the measure, run(i) is the measured
+call. The runner rolls back what the operations write, so every run sees the same database.
+"""
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.test import RequestFactory
+from accounts.models import Account
+from accounts.account_services import AccountService
+from accounts.benchmarks import seed
+from accounts.context_processors import account_context
+from accounts.tokens_gen import validation_token_generator
+from accounts import views
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class Operation:
+    name = None
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+        self.factory = RequestFactory()
+
+    def prepare(self, iterations):
+        pass
+
+    def run(self, i):
+        raise NotImplementedError
+
+    def sample(self, iterations, validated=True):
+        """
+        Return iterations distinct indexes of seeded users, validated or not.
+        """
+        if iterations > self.size // seed.UNVALIDATED_EVERY:
+            raise BenchmarkError(f"{iterations} iterations need more than {self.size} accounts")
+        indexes = []
+        seen = set()
+        while len(indexes) < iterations:
+            i = self.rng.randrange(self.size)
+            if seed.is_validated(i) == validated and i not in seen:
+                seen.add(i)
+                indexes.append(i)
+        return indexes
+
+    def with_session(self, request):
+        SessionMiddleware(lambda request: None).process_request(request)
+        return request
+
+    def get_users(self, indexes):
+        users = User.objects.in_bulk([seed.username(i) for i in indexes], field_name='username')
+        return [users[seed.username(i)] for i in indexes]
+
+    def get_accounts(self, indexes):
+        accounts = {account.user.username: account for account in Account.objects.select_related('user').filter(user__username__in=[seed.username(i) for i in indexes])}
+        return [accounts[seed.username(i)] for i in indexes]
+
+
+class Login(Operation):
+    name = 'process_login_request'
+
+    def prepare(self, iterations):
+        self.requests = [
+            self.with_session(self.factory.post('/accounts/login/', {'username': seed.username(i), 'password': seed.PASSWORD}))
+            for i in self.sample(iterations)
+        ]
+        for request in self.requests:
+            request.user = AnonymousUser()
+
+    def run(self, i):
+        if not AccountService.process_login_request(self.requests[i])['user_logged']:
+            raise BenchmarkError("login failed")
+
+
+class Registration(Operation):
+    name = 'process_registration_request'
+
+    def prepare(self, iterations):
+        prefix = f'new{self.rng.randrange(10 ** 9)}'
+        self.requests = [
+            self.with_session(self.factory.post('/accounts/register/', {
+                'username': f'{prefix}-{i}',
+                'email': f'{prefix}-{i}@benchmarks.example',
+                'first_name': 'New',
+                'last_name': 'User',
+                'password1': seed.PASSWORD,
+                'password2': seed.PASSWORD,
+            }))
+            for i in range(iterations)
+        ]
+
+    def run(self, i):
+        if not AccountService.process_registration_request(self.requests[i])['user_created']:
+            raise BenchmarkError("registration failed")
+
+
+class ValidateEmail(Operation):
+    name = 'validate_email'
+
+    def prepare(self, iterations):
+        self.links = [
+            (account.account_uuid, validation_token_generator.make_token(account))
+            for account in self.get_accounts(self.sample(iterations, validated=False))
+        ]
+
+    def run(self, i):
+        if not AccountService.validate_email(*self.links[i])['validated']:
+            raise BenchmarkError("validation failed")
+
+
+class SendValidation(Operation):
+    name = 'send_validation'
+
+    def prepare(self, iterations):
+        self.accounts = self.get_accounts(self.sample(iterations, validated=False))
+
+    def run(self, i):
+        if not AccountService.send_validation(self.accounts[i]):
+            raise BenchmarkError("validation link not sent")
+
+
+class AccountContext(Operation):
+    name = 'account_context'
+
+    def prepare(self, iterations):
+        self.requests = []
+        for user in self.get_users(self.sample(iterations)):
+            request = self.factory.get('/')
+            request.user = user
+            self.requests.append(request)
+
+    def run(self, i):
+        # the account is lazy : reading it is what a template does.
+        account = account_context(self.requests[i])['account']
+        if account is None or account.pk is None:
+            raise BenchmarkError("account not found")
+
+
+class AccountDetails(Operation):
+    name = 'account_details'
+
+    def prepare(self, iterations):
+        self.requests = []
+        for user in self.get_users(self.sample(iterations)):
+            request = self.with_session(self.factory.get('/accounts/details/'))
+            request.user = user
+            self.requests.append(request)
+
+    def run(self, i):
+        response = views.account_details(self.requests[i])
+        if response.status_code != 200:
+            raise BenchmarkError(f"account_details answered {response.status_code}")
+
+
+OPERATIONS = {operation.name: operation for operation in (Login, Registration, ValidateEmail, SendValidation, AccountContext, AccountDetails)}
@@ -0,0 +1,148 @@
+"""
+Measure the operations and compare the measures with a baseline.
+
+A measure is a dict of the latency percentiles, in milliseconds, and of the queries per call :
+
+    {'iterations': 200, 'p50': 0.61, 'p90': 0.74, 'p99': 1.2, 'max': 2.3, 'queries': 2.0, 'max_queries': 2}
+
+Results and baselines map the table size, as a string, to the measures of every operation.
+"""
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection, connections, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+from accounts.benchmarks import seed
+from accounts.benchmarks.operations import OPERATIONS
+import json
+import math
+import os
+import random
+import time
+
+# a latency regresses when a percentile exceeds the baseline by more than LATENCY_TOLERANCE,
+# and by more than MIN_LATENCY_DELTA milliseconds : sub-millisecond timings are noisy.
+# Latencies are only compared on request : they depend on the host the baseline was recorded on.
+LATENCY_TOLERANCE = 0.25
+MIN_LATENCY_DELTA = 0.5
+COMPARED_PERCENTILES = ('p50', 'p90', 'p99')
+DEFAULT_SIZES = (10000, 100000, 1000000)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of values, a sorted list.
+    """
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def summarize(timings, query_counts):
+    timings = sorted(timings)
+    return {
+        'iterations': len(timings),
+        'p50': round(percentile(timings, 50), 3),
+        'p90': round(percentile(timings, 90), 3),
+        'p99': round(percentile(timings, 99), 3),
+        'max': round(timings[-1], 3) if timings else 0.0,
+        'queries': round(sum(query_counts) / len(query_counts), 2) if query_counts else 0.0,
+        'max_queries': max(query_counts) if query_counts else 0,
+    }
+
+
+def use_database(path):
+    """
+    Point the default connection to the SQLite database at path, and migrate it.
+    """
+    connections['default'].close()
+    connections['default'].settings_dict['NAME'] = path
+    call_command('migrate', verbosity=0, interactive=False)
+
+
+def measure(operation, iterations, warmup=10):
+    operation.prepare(iterations + warmup)
+    for i in range(warmup):
+        operation.run(iterations + i)
+    timings = []
+    query_counts = []
+    for i in range(iterations):
+        # the query log is bounded : past its size, CaptureQueriesContext counts nothing.
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            started_at = time.perf_counter()
+            operation.run(i)
+            elapsed = time.perf_counter() - started_at
+        timings.append(elapsed * 1000)
+        query_counts.append(len(queries))
+    return summarize(timings, query_counts)
+
+
+def run(size, names=None, iterations=200, warmup=10, seed_value=0, progress=None):
+    """
+    Measure the operations names, all by default, on the database seeded with size accounts,
+    with the settings the application ships with. Everything the operations write is rolled back.
+    """
+    names = names or list(OPERATIONS)
+    results = {}
+    rng = random.Random(seed_value)
+    for name in names:
+        operation = OPERATIONS[name](size, rng)
+        # like the database, the cache is the same for every operation : no account is cached yet,
+        # and no validation mail cooldown is running.
+        caches['default'].clear()
+        with transaction.atomic():
+            results[name] = measure(operation, iterations, warmup=warmup)
+            transaction.set_rollback(True)
+        if progress is not None:
+            progress(name, results[name])
+    return results
+
+
+def compare(results, baseline, tolerance=LATENCY_TOLERANCE, min_delta=MIN_LATENCY_DELTA, latency=False):
+    """
+    Return the list of the regressions of results against baseline, as messages.
+    The query counts are compared, and the latency percentiles too with latency.
+    Operations missing from the baseline are not compared.
+    """
+    regressions = []
+    for size, measures in results.items():
+        for name, current in measures.items():
+            reference = baseline.get(size, {}).get(name)
+            if reference is None:
+                continue
+            if current['max_queries'] > reference['max_queries']:
+                regressions.append(f"{size} {name} : {current['max_queries']} queries, baseline {reference['max_queries']}")
+            if not latency:
+                continue
+            for key in COMPARED_PERCENTILES:
+                limit = reference[key] * (1 + tolerance)
+                if current[key] > limit and current[key] - reference[key] > min_delta:
+                    regressions.append(f"{size} {name} : {key} {current[key]:.3f}ms, baseline {reference[key]:.3f}ms")
+    return regressions
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results):
+    baseline = load_baseline(path)
+    baseline.update(results)
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def database_path(data_dir, size):
+    return os.path.join(data_dir, f'accounts-{size}.sqlite3')
+
+
+def prepare_database(data_dir, size, progress=None):
+    os.makedirs(data_dir, exist_ok=True)
+    use_database(database_path(data_dir, size))
+    if seed.seeded_count() < size:
+        seed.seed(size, progress=progress)
@@ -0,0 +1,80 @@
+"""
+Seeding of the benchmark databases.
+
+User bench<i> has the password PASSWORD. One account out of UNVALIDATED_EVERY is waiting for
+its email validation, with a valid token, the others are validated and active.
+"""
+from django.contrib.auth import hashers
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from accounts.models import Account
+from accounts.account_services import AccountService
+from accounts import customer_ids
+import datetime
+
+PASSWORD = 'benchmark-password'
+UNVALIDATED_EVERY = 10
+BATCH_SIZE = 5000
+
+
+def username(i):
+    return f'bench{i}'
+
+
+def email(i):
+    return f'bench{i}@benchmarks.example'
+
+
+def is_validated(i):
+    return i % UNVALIDATED_EVERY != 0
+
+
+def seeded_count():
+    return User.objects.filter(username__startswith='bench').count()
+
+
+def seed(size, progress=None):
+    """
+    Create the users bench0 to bench<size - 1> that do not exist yet, with their accounts.
+    """
+    start = seeded_count()
+    # every user gets the same hash : hashing a million passwords is not what is measured.
+    password = hashers.make_password(PASSWORD)
+    date_joined = timezone.now() - datetime.timedelta(days=365)
+    for batch_start in range(start, size, BATCH_SIZE):
+        indexes = range(batch_start, min(batch_start + BATCH_SIZE, size))
+        users = [
+            User(
+                username=username(i),
+                email=email(i),
+                first_name='Bench',
+                last_name=f'User {i}',
+                password=password,
+                is_active=is_validated(i),
+                date_joined=date_joined,
+            )
+            for i in indexes
+        ]
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+            if any(user.pk is None for user in users):
+                pks = dict(User.objects.filter(username__in=[user.username for user in users]).values_list('username', 'pk'))
+                for user in users:
+                    user.pk = pks[user.username]
+            expire = AccountService.get_token_expire_time() + datetime.timedelta(days=3650)
+            ids = customer_ids.allocate_customer_ids(len(users))
+            Account.objects.bulk_create([
+                Account(
+                    user=user,
+                    customer_id=customer_id,
+                    normalized_email=email(i),
+                    is_active=is_validated(i),
+                    email_validated=is_validated(i),
+                    email_validation_token=None if is_validated(i) else AccountService.generate_email_validation_token(),
+                    validation_token_expire=expire,
+                )
+                for i, user, customer_id in zip(indexes, users, ids)
+            ])
+        if progress is not None:
+            progress(indexes[-1] + 1)
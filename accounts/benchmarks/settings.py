@@ -0,0 +1,75 @@
+"""
+Django settings of the benchmark suite. The database NAME is set by the runner for every table size.
+"""
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SECRET_KEY = 'accounts-benchmarks'
+DEBUG = False
+USE_TZ = True
+ALLOWED_HOSTS = ['testserver']
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'accounts',
+]
+
+MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+]
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+ROOT_URLCONF = 'accounts.benchmarks.urls'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [os.path.join(BASE_DIR, 'templates')],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+                'accounts.context_processors.account_context',
+            ],
+        },
+    },
+]
+
+# the benchmarks measure the accounts code and the database, not the cost factor of the hasher.
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+SITE_NAME = 'benchmarks'
+SITE_HOST = 'http://testserver'
+DEFAULT_FROM_EMAIL = 'noreply@benchmarks.example'
+DJANGO_VALIDATION_EMAIL_TEMPLATE = 'validation_email.html'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'loggers': {
+        'accounts': {'level': 'ERROR'},
+    },
+}
@@ -0,0 +1,7 @@
+from django.http import HttpResponse
+from django.urls import include, path
+
+urlpatterns = [
+    path('', lambda request: HttpResponse('home'), name='home'),
+    path('accounts/', include('accounts.urls')),
+]
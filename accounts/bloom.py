@@ -0,0 +1,268 @@
+"""
+Existence index of the usernames and emails.
+
+A Bloom filter of the usernames and emails of the users answers "definitely not in use"
+without querying auth_user. A positive answer only means "maybe in use" : the database
+is queried then. The filter never gives false negatives, which is what matters here : a
+user missing from the filter could not log in.
+
+The index is opt-in and configured with the ACCOUNTS_EXISTENCE_INDEX setting :
+
+    ACCOUNTS_EXISTENCE_INDEX = {
+        'BACKEND': 'accounts.bloom.ExistenceIndex',
+        'CACHE_ALIAS': 'default',
+        'CAPACITY': 100000,
+        'ERROR_RATE': 0.01,
+        'DELTA_TIMEOUT': 7 * 24 * 3600,
+    }
+
+The filter is built by the rebuild_existence_index command and stored in the cache, from which
+every process loads it. A user saved afterwards is added as a delta, once its transaction is
+committed : an entry numbered by a counter of the cache. A rebuild reads the counter before
+scanning the users, so every delta it skips was committed before the scan. Before answering, a process reads the counter and applies the deltas it
+has not seen yet, so a new user is known to all the processes at once. As long as the filter
+is not built, or a delta is missing, the index answers "maybe" and the database is queried.
+
+Deleted users stay in the filter until the next rebuild. Rebuild the index at least every
+DELTA_TIMEOUT seconds, as an expired delta disables the index until the next rebuild.
+Use a cache shared by all the processes, with room for the filter : about 1.2 bytes per
+user for an ERROR_RATE of 1%.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+import hashlib
+import logging
+import math
+import threading
+import uuid
+
+logger = logging.getLogger('accounts')
+
+DEFAULT_EXISTENCE_INDEX_BACKEND = 'accounts.bloom.NullExistenceIndex'
+
+
+class BloomFilter:
+    """
+    Bloom filter of strings, sized for capacity values with a false positive rate of error_rate.
+    The bit positions come from one blake2b digest by double hashing.
+    """
+
+    def __init__(self, capacity, error_rate=0.01, bits=None):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(bits) if bits is not None else bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def dumps(self):
+        return (self.capacity, self.error_rate, bytes(self.bits))
+
+    @classmethod
+    def loads(cls, data):
+        capacity, error_rate, bits = data
+        return cls(capacity, error_rate, bits=bits)
+
+
+def username_key(username):
+    return f"u:{username.lower()}"
+
+
+def email_key(email):
+    return f"e:{email.lower()}"
+
+
+def user_keys(username, email):
+    keys = [username_key(username)]
+    if email:
+        keys.append(email_key(email))
+    return keys
+
+
+class NullExistenceIndex:
+    """
+    Answers "maybe" to every lookup. This is the default backend.
+    """
+    enabled = False
+
+    def __init__(self, **kwargs):
+        pass
+
+    def may_contain(self, key):
+        return True
+
+    def add(self, keys):
+        pass
+
+    def rebuild(self):
+        return 0
+
+
+class ExistenceIndex(NullExistenceIndex):
+    """
+    Bloom filter shared through the Django cache, with a copy in every process.
+    """
+    enabled = True
+    key_prefix = 'accounts:existence'
+
+    def __init__(self, CACHE_ALIAS='default', CAPACITY=100000, ERROR_RATE=0.01, DELTA_TIMEOUT=7 * 24 * 3600, **kwargs):
+        super().__init__(**kwargs)
+        self.cache_alias = CACHE_ALIAS
+        self.capacity = CAPACITY
+        self.error_rate = ERROR_RATE
+        self.delta_timeout = DELTA_TIMEOUT
+        self.snapshot_key = f"{self.key_prefix}:snapshot"
+        self.snapshot_id_key = f"{self.key_prefix}:snapshot-id"
+        self.counter_key = f"{self.key_prefix}:counter"
+        self._lock = threading.Lock()
+        self._filter = None
+        self._snapshot_id = None
+        self._applied = 0
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def delta_key(self, number):
+        return f"{self.key_prefix}:delta:{number}"
+
+    def _sync(self):
+        """
+        Bring the local filter up to date. Returns the filter, or None when it can not be trusted.
+        The cache is read without the lock : it is only held to update the local filter.
+        """
+        state = self.cache.get_many([self.snapshot_id_key, self.counter_key])
+        snapshot_id = state.get(self.snapshot_id_key)
+        counter = state.get(self.counter_key)
+        if snapshot_id is None or counter is None:
+            return None
+        snapshot = None
+        applied = self._applied
+        if snapshot_id != self._snapshot_id:
+            snapshot = self.cache.get(self.snapshot_key)
+            if snapshot is None or snapshot[0] != snapshot_id:
+                return None
+            applied = snapshot[1]
+        deltas = {}
+        if counter > applied:
+            deltas = self.cache.get_many([self.delta_key(n) for n in range(applied + 1, counter + 1)])
+        with self._lock:
+            if snapshot is not None and self._snapshot_id != snapshot_id:
+                self._snapshot_id, self._applied = snapshot[0], snapshot[1]
+                self._filter = BloomFilter.loads(snapshot[2])
+            if self._snapshot_id != snapshot_id:
+                # another thread loaded another snapshot meanwhile : see the next call.
+                return None
+            for number in range(self._applied + 1, counter + 1):
+                keys = deltas.get(self.delta_key(number))
+                if keys is None:
+                    # not written yet, or expired : see the next call.
+                    logger.warning(f"existence index : delta {number} missing, the index may need a rebuild")
+                    return None
+                self._filter.update(keys)
+                self._applied = number
+            return self._filter
+
+    def may_contain(self, key):
+        bloom = self._sync()
+        # the bits are only ever set : reading them without the lock is safe.
+        return bloom is None or key in bloom
+
+    def add(self, keys):
+        try:
+            number = self.cache.incr(self.counter_key)
+        except ValueError:
+            # the index is not built : it will hold these keys once built.
+            return
+        self.cache.set(self.delta_key(number), list(keys), timeout=self.delta_timeout)
+
+    def rebuild(self):
+        """
+        Build the filter from the users table and publish it. Returns the number of users.
+        """
+        self.cache.add(self.counter_key, 0, timeout=None)
+        # the users saved from now on are also in the deltas after counter.
+        counter = self.cache.get(self.counter_key, 0)
+        count = User.objects.count()
+        bloom = BloomFilter(max(self.capacity, 2 * count), self.error_rate)
+        for username, email in User.objects.values_list('username', 'email').iterator(chunk_size=5000):
+            bloom.update(user_keys(username, email))
+        snapshot_id = uuid.uuid4().hex
+        self.cache.set(self.snapshot_key, (snapshot_id, counter, bloom.dumps()), timeout=None)
+        self.cache.set(self.snapshot_id_key, snapshot_id, timeout=None)
+        logger.info(f"existence index rebuilt with {count} users, {len(bloom.bits)} bytes")
+        return count
+
+
+_backend = None
+
+
+def get_existence_index():
+    global _backend
+    if _backend is None:
+        config = dict(getattr(settings, 'ACCOUNTS_EXISTENCE_INDEX', None) or {})
+        backend_class = import_string(config.pop('BACKEND', 'accounts.bloom.ExistenceIndex') if config else DEFAULT_EXISTENCE_INDEX_BACKEND)
+        _backend = backend_class(**config)
+    return _backend
+
+
+def may_contain_username(username):
+    return get_existence_index().may_contain(username_key(username))
+
+
+def may_contain_email(email):
+    return get_existence_index().may_contain(email_key(email))
+
+
+def add_users(users):
+    """
+    Add the (username, email) pairs of users to the index, once the current transaction is committed.
+    Users inserted without the post_save signal, by bulk_create() for instance, must be added here.
+    """
+    index = get_existence_index()
+    if index.enabled:
+        keys = [key for username, email in users for key in user_keys(username, email)]
+        # a delta numbered before the commit could be skipped by a concurrent rebuild.
+        transaction.on_commit(lambda: index.add(keys))
+
+
+def rebuild():
+    return get_existence_index().rebuild()
+
+
+@receiver(setting_changed)
+def reset_existence_index(sender, setting, **kwargs):
+    global _backend
+    if setting == 'ACCOUNTS_EXISTENCE_INDEX':
+        _backend = None
+
+
+@receiver(post_save, sender=User)
+def add_saved_user(sender, instance, created=False, update_fields=None, **kwargs):
+    if not get_existence_index().enabled:
+        return
+    if update_fields is not None and not {'username', 'email'} & set(update_fields):
+        return
+    add_users([(instance.username, instance.email)])
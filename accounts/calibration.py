@@ -0,0 +1,207 @@
+"""
+Calibration of the password hashers.
+
+benchmark() hashes a password with every hasher of PASSWORD_HASHERS, for a few values of its
+cost parameters around the current ones, at several concurrency levels. recommend() picks, for
+every hasher, the most expensive parameters still meeting a login latency and throughput target.
+hash_distribution() counts the stored password hashes by algorithm and cost, to plan the
+upgrade of the hashes, done when the users log in.
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.contrib.auth.models import User
+from django.utils.module_loading import import_string
+from accounts import hashing
+import collections
+import math
+import time
+
+CALIBRATION_PASSWORD = 'calibration-password'
+
+# cost parameters of the Django hashers, and the factors applied to their current value.
+COST_PARAMETERS = {
+    'iterations': (0.25, 0.5, 1, 2),
+    'rounds': (-2, -1, 0, 1),
+    'time_cost': (-1, 0, 1, 2),
+    'work_factor': (0.5, 1, 2),
+}
+# parameters changed by adding the factor instead of multiplying by it.
+ADDITIVE_PARAMETERS = ('rounds', 'time_cost')
+# parameters written in the stored hashes, as decoded by the hashers.
+STORED_COST_KEYS = ('iterations', 'work_factor', 'time_cost', 'memory_cost', 'parallelism', 'block_size')
+
+
+class Candidate:
+    """
+    A hasher with a set of parameters.
+    """
+
+    def __init__(self, path, params=None):
+        self.path = path
+        self.params = params or {}
+
+    @property
+    def algorithm(self):
+        return import_string(self.path).algorithm
+
+    def label(self):
+        params = ', '.join(f"{key}={value}" for key, value in sorted(self.params.items()))
+        return f"{self.algorithm}({params})" if params else self.algorithm
+
+
+def build_hasher(path, params):
+    hasher = import_string(path)()
+    for key, value in params.items():
+        setattr(hasher, key, value)
+    return hasher
+
+
+def timed_hash(path, params):
+    hasher = build_hasher(path, params)
+    started_at = time.perf_counter()
+    hasher.encode(CALIBRATION_PASSWORD, hasher.salt())
+    return time.perf_counter() - started_at
+
+
+def get_candidates(path):
+    """
+    Return the Candidates of the hasher at path, cheapest first.
+    """
+    hasher_class = import_string(path)
+    for name, factors in COST_PARAMETERS.items():
+        current = getattr(hasher_class, name, None)
+        if not isinstance(current, int) or isinstance(current, bool):
+            continue
+        values = []
+        for factor in factors:
+            value = current + factor if name in ADDITIVE_PARAMETERS else int(current * factor)
+            if value >= 1 and value not in values:
+                values.append(value)
+        candidates = [Candidate(path, {name: value}) for value in sorted(values)]
+        if name == 'work_factor' and hasattr(hasher_class, 'maxmem'):
+            # scrypt needs about 128 * work_factor * block_size bytes : past the default limit of
+            # OpenSSL, maxmem has to be raised along with work_factor.
+            for candidate in candidates:
+                candidate.params['maxmem'] = max(hasher_class.maxmem, 2 * 128 * candidate.params['work_factor'] * hasher_class.block_size)
+        return candidates
+    # no known cost parameter : only the hasher as configured.
+    return [Candidate(path)]
+
+
+def is_available(path):
+    """
+    Return False when the library the hasher at path needs is not installed.
+    """
+    hasher = import_string(path)()
+    if getattr(hasher, 'library', None):
+        try:
+            hasher._load_library()
+        except ValueError:
+            return False
+    return True
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def measure(candidate, concurrency, count, executor_type='thread'):
+    """
+    Hash count passwords with concurrency workers.
+    Returns a dict of the p50 and p95 hash times in milliseconds and of the hashes per second.
+    """
+    executor_class = ProcessPoolExecutor if executor_type == 'process' else ThreadPoolExecutor
+    kwargs = {'initializer': hashing.setup_worker} if executor_type == 'process' else {}
+    with executor_class(max_workers=concurrency, **kwargs) as executor:
+        # warm up the workers, the process ones start Django.
+        list(executor.map(timed_hash, [candidate.path] * concurrency, [candidate.params] * concurrency))
+        started_at = time.perf_counter()
+        durations = list(executor.map(timed_hash, [candidate.path] * count, [candidate.params] * count))
+        elapsed = time.perf_counter() - started_at
+    return {
+        'concurrency': concurrency,
+        'p50': percentile(durations, 50) * 1000,
+        'p95': percentile(durations, 95) * 1000,
+        'rate': count / elapsed if elapsed else 0.0,
+    }
+
+
+def benchmark(paths=None, concurrency_levels=(1, 2, 4), count=20, executor_type='thread', progress=None):
+    """
+    Return a list of (candidate, measures) for the hashers at paths, PASSWORD_HASHERS by default.
+    progress(candidate, measure) is called after every measure. A measure of parameters that
+    could not be used has an error instead of the timings.
+    """
+    results = []
+    for path in paths or settings.PASSWORD_HASHERS:
+        if not is_available(path):
+            continue
+        for candidate in get_candidates(path):
+            measures = []
+            for concurrency in concurrency_levels:
+                try:
+                    measure_result = measure(candidate, concurrency, max(count, concurrency), executor_type)
+                except ValueError as e:
+                    # parameters the hasher or the host refuse.
+                    measure_result = {'concurrency': concurrency, 'error': str(e)}
+                measures.append(measure_result)
+                if progress is not None:
+                    progress(candidate, measure_result)
+                if 'error' in measure_result:
+                    break
+            results.append((candidate, [m for m in measures if 'error' not in m]))
+    return results
+
+
+def recommend(results, target_ms, target_rate):
+    """
+    For every hasher, return the most expensive candidate whose p95 hash time at concurrency 1 is
+    within target_ms and which hashes target_rate passwords per second at its best concurrency.
+    Returns a dict mapping the hasher path to (candidate or None, reason).
+    """
+    recommendations = {}
+    for candidate, measures in results:
+        if not measures:
+            continue
+        single = next((m for m in measures if m['concurrency'] == 1), measures[0])
+        best_rate = max(m['rate'] for m in measures)
+        meets = single['p95'] <= target_ms and best_rate >= target_rate
+        reason = f"p95 {single['p95']:.1f}ms, up to {best_rate:.1f} hashes/s"
+        if candidate.path not in recommendations:
+            recommendations[candidate.path] = (None, f"no parameters meet the targets, the cheapest gives {reason}")
+        if meets:
+            # candidates come cheapest first : the last one meeting the targets wins.
+            recommendations[candidate.path] = (candidate, reason)
+    return recommendations
+
+
+def describe_hash(encoded):
+    """
+    Return (algorithm, cost label, outdated) of a stored password hash.
+    """
+    if not encoded or encoded.startswith(hashers.UNUSABLE_PASSWORD_PREFIX):
+        return 'unusable', '', False
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return 'unknown', '', False
+    try:
+        decoded = hasher.decode(encoded)
+    except (NotImplementedError, ValueError, TypeError):
+        decoded = {}
+    cost = ', '.join(f"{key}={decoded[key]}" for key in STORED_COST_KEYS if key in decoded)
+    return hasher.algorithm, cost, hashing.must_update(encoded)
+
+
+def hash_distribution(chunk_size=5000):
+    """
+    Return a Counter of the users by (algorithm, cost label, outdated).
+    """
+    distribution = collections.Counter()
+    for encoded in User.objects.values_list('password', flat=True).iterator(chunk_size=chunk_size):
+        distribution[describe_hash(encoded)] += 1
+    return distribution
@@ -0,0 +1,210 @@
+"""
+Validation mail campaigns : send the validation link to every unvalidated account at once.
+
+The mails do not go through the outbox. The validation template is resolved and compiled once,
+the accounts are streamed by batches and each batch is rendered while the previous ones are sent.
+Batches are sent by at most `connections` threads, every thread keeping its connection of the mail
+backend open for the whole campaign, and at most 2 * `connections` rendered batches wait for them.
+
+Accounts whose token is still valid get their current link again, the others a new token : the
+tokens of a batch are written with one bulk_update(). Accounts mailed within the validation mail
+cooldown are skipped, and every mailed account starts a new cooldown.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import caches
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template
+from django.utils.html import strip_tags
+from accounts.models import Account
+from accounts.account_services import AccountService, get_validation_mail_cooldown, has_valid_validation_token, validation_mail_cooldown_key
+from accounts import account_cache
+import collections
+import logging
+import threading
+import time
+
+logger = logging.getLogger('accounts')
+
+CHUNK_SIZE = 2000
+
+
+def get_campaign_accounts(limit=None):
+    """
+    Return an iterator over the unvalidated accounts, with their user, in primary key order.
+    Active users are included : imported accounts are active before their email is validated.
+    """
+    queryset = Account.objects.filter(email_validated=False).select_related('user').order_by('pk')
+    if limit is not None:
+        queryset = queryset[:limit]
+    return queryset.iterator(chunk_size=CHUNK_SIZE)
+
+
+class CampaignResult:
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+
+class ConnectionPool:
+    """
+    One open connection of the mail backend per sending thread.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def get(self):
+        mail_connection = getattr(self._local, 'connection', None)
+        if mail_connection is None:
+            mail_connection = get_connection(fail_silently=False)
+            mail_connection.open()
+            self._local.connection = mail_connection
+            with self._lock:
+                self._connections.append(mail_connection)
+        return mail_connection
+
+    def discard(self):
+        mail_connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if mail_connection is not None:
+            with self._lock:
+                self._connections.remove(mail_connection)
+            _close(mail_connection)
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for mail_connection in connections:
+            _close(mail_connection)
+
+
+def _close(mail_connection):
+    try:
+        mail_connection.close()
+    except Exception:
+        logger.warning("validation campaign : could not close the mail connection", exc_info=True)
+
+
+class ValidationCampaign:
+    """
+    Send the validation link to the accounts given to run(), by batches of batch_size
+    over at most connections connections.
+    progress(result) is called after every batch sent.
+    """
+
+    def __init__(self, batch_size=100, connections=4, dry_run=False, progress=None):
+        self.batch_size = batch_size
+        self.connections = connections
+        self.dry_run = dry_run
+        self.progress = progress
+        self.result = CampaignResult()
+        self.template_name = settings.DJANGO_VALIDATION_EMAIL_TEMPLATE
+        self.template = get_template(self.template_name)
+        self.cache = caches['default']
+        self.cooldown = get_validation_mail_cooldown()
+        self._pool = ConnectionPool()
+        self._lock = threading.Lock()
+
+    def run(self, accounts):
+        """
+        Returns the CampaignResult.
+        """
+        self._started_at = time.monotonic()
+        pending = collections.deque()
+        try:
+            with ThreadPoolExecutor(max_workers=self.connections, thread_name_prefix='accounts-campaign') as executor:
+                for batch in self._batches(accounts):
+                    messages = self._prepare(batch)
+                    if not messages:
+                        continue
+                    if self.dry_run:
+                        self.result.sent += len(messages)
+                        continue
+                    if len(pending) >= 2 * self.connections:
+                        pending.popleft().result()
+                    pending.append(executor.submit(self._send, messages))
+                while pending:
+                    pending.popleft().result()
+        finally:
+            self._pool.close()
+            self.result.elapsed = time.monotonic() - self._started_at
+        return self.result
+
+    def _batches(self, accounts):
+        batch = []
+        for account in accounts:
+            batch.append(account)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _prepare(self, batch):
+        if self.cooldown:
+            cooling = self.cache.get_many([validation_mail_cooldown_key(account) for account in batch])
+            accounts = [account for account in batch if not (validation_mail_cooldown_key(account) in cooling and has_valid_validation_token(account))]
+            self.result.skipped += len(batch) - len(accounts)
+        else:
+            accounts = batch
+        if self.dry_run:
+            return accounts
+        expired = [account for account in accounts if not has_valid_validation_token(account)]
+        if expired:
+            expire = AccountService.get_token_expire_time()
+            for account in expired:
+                account.email_validation_token = AccountService.generate_email_validation_token()
+                account.validation_token_expire = expire
+            Account.objects.bulk_update(expired, ['email_validation_token', 'validation_token_expire'])
+            account_cache.invalidate_many([account.account_uuid for account in expired])
+        return [(account, self._build_message(account)) for account in accounts]
+
+    def _build_message(self, account):
+        email_context = AccountService.get_validation_email_context(account)
+        html_message = self.template.render(email_context['context'])
+        message = EmailMultiAlternatives(
+            email_context['title'],
+            strip_tags(html_message),
+            settings.DEFAULT_FROM_EMAIL,
+            [email_context['recipient_email']],
+        )
+        message.attach_alternative(html_message, 'text/html')
+        return message
+
+    def _send(self, messages):
+        sent = []
+        failed = 0
+        for account, message in messages:
+            try:
+                self._pool.get().send_messages([message])
+            except Exception as e:
+                logger.warning(f"validation campaign : mail to {message.to[0]} failed : {e!r}")
+                # the connection may be broken : the next mail opens a new one.
+                self._pool.discard()
+                failed += 1
+            else:
+                sent.append(account)
+        if sent and self.cooldown:
+            self.cache.set_many({validation_mail_cooldown_key(account): 1 for account in sent}, self.cooldown)
+        with self._lock:
+            self.result.sent += len(sent)
+            self.result.failed += failed
+            self.result.elapsed = time.monotonic() - self._started_at
+            if self.progress is not None:
+                self.progress(self.result)
+
+
+def send_validation_campaign(accounts=None, batch_size=100, connections=4, dry_run=False, progress=None):
+    if accounts is None:
+        accounts = get_campaign_accounts()
+    return ValidationCampaign(batch_size=batch_size, connections=connections, dry_run=dry_run, progress=progress).run(accounts)
@@ -27,4 +27,29 @@ ACCOUNT_TYPE = (
 
 TOKEN_LENGTH = 20
 ACTIVATION_DELAY_HOURS = 48
-RANDOM_CUSTOMER_ID_CHARACTERS = '0123456789'
\ No newline at end of file
+# seconds during which the validation link of an account is not sent again.
+# Overridden by the ACCOUNTS_VALIDATION_MAIL_COOLDOWN setting, 0 disables the cooldown.
+VALIDATION_MAIL_COOLDOWN = 300
+RANDOM_CUSTOMER_ID_CHARACTERS = '0123456789'
+
+# customer_ids are 9 digits numbers.
+CUSTOMER_ID_SPACE = 10 ** 9
+# number of customer_ids a process reserves at once.
+CUSTOMER_ID_BLOCK_SIZE = 100
+# PostgreSQL sequence handing out the customer_id blocks.
+CUSTOMER_ID_SEQUENCE = 'accounts_customer_id_seq'
+
+# name of the request attribute holding the memoized account of the logged user.
+REQUEST_ACCOUNT_ATTR = '_accounts_request_account'
+# set on a new User instance whose account is created by the caller instead of the post_save signal.
+SKIP_ACCOUNT_CREATION_ATTR = '_accounts_skip_account_creation'
+
+MAIL_STATUS_PENDING = 0
+MAIL_STATUS_SENT = 1
+MAIL_STATUS_DEAD = 2
+
+MAIL_STATUS = (
+    (MAIL_STATUS_PENDING, 'PENDING'),
+    (MAIL_STATUS_SENT, 'SENT'),
+    (MAIL_STATUS_DEAD, 'DEAD'),
+)
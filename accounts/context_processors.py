@@ -1,19 +1,20 @@
-from accounts.models import Account
+from django.utils.functional import SimpleLazyObject
+from accounts.account_services import AccountService
 from accounts import constants
 import logging
 logger = logging.getLogger(__name__)
 
 
 def account_context(request):
+    """
+    The account is exposed as a lazy object : the database is only hit when a template
+    actually reads it, and the result is memoized on the request so the views reuse it.
+    """
     context = {
         'account' : None
     }
     if request.user.is_authenticated:
-        try:
-            account = Account.objects.get(user=request.user)
-            context['account'] = account
-            context['ACCOUNT_TYPE'] : constants.ACCOUNT_TYPE
-        except Account.DoesNotExist :
-            logging.warning(f"No account found for user {request.user.username}")
+        context['account'] = SimpleLazyObject(lambda: AccountService.get_request_account(request))
+        context['ACCOUNT_TYPE'] = constants.ACCOUNT_TYPE
         
-    return context
\ No newline at end of file
+    return context
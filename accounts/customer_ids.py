@@ -0,0 +1,226 @@
+"""
+Collision-free customer_id allocation.
+
+customer_ids are the values of a counter shared by all the processes, mapped through a keyed
+permutation of [0, CUSTOMER_ID_SPACE) : two counter values never give the same customer_id,
+and consecutive counter values give unrelated looking customer_ids.
+
+The random customer_ids given before the allocator existed are not values of the counter and may
+collide with the allocated ones : generate_customer_ids, which skips the ids already in use, gives
+allocator ids to every account once. Until it has run, CHECK_TAKEN skips them on every allocation,
+at the cost of one query each :
+
+    ACCOUNTS_CUSTOMER_ID_ALLOCATOR = {'CHECK_TAKEN': True}
+
+Each process reserves the counter values by blocks :
+ * on PostgreSQL the counter is a sequence, and nextval() hands out block numbers. Sequences
+   are not transactional, so a rolled back transaction never gives back a block.
+ * on the other databases the counter is a row of CustomerIdSequence, updated in a short
+   transaction of its own : a reservation made inside the transaction of the caller would lock
+   the row until its commit. Inside a transaction the block is reserved from another thread, so
+   on another connection. SQLite allows a single writer, and the transaction of the caller
+   usually holds it already : there only the needed values are reserved, in that transaction,
+   since the reservation is undone if it rolls back.
+
+The permutation key is generated when the counter is created and stored with it : it must never
+change once customer_ids have been allocated.
+"""
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from accounts.models import Account, CustomerIdSequence
+from accounts import constants
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import secrets
+import threading
+
+DEFAULT_CUSTOMER_ID_ALLOCATOR = 'accounts.customer_ids.CustomerIdAllocator'
+
+
+class KeyedPermutation:
+    """
+    Keyed pseudo random permutation of [0, domain).
+    This is a balanced Feistel network over the smallest even number of bits covering the domain.
+    Values falling out of the domain are encrypted again (cycle walking) until they fall into it,
+    which takes about 1.07 rounds on average for the customer_id space.
+    """
+
+    def __init__(self, key, domain=constants.CUSTOMER_ID_SPACE, rounds=6):
+        self.domain = domain
+        bits = max(2, (domain - 1).bit_length())
+        self.half_bits = (bits + 1) // 2
+        self.mask = (1 << self.half_bits) - 1
+        self.round_keys = [hashlib.blake2b(key, digest_size=32, person=b'customer-id', salt=bytes([i]) * 16).digest() for i in range(rounds)]
+
+    def _round(self, round_key, value):
+        digest = hashlib.blake2b(value.to_bytes(8, 'big'), key=round_key, digest_size=8).digest()
+        return int.from_bytes(digest, 'big') & self.mask
+
+    def _encrypt(self, value):
+        left, right = value >> self.half_bits, value & self.mask
+        for round_key in self.round_keys:
+            left, right = right, left ^ self._round(round_key, right)
+        return (left << self.half_bits) | right
+
+    def permute(self, value):
+        if not 0 <= value < self.domain:
+            raise ValueError(f"{value} is out of the permutation domain [0, {self.domain})")
+        value = self._encrypt(value)
+        while value >= self.domain:
+            value = self._encrypt(value)
+        return value
+
+
+class CustomerIdAllocator:
+    """
+    Allocates customer_ids from counter values reserved by blocks of BLOCK_SIZE.
+    An allocator is shared by the threads of a process.
+    """
+    sequence_name = 'customer_id'
+
+    def __init__(self, BLOCK_SIZE=constants.CUSTOMER_ID_BLOCK_SIZE, CHECK_TAKEN=False, **kwargs):
+        self.block_size = BLOCK_SIZE
+        self.check_taken = CHECK_TAKEN
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._ranges = []
+        self._permutation = None
+
+    def allocate(self):
+        return self.allocate_many(1)[0]
+
+    def allocate_many(self, count, check_taken=None):
+        """
+        Return a list of count new customer_ids.
+        With check_taken, CHECK_TAKEN by default, the ids already used by an account are skipped.
+        """
+        customer_ids = self._allocate_many(count)
+        if self.check_taken if check_taken is None else check_taken:
+            taken = self._taken(customer_ids)
+            while taken:
+                replacements = self._allocate_many(len(taken))
+                customer_ids = [customer_id for customer_id in customer_ids if customer_id not in taken] + replacements
+                taken = self._taken(replacements)
+        return customer_ids
+
+    def _taken(self, customer_ids):
+        return set(Account.objects.filter(customer_id__in=customer_ids).values_list('customer_id', flat=True))
+
+    def _allocate_many(self, count):
+        values = []
+        with self._lock:
+            if self._pid != os.getpid():
+                # the reserved blocks were inherited from the parent process, which may use them too.
+                self._reset()
+            while len(values) < count:
+                if not self._ranges:
+                    self._ranges = self._reserve(count - len(values))
+                start, end = self._ranges[0]
+                take = min(end - start, count - len(values))
+                values.extend(range(start, start + take))
+                if start + take == end:
+                    self._ranges.pop(0)
+                else:
+                    self._ranges[0] = (start + take, end)
+            permutation = self._permutation
+        return [permutation.permute(value) for value in values]
+
+    def preview_many(self, count):
+        """
+        Return count customer_ids as allocate_many() would, without reserving anything.
+        The returned ids are not reserved and must not be stored.
+        """
+        with self._lock:
+            if self._permutation is None:
+                self._permutation = KeyedPermutation(bytes.fromhex(self._get_sequence().key))
+            permutation = self._permutation
+        return [permutation.permute(value) for value in range(count)]
+
+    def _get_sequence(self):
+        sequence, created = CustomerIdSequence.objects.get_or_create(
+            name=self.sequence_name,
+            defaults={'key': secrets.token_hex(32)},
+        )
+        return sequence
+
+    def _reserve(self, needed):
+        """
+        Reserve counter values for at least needed customer_ids.
+        Returns a list of (start, end) ranges.
+        """
+        connection = connections[router.db_for_write(CustomerIdSequence)]
+        if connection.vendor == 'postgresql':
+            return self._reserve_from_sequence(connection, needed)
+        return self._reserve_from_table(connection, needed)
+
+    def _reserve_from_sequence(self, connection, needed):
+        if self._permutation is None:
+            self._permutation = KeyedPermutation(bytes.fromhex(self._get_sequence().key))
+        blocks = -(-needed // self.block_size)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT nextval(%s) FROM generate_series(1, %s)", [constants.CUSTOMER_ID_SEQUENCE, blocks])
+            block_numbers = [row[0] for row in cursor.fetchall()]
+        return [self._checked_range((n - 1) * self.block_size, n * self.block_size) for n in block_numbers]
+
+    def _reserve_from_table(self, connection, needed):
+        if connection.in_atomic_block and connection.vendor != 'sqlite':
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                return executor.submit(self._reserve_outside_transaction, connection.alias, needed).result()
+        size = needed if connection.in_atomic_block else max(needed, self.block_size)
+        queryset = CustomerIdSequence.objects.filter(name=self.sequence_name)
+        with transaction.atomic(using=connection.alias, savepoint=False):
+            if not queryset.update(next_value=F('next_value') + size):
+                self._get_sequence()
+                queryset.update(next_value=F('next_value') + size)
+            next_value, key = queryset.values_list('next_value', 'key').get()
+        if self._permutation is None:
+            self._permutation = KeyedPermutation(bytes.fromhex(key))
+        return [self._checked_range(next_value - size, next_value)]
+
+    def _reserve_outside_transaction(self, alias, needed):
+        # runs in its own thread, so connections[alias] is a new connection in autocommit mode.
+        connection = connections[alias]
+        try:
+            return self._reserve_from_table(connection, needed)
+        finally:
+            connection.close()
+
+    def _checked_range(self, start, end):
+        if end > constants.CUSTOMER_ID_SPACE:
+            raise OverflowError("The customer_id space is exhausted")
+        return (start, end)
+
+
+_allocator = None
+
+
+def get_allocator():
+    global _allocator
+    if _allocator is None:
+        config = dict(getattr(settings, 'ACCOUNTS_CUSTOMER_ID_ALLOCATOR', None) or {})
+        allocator_class = import_string(config.pop('BACKEND', DEFAULT_CUSTOMER_ID_ALLOCATOR))
+        _allocator = allocator_class(**config)
+    return _allocator
+
+
+def allocate_customer_id():
+    return get_allocator().allocate()
+
+
+def allocate_customer_ids(count, check_taken=None):
+    return get_allocator().allocate_many(count, check_taken=check_taken)
+
+
+@receiver(setting_changed)
+def reset_allocator(sender, setting, **kwargs):
+    global _allocator
+    if setting == 'ACCOUNTS_CUSTOMER_ID_ALLOCATOR':
+        _allocator = None
@@ -0,0 +1,75 @@
+from functools import wraps
+from asgiref.sync import iscoroutinefunction
+from django.http import HttpResponse
+from accounts import hashing, instrumentation
+from accounts.resources import ui_strings
+import logging
+
+logger = logging.getLogger('accounts')
+
+
+def hashing_unavailable_response(request):
+    response = HttpResponse(ui_strings.SERVICE_BUSY_ERROR, status=503, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(hashing.get_hashing_setting('RETRY_AFTER'))
+    logger.warning(f"{request.path} : password hashing queue full, answering 503")
+    return response
+
+
+def shed_hashing_overload(view_func):
+    """
+    Answer 503 with a Retry-After header when the password hashing queue of view_func is full.
+    Works for sync and async views.
+    """
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _wrapped_view(request, *args, **kwargs):
+            try:
+                return await view_func(request, *args, **kwargs)
+            except hashing.HashingQueueFull:
+                return hashing_unavailable_response(request)
+    else:
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            try:
+                return view_func(request, *args, **kwargs)
+            except hashing.HashingQueueFull:
+                return hashing_unavailable_response(request)
+    return _wrapped_view
+
+
+def instrument_view(view_func):
+    """
+    Record the timings of view_func, see accounts.instrumentation.
+    Does nothing when ACCOUNTS_INSTRUMENTATION is not enabled. Works for sync and async views.
+    """
+    def _begin(request):
+        span = instrumentation.current_span()
+        if span is not None:
+            # the middleware already records the request.
+            span.view = instrumentation.get_view_name(request, view_func)
+            return None
+        return instrumentation.begin(instrumentation.get_view_name(request, view_func))
+
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _wrapped_view(request, *args, **kwargs):
+            if not instrumentation.is_enabled():
+                return await view_func(request, *args, **kwargs)
+            token = _begin(request)
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                if token is not None:
+                    instrumentation.finish(token)
+    else:
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if not instrumentation.is_enabled():
+                return view_func(request, *args, **kwargs)
+            token = _begin(request)
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                if token is not None:
+                    instrumentation.finish(token)
+    return _wrapped_view
@@ -1,10 +1,11 @@
 from django import forms
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth import password_validation
+from django.contrib.auth.forms import PasswordChangeForm, UserCreationForm
 from django.contrib.auth.models import User
-from accounts.models import Account
+from accounts.models import Account, get_normalized_email
 from django.contrib.admin.widgets import AdminDateWidget
 from django.core.exceptions import ValidationError
-from accounts import constants
+from accounts import bloom, constants, hashing
 import datetime
 
 class UserForm(forms.ModelForm):
@@ -70,7 +71,7 @@ class AuthenticationForm(forms.Form):
     This is the Login Form.
     """
     username = forms.CharField(widget=forms.widgets.TextInput,
-                               label="Nom d'utilisateur")
+                               label="Nom d'utilisateur ou email")
     password = forms.CharField(widget=forms.widgets.PasswordInput,
                                label='Mot de passse')
 
@@ -82,9 +83,7 @@ class AuthenticationForm(forms.Form):
         
         if username is None or len(username) < constants.USERNAME_MIN_LENGTH :
             raise ValidationError(f"invalid username: \"{username}\".  Username must be at least {constants.USERNAME_MIN_LENGTH} characters long")
-
-        if not User.objects.filter(username=username).exists():
-            raise ValidationError(f"bad username or password")
+        # whether the user exists is checked by AccountService.process_login_request, along with the password.
         return username
 
 
@@ -116,18 +115,46 @@ class UserSignUpForm(UserCreationForm):
         
         if not username or len(username) < constants.USERNAME_MIN_LENGTH :
             raise ValidationError(f"invalid username: \"{username}\".  Username must be at least {constants.USERNAME_MIN_LENGTH} characters long")
-        if User.objects.filter(username=username).exists():
-            raise ValidationError(f"A user with this username : \"{username}\" is already in use")
+        # a taken username is reported by AccountService.process_registration_request from the IntegrityError.
         return username
 
     def clean_email(self):
         email = self.cleaned_data.get('email')
         if not email :
             raise ValidationError(f"missing email")
-        if User.objects.filter(email=email).exists():
+        # the emails are unique whatever their case, on the index of Account.normalized_email.
+        # The existence index spares the query for the emails certainly not in use.
+        if bloom.may_contain_email(email) and Account.objects.filter(normalized_email=get_normalized_email(email)).exists():
             raise ValidationError("This email is already in use")
         return email
 
+    def validate_unique(self):
+        # the unique constraints are enforced by the database when the user is inserted.
+        pass
+
+
+class AccountPasswordChangeForm(PasswordChangeForm):
+    """
+    PasswordChangeForm hashing the passwords in the executor of accounts.hashing.
+    """
+
+    def clean_old_password(self):
+        old_password = self.cleaned_data["old_password"]
+        if not hashing.check_password(self.user, old_password):
+            raise ValidationError(
+                self.error_messages["password_incorrect"],
+                code="password_incorrect",
+            )
+        return old_password
+
+    def save(self, commit=True):
+        password = self.cleaned_data["new_password1"]
+        self.user.password = hashing.make_password(password)
+        if commit:
+            self.user.save()
+            password_validation.password_changed(password, self.user)
+        return self.user
+
 
 class AccountCreationForm(forms.ModelForm):
 
@@ -0,0 +1,220 @@
+"""
+Password hashing off the request path.
+
+Password hashers are CPU bound on purpose. Login, registration and password change hash
+passwords in a bounded executor instead of the request thread :
+ * at most MAX_WORKERS passwords are hashed at the same time, by threads or by processes.
+   Process workers are not limited by the GIL, thread workers are cheaper to start.
+ * at most MAX_QUEUE hashes are in flight, running or waiting. Past that, HashingQueueFull is
+   raised at once, and the views answer 503 instead of piling up the requests.
+ * the time every hash waited in the queue and ran is recorded, see get_stats().
+
+The executor is configured with the ACCOUNTS_PASSWORD_HASHING setting :
+
+    ACCOUNTS_PASSWORD_HASHING = {
+        'EXECUTOR': 'thread',
+        'MAX_WORKERS': 4,
+        'MAX_QUEUE': 64,
+        'RETRY_AFTER': 5,
+    }
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from accounts import instrumentation
+import asyncio
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger('accounts')
+
+DEFAULT_HASHING_SETTINGS = {
+    # 'thread' or 'process'
+    'EXECUTOR': 'thread',
+    # number of passwords hashed at the same time.
+    'MAX_WORKERS': min(4, os.cpu_count() or 1),
+    # number of hashes running or waiting for a worker. None means MAX_WORKERS * 8.
+    'MAX_QUEUE': None,
+    # seconds sent in the Retry-After header of the 503 responses.
+    'RETRY_AFTER': 5,
+}
+
+
+class HashingQueueFull(Exception):
+    """
+    Raised when MAX_QUEUE hashes are already in flight.
+    """
+    pass
+
+
+class HashingStats:
+    """
+    Counters of the hashing executor. Times are in seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.queue_time = 0.0
+        self.max_queue_time = 0.0
+        self.run_time = 0.0
+
+    def as_dict(self):
+        with self._lock:
+            completed = self.completed
+            return {
+                'in_flight': self.in_flight,
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'completed': completed,
+                'max_queue_time': self.max_queue_time,
+                'avg_queue_time': self.queue_time / completed if completed else 0.0,
+                'avg_run_time': self.run_time / completed if completed else 0.0,
+            }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_stats = HashingStats()
+
+
+def get_hashing_setting(name):
+    config = getattr(settings, 'ACCOUNTS_PASSWORD_HASHING', None) or {}
+    return config.get(name, DEFAULT_HASHING_SETTINGS[name])
+
+
+def get_max_queue():
+    return get_hashing_setting('MAX_QUEUE') or get_hashing_setting('MAX_WORKERS') * 8
+
+
+def setup_worker():
+    # spawned workers start without Django : the hashers read PASSWORD_HASHERS.
+    import django
+    django.setup()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = get_hashing_setting('MAX_WORKERS')
+                if get_hashing_setting('EXECUTOR') == 'process':
+                    _executor = ProcessPoolExecutor(max_workers=max_workers, initializer=setup_worker)
+                else:
+                    _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='accounts-hashing')
+    return _executor
+
+
+def get_stats():
+    return _stats.as_dict()
+
+
+def _timed_call(submitted_at, func, *args):
+    # time.time() and not time.monotonic() : the call may run in another process.
+    started_at = time.time()
+    result = func(*args)
+    return result, started_at - submitted_at, time.time() - started_at
+
+
+def _done(future):
+    with _stats._lock:
+        _stats.in_flight -= 1
+        if future.cancelled() or future.exception() is not None:
+            return
+        _result, queue_time, run_time = future.result()
+        _stats.completed += 1
+        _stats.queue_time += queue_time
+        _stats.run_time += run_time
+        _stats.max_queue_time = max(_stats.max_queue_time, queue_time)
+    if queue_time > 1:
+        logger.warning(f"password hash waited {queue_time:.3f}s in the hashing queue")
+
+
+def submit(func, *args):
+    """
+    Run func(*args) in the hashing executor.
+    Returns a future of (result, queue_time, run_time).
+    Raises HashingQueueFull when MAX_QUEUE calls are already in flight.
+    """
+    max_queue = get_max_queue()
+    with _stats._lock:
+        if _stats.in_flight >= max_queue:
+            _stats.rejected += 1
+            raise HashingQueueFull(f"{_stats.in_flight} password hashes in flight")
+        _stats.in_flight += 1
+        _stats.submitted += 1
+    try:
+        future = get_executor().submit(_timed_call, time.time(), func, *args)
+    except BaseException:
+        with _stats._lock:
+            _stats.in_flight -= 1
+        raise
+    future.add_done_callback(_done)
+    return future
+
+
+def must_update(encoded):
+    """
+    Return True when encoded was not produced by the preferred hasher with its current parameters.
+    """
+    preferred = hashers.get_hasher('default')
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def _result(result):
+    encoded, queue_time, run_time = result
+    instrumentation.record(instrumentation.HASHING, queue_time + run_time)
+    return encoded
+
+
+def make_password(password):
+    return _result(submit(hashers.make_password, password).result())
+
+
+def check_password(user, password):
+    """
+    Check password against the password of user, upgrading the stored hash when the hasher
+    or its parameters changed, like User.check_password() does.
+    """
+    encoded = user.password
+    valid = _result(submit(hashers.check_password, password, encoded).result())
+    if valid and must_update(encoded):
+        user.password = make_password(password)
+        user.save(update_fields=['password'])
+    return valid
+
+
+async def amake_password(password):
+    return _result(await asyncio.wrap_future(submit(hashers.make_password, password)))
+
+
+async def acheck_password(user, password):
+    """
+    Async variant of check_password().
+    """
+    encoded = user.password
+    valid = _result(await asyncio.wrap_future(submit(hashers.check_password, password, encoded)))
+    if valid and must_update(encoded):
+        user.password = await amake_password(password)
+        await user.asave(update_fields=['password'])
+    return valid
+
+
+@receiver(setting_changed)
+def reset_executor(sender, setting, **kwargs):
+    global _executor
+    if setting == 'ACCOUNTS_PASSWORD_HASHING' and _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
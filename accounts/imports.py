@@ -0,0 +1,281 @@
+"""
+Bulk import of users and their accounts.
+
+Rows are streamed from CSV or JSONL files and written by batches : one query checks the
+usernames and the emails of a batch, then the users and the accounts are inserted with bulk_create() in one
+transaction. No signal is sent for the imported rows, the accounts are created along with the
+users and the existence index is told about the new users.
+
+Passwords are hashed by a process pool, while the previous batch is written. Rows may give
+a raw password, an already hashed password_hash (migrated from another Django site), or
+neither : the user then gets an unusable password and has to reset it.
+
+Invalid rows are not imported. They are passed to the reject callback with the reason.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from django.contrib.auth import hashers
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from accounts.models import Account, get_normalized_email
+from accounts import bloom, constants, customer_ids, hashing
+import csv
+import json
+import logging
+import os
+
+logger = logging.getLogger('accounts')
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+ACCOUNT_TYPES = {value for value, name in constants.ACCOUNT_TYPE}
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 'on')
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(stream, format='csv'):
+    """
+    Yield the (line number, row dict) of stream, a text file in one of IMPORT_FORMATS.
+    """
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif format == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                row = RowError(f"invalid JSON : {e}")
+            yield line_number, row
+    else:
+        raise ValueError(f"unknown format {format}, expected one of {IMPORT_FORMATS}")
+
+
+def parse_bool(value, default=False):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def clean_row(row):
+    """
+    Validate a row. Returns the unsaved user, the Account field values and the raw password.
+    Raises RowError.
+    """
+    if isinstance(row, Exception):
+        raise row
+    username = (row.get('username') or '').strip()
+    if len(username) < constants.USERNAME_MIN_LENGTH:
+        raise RowError(f"username must be at least {constants.USERNAME_MIN_LENGTH} characters long")
+    if len(username) > User._meta.get_field('username').max_length:
+        raise RowError("username is too long")
+    email = (row.get('email') or '').strip()
+    try:
+        validate_email(email)
+    except ValidationError:
+        raise RowError(f"invalid email \"{email}\"")
+    user = User(
+        username=username,
+        email=email,
+        first_name=(row.get('first_name') or '').strip(),
+        last_name=(row.get('last_name') or '').strip(),
+        is_active=parse_bool(row.get('is_active'), default=True),
+    )
+    if row.get('date_joined'):
+        date_joined = parse_datetime(row['date_joined'])
+        if date_joined is None:
+            raise RowError(f"invalid date_joined \"{row['date_joined']}\"")
+        user.date_joined = date_joined if timezone.is_aware(date_joined) else timezone.make_aware(date_joined)
+    password = row.get('password') or None
+    if row.get('password_hash'):
+        try:
+            hashers.identify_hasher(row['password_hash'])
+        except ValueError:
+            raise RowError("unknown password_hash algorithm")
+        user.password = row['password_hash']
+        password = None
+    elif password is None:
+        user.set_unusable_password()
+
+    account_values = {
+        'telefon': (row.get('telefon') or '').strip(),
+        'newsletter': parse_bool(row.get('newsletter')),
+        'email_validated': parse_bool(row.get('email_validated')),
+        'is_active': user.is_active,
+        'normalized_email': get_normalized_email(email),
+    }
+    if row.get('account_type') not in (None, ''):
+        try:
+            account_type = int(row['account_type'])
+        except (TypeError, ValueError):
+            account_type = None
+        if account_type not in ACCOUNT_TYPES:
+            raise RowError(f"invalid account_type \"{row['account_type']}\"")
+        account_values['account_type'] = account_type
+    if row.get('date_of_birth'):
+        try:
+            account_values['date_of_birth'] = parse_date(row['date_of_birth'])
+        except ValueError:
+            account_values['date_of_birth'] = None
+        if account_values['date_of_birth'] is None:
+            raise RowError(f"invalid date_of_birth \"{row['date_of_birth']}\"")
+    if len(account_values['telefon']) > Account._meta.get_field('telefon').max_length:
+        raise RowError("telefon is too long")
+    return user, account_values, password
+
+
+class _Batch:
+
+    def __init__(self):
+        self.items = []
+        self.hashed = None
+
+
+class AccountImporter:
+    """
+    Import the rows given to run() by batches of batch_size.
+    workers processes hash the passwords, 0 hashes them in the current process.
+    reject(line_number, row, reason) is called for every invalid row,
+    progress(imported, rejected) after every batch.
+    """
+
+    def __init__(self, batch_size=1000, workers=None, reject=None, progress=None):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.reject = reject
+        self.progress = progress
+        self.imported = 0
+        self.rejected = 0
+
+    def _reject(self, line_number, row, reason):
+        self.rejected += 1
+        if self.reject is not None:
+            if isinstance(row, dict):
+                row = {key: value for key, value in row.items() if key not in ('password', 'password_hash')}
+            else:
+                row = None
+            self.reject(line_number, row, reason)
+
+    def _hash(self, executor, batch):
+        passwords = [password for line_number, row, user, values, password in batch.items if password is not None]
+        if executor is None:
+            batch.hashed = map(hashers.make_password, passwords)
+        else:
+            chunksize = max(1, len(passwords) // (self.workers * 4))
+            batch.hashed = executor.map(hashers.make_password, passwords, chunksize=chunksize)
+
+    def run(self, rows):
+        """
+        Import rows, an iterable of (line number, row dict). Returns (imported, rejected).
+        """
+        executor = None
+        if self.workers is None:
+            self.workers = os.cpu_count() or 1
+        if self.workers > 0:
+            executor = ProcessPoolExecutor(max_workers=self.workers, initializer=hashing.setup_worker)
+        try:
+            pending = None
+            for batch in self._batches(rows):
+                # the passwords of this batch are hashed while the previous batch is written.
+                self._hash(executor, batch)
+                if pending is not None:
+                    self._write(pending)
+                pending = batch
+            if pending is not None:
+                self._write(pending)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return self.imported, self.rejected
+
+    def _batches(self, rows):
+        batch = _Batch()
+        usernames = set()
+        emails = set()
+        for line_number, row in rows:
+            try:
+                user, values, password = clean_row(row)
+            except RowError as e:
+                self._reject(line_number, row, str(e))
+                continue
+            if user.username in usernames:
+                self._reject(line_number, row, f"duplicate username \"{user.username}\" in the batch")
+                continue
+            if values['normalized_email'] in emails:
+                self._reject(line_number, row, f"duplicate email \"{user.email}\" in the batch")
+                continue
+            usernames.add(user.username)
+            emails.add(values['normalized_email'])
+            batch.items.append((line_number, row, user, values, password))
+            if len(batch.items) >= self.batch_size:
+                yield batch
+                batch = _Batch()
+                usernames = set()
+                emails = set()
+        if batch.items:
+            yield batch
+
+    def _write(self, batch):
+        hashed = iter(batch.hashed)
+        for line_number, row, user, values, password in batch.items:
+            if password is not None:
+                user.password = next(hashed)
+        usernames = [item[2].username for item in batch.items]
+        emails = [item[3]['normalized_email'] for item in batch.items]
+        taken = set()
+        taken_emails = set()
+        # one query for both : the users by username, and the accounts by normalized email.
+        for username, normalized_email in User.objects.filter(Q(username__in=usernames) | Q(account__normalized_email__in=emails)).values_list('username', 'account__normalized_email'):
+            taken.add(username)
+            taken_emails.add(normalized_email)
+        items = []
+        for item in batch.items:
+            if item[2].username in taken:
+                self._reject(item[0], item[1], f"username \"{item[2].username}\" is already in use")
+            elif item[3]['normalized_email'] in taken_emails:
+                self._reject(item[0], item[1], f"email \"{item[2].email}\" is already in use")
+            else:
+                items.append(item)
+        if items:
+            self._insert(items)
+        if self.progress is not None:
+            self.progress(self.imported, self.rejected)
+
+    def _insert(self, items):
+        users = [item[2] for item in items]
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                if any(user.pk is None for user in users):
+                    # the database does not return the primary keys of the inserted rows.
+                    pks = dict(User.objects.filter(username__in=[user.username for user in users]).values_list('username', 'pk'))
+                    for user in users:
+                        user.pk = pks[user.username]
+                ids = customer_ids.allocate_customer_ids(len(users))
+                Account.objects.bulk_create([
+                    Account(user=user, customer_id=customer_id, **values)
+                    for (line_number, row, user, values, password), customer_id in zip(items, ids)
+                ])
+        except IntegrityError as e:
+            # a user was inserted by someone else since the check.
+            logger.warning(f"import : batch rejected : {e}")
+            for line_number, row, user, values, password in items:
+                self._reject(line_number, row, f"batch rejected by the database : {e}")
+            return
+        bloom.add_users([(user.username, user.email) for user in users])
+        self.imported += len(users)
+
+
+def import_accounts(rows, batch_size=1000, workers=None, reject=None, progress=None):
+    return AccountImporter(batch_size=batch_size, workers=workers, reject=reject, progress=progress).run(rows)
@@ -0,0 +1,361 @@
+"""
+Per-view timings of the accounts views.
+
+For every instrumented request, the time spent in the view, in the database, hashing passwords,
+rendering templates and adding mails to the outbox is recorded, along with the query count :
+ * in in-process histograms, exposed in the Prometheus text format by the metrics view.
+ * in a structured log line per request, on the accounts logger.
+
+Enable InstrumentationMiddleware to instrument all the accounts views, or decorate single views
+with accounts.decorators.instrument_view. Both are configured with the ACCOUNTS_INSTRUMENTATION
+setting :
+
+    ACCOUNTS_INSTRUMENTATION = {
+        'ENABLED': True,
+        'LOG_REQUESTS': True,
+        'METRICS_ALLOWED_IPS': ['10.0.0.5'],
+    }
+
+Disabled, the middleware removes itself at startup, and the hooks only look up a context
+variable. The histograms live in the memory of every process : scrape every worker.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import setting_changed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.shortcuts import render as django_render
+import bisect
+import contextvars
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger('accounts')
+
+DEFAULT_INSTRUMENTATION_SETTINGS = {
+    'ENABLED': False,
+    # write a log line with the timings of every instrumented request.
+    'LOG_REQUESTS': True,
+    # addresses allowed to read the metrics view, none by default : behind a proxy on the same
+    # host every request comes from 127.0.0.1. Staff users are always allowed.
+    'METRICS_ALLOWED_IPS': [],
+}
+
+# upper bounds of the histogram buckets.
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+# timing kinds recorded by the hooks, besides the database.
+HASHING = 'hashing'
+RENDER = 'render'
+MAIL = 'mail'
+TIMINGS = (HASHING, RENDER, MAIL)
+
+METRICS = (
+    # name, help, buckets
+    ('accounts_view_duration_seconds', "Time spent in the view.", SECONDS_BUCKETS),
+    ('accounts_view_queries', "Number of database queries per request.", QUERIES_BUCKETS),
+    ('accounts_view_db_seconds', "Time spent in database queries.", SECONDS_BUCKETS),
+    ('accounts_view_hashing_seconds', "Time spent hashing passwords, waiting in the queue included.", SECONDS_BUCKETS),
+    ('accounts_view_render_seconds', "Time spent rendering templates.", SECONDS_BUCKETS),
+    ('accounts_view_mail_seconds', "Time spent adding mails to the outbox.", SECONDS_BUCKETS),
+)
+
+
+def get_instrumentation_setting(name):
+    config = getattr(settings, 'ACCOUNTS_INSTRUMENTATION', None) or {}
+    return config.get(name, DEFAULT_INSTRUMENTATION_SETTINGS[name])
+
+
+def is_enabled():
+    return get_instrumentation_setting('ENABLED')
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """
+        Return the cumulative counts of the buckets, +Inf last, the sum and the count.
+        """
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        cumulative = []
+        running = 0
+        for value in counts:
+            running += value
+            cumulative.append(running)
+        return cumulative, total, count
+
+
+class Registry:
+    """
+    The histograms of every metric, by view name.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {name: {} for name, help_text, buckets in METRICS}
+        self._buckets = {name: buckets for name, help_text, buckets in METRICS}
+
+    def observe(self, name, view, value):
+        histograms = self._histograms[name]
+        histogram = histograms.get(view)
+        if histogram is None:
+            with self._lock:
+                histogram = histograms.setdefault(view, Histogram(self._buckets[name]))
+        histogram.observe(value)
+
+    def get_histogram(self, name, view):
+        return self._histograms[name].get(view)
+
+    def clear(self):
+        with self._lock:
+            for histograms in self._histograms.values():
+                histograms.clear()
+
+    def render(self):
+        """
+        Return the histograms in the Prometheus text exposition format.
+        """
+        lines = []
+        for name, help_text, buckets in METRICS:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for view, histogram in sorted(self._histograms[name].items()):
+                label = _escape(view)
+                cumulative, total, count = histogram.snapshot()
+                for bound, value in zip(list(buckets) + ['+Inf'], cumulative):
+                    lines.append(f'{name}_bucket{{view="{label}",le="{bound}"}} {value}')
+                lines.append(f'{name}_sum{{view="{label}"}} {total}')
+                lines.append(f'{name}_count{{view="{label}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+class Span:
+    """
+    The timings of one request.
+    """
+    __slots__ = ('view', 'started_at', 'queries', 'db_time', 'timings')
+
+    def __init__(self, view=None):
+        self.view = view
+        self.started_at = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.timings = dict.fromkeys(TIMINGS, 0.0)
+
+    def as_dict(self, duration):
+        data = {
+            'view': self.view,
+            'duration_ms': round(duration * 1000, 3),
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 3),
+        }
+        for kind, seconds in self.timings.items():
+            data[f'{kind}_ms'] = round(seconds * 1000, 3)
+        return data
+
+
+_current_span = contextvars.ContextVar('accounts_instrumentation_span', default=None)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def record(kind, seconds):
+    """
+    Add seconds to the kind timing of the current request, if it is instrumented.
+    """
+    span = _current_span.get()
+    if span is not None:
+        span.timings[kind] += seconds
+
+
+class timed:
+    """
+    Context manager recording its duration as the kind timing of the current request.
+    """
+    __slots__ = ('kind', 'span', 'started_at')
+
+    def __init__(self, kind):
+        self.kind = kind
+
+    def __enter__(self):
+        self.span = _current_span.get()
+        if self.span is not None:
+            self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.span is not None:
+            self.span.timings[self.kind] += time.perf_counter() - self.started_at
+
+
+def render(request, template_name, context=None, *args, **kwargs):
+    """
+    django.shortcuts.render() recording the render time.
+    """
+    with timed(RENDER):
+        return django_render(request, template_name, context, *args, **kwargs)
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    span = _current_span.get()
+    if span is None:
+        return execute(sql, params, many, context)
+    started_at = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        span.queries += 1
+        span.db_time += time.perf_counter() - started_at
+
+
+def install(connection):
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+@receiver(connection_created)
+def install_on_new_connection(sender, connection, **kwargs):
+    if is_enabled():
+        install(connection)
+
+
+def install_all():
+    """
+    Count the queries of the connections already opened by the current thread too.
+    """
+    for connection in connections.all(initialized_only=True):
+        install(connection)
+
+
+def render_metrics():
+    """
+    Return the histograms and the counters of the hashing executor in the Prometheus text format.
+    """
+    from accounts import hashing
+    stats = hashing.get_stats()
+    lines = [
+        "# HELP accounts_hashing_in_flight Password hashes running or waiting in the executor.",
+        "# TYPE accounts_hashing_in_flight gauge",
+        f"accounts_hashing_in_flight {stats['in_flight']}",
+        "# HELP accounts_hashing_rejected_total Password hashes rejected because the queue was full.",
+        "# TYPE accounts_hashing_rejected_total counter",
+        f"accounts_hashing_rejected_total {stats['rejected']}",
+        "# HELP accounts_hashing_completed_total Password hashes completed.",
+        "# TYPE accounts_hashing_completed_total counter",
+        f"accounts_hashing_completed_total {stats['completed']}",
+    ]
+    return registry.render() + '\n'.join(lines) + '\n'
+
+
+def begin(view=None):
+    """
+    Start the span of a request. Returns the token to give to finish().
+    """
+    return _current_span.set(Span(view))
+
+
+def finish(token, view=None):
+    span = _current_span.get()
+    _current_span.reset(token)
+    if span is None:
+        return None
+    view = view or span.view
+    if view is None:
+        # not an instrumented view.
+        return None
+    duration = time.perf_counter() - span.started_at
+    registry.observe('accounts_view_duration_seconds', view, duration)
+    registry.observe('accounts_view_queries', view, span.queries)
+    registry.observe('accounts_view_db_seconds', view, span.db_time)
+    registry.observe('accounts_view_hashing_seconds', view, span.timings[HASHING])
+    registry.observe('accounts_view_render_seconds', view, span.timings[RENDER])
+    registry.observe('accounts_view_mail_seconds', view, span.timings[MAIL])
+    if get_instrumentation_setting('LOG_REQUESTS'):
+        logger.info(f"view timings {json.dumps(span.as_dict(duration), sort_keys=True)}")
+    return span
+
+
+def get_view_name(request, view_func):
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match is not None and resolver_match.view_name:
+        return resolver_match.view_name
+    return f"{view_func.__module__}.{view_func.__qualname__}"
+
+
+def is_accounts_view(view_func):
+    module = getattr(view_func, '__module__', '') or ''
+    return module == 'accounts' or module.startswith('accounts.')
+
+
+class InstrumentationMiddleware:
+    """
+    Record the timings of the requests served by the accounts views.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not is_enabled():
+            raise MiddlewareNotUsed("ACCOUNTS_INSTRUMENTATION is not enabled")
+        self.get_response = get_response
+        install_all()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = begin()
+        try:
+            return self.get_response(request)
+        finally:
+            finish(token)
+
+    async def __acall__(self, request):
+        token = begin()
+        try:
+            return await self.get_response(request)
+        finally:
+            finish(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        span = _current_span.get()
+        if span is not None and is_accounts_view(view_func):
+            span.view = get_view_name(request, view_func)
+        return None
+
+
+@receiver(setting_changed)
+def reset_instrumentation(sender, setting, **kwargs):
+    if setting == 'ACCOUNTS_INSTRUMENTATION' and is_enabled():
+        install_all()
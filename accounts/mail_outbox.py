@@ -0,0 +1,202 @@
+"""
+Outbox for the mails sent by the accounts app.
+
+Views only enqueue mails : drain() claims the due mails, renders them and sends them through a
+thread pool. Every thread sends its share of the batch over a single connection of the mail backend.
+A failed mail is retried with an exponential backoff, and dead-lettered after MAX_ATTEMPTS.
+
+The worker is tuned with the ACCOUNTS_MAIL_OUTBOX setting, see DEFAULT_OUTBOX_SETTINGS.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connection, transaction
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.html import strip_tags
+from accounts.models import OutgoingMail
+from accounts import constants, instrumentation
+import datetime
+import logging
+import random
+
+logger = logging.getLogger('accounts')
+
+DEFAULT_OUTBOX_SETTINGS = {
+    # number of mails sent over one connection.
+    'BATCH_SIZE': 50,
+    # number of threads, and so of connections, sending mails at the same time.
+    'WORKERS': 4,
+    'MAX_ATTEMPTS': 5,
+    # the n-th retry waits BACKOFF_SECONDS * 2 ** (n - 1), at most MAX_BACKOFF_SECONDS.
+    'BACKOFF_SECONDS': 60,
+    'MAX_BACKOFF_SECONDS': 3600,
+    # claimed mails are not claimed again by another worker before LEASE_SECONDS.
+    'LEASE_SECONDS': 300,
+}
+
+
+def get_outbox_setting(name):
+    config = getattr(settings, 'ACCOUNTS_MAIL_OUTBOX', None) or {}
+    return config.get(name, DEFAULT_OUTBOX_SETTINGS[name])
+
+
+def enqueue(template_name, subject, recipient, context=None, from_email=None):
+    """
+    Add a mail to the outbox. context must be serializable to JSON.
+    """
+    with instrumentation.timed(instrumentation.MAIL):
+        mail = OutgoingMail.objects.create(
+            template_name=template_name,
+            subject=subject,
+            recipient=recipient,
+            context=context or {},
+            from_email=from_email,
+        )
+    logger.debug(f"mail {mail.pk} to {recipient} enqueued")
+    return mail
+
+
+async def aenqueue(template_name, subject, recipient, context=None, from_email=None):
+    """
+    Async variant of enqueue().
+    """
+    with instrumentation.timed(instrumentation.MAIL):
+        mail = await OutgoingMail.objects.acreate(
+            template_name=template_name,
+            subject=subject,
+            recipient=recipient,
+            context=context or {},
+            from_email=from_email,
+        )
+    logger.debug(f"mail {mail.pk} to {recipient} enqueued")
+    return mail
+
+
+def claim(count):
+    """
+    Return up to count due mails, leased to the caller for LEASE_SECONDS.
+    """
+    now = timezone.now()
+    queryset = OutgoingMail.objects.filter(status=constants.MAIL_STATUS_PENDING, next_attempt_at__lte=now).order_by('next_attempt_at')
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        mails = list(queryset[:count])
+        if mails:
+            lease = now + datetime.timedelta(seconds=get_outbox_setting('LEASE_SECONDS'))
+            OutgoingMail.objects.filter(pk__in=[mail.pk for mail in mails]).update(next_attempt_at=lease)
+    return mails
+
+
+def build_message(mail, template_cache=None):
+    template_cache = {} if template_cache is None else template_cache
+    template = template_cache.get(mail.template_name)
+    if template is None:
+        template = template_cache[mail.template_name] = get_template(mail.template_name)
+    html_message = template.render(mail.context)
+    message = EmailMultiAlternatives(
+        mail.subject,
+        strip_tags(html_message),
+        mail.from_email or settings.DEFAULT_FROM_EMAIL,
+        [mail.recipient],
+    )
+    message.attach_alternative(html_message, 'text/html')
+    return message
+
+
+def send_batch(mails):
+    """
+    Send mails over a single connection.
+    Returns a dict mapping the pk of every mail that could not be sent to its error.
+    """
+    errors = {}
+    template_cache = {}
+    messages = []
+    for mail in mails:
+        try:
+            messages.append((mail, build_message(mail, template_cache)))
+        except Exception as e:
+            errors[mail.pk] = f"rendering failed : {e!r}"
+    if not messages:
+        return errors
+    mail_connection = get_connection(fail_silently=False)
+    try:
+        mail_connection.open()
+        for mail, message in messages:
+            try:
+                mail_connection.send_messages([message])
+            except Exception as e:
+                errors[mail.pk] = repr(e)
+    except Exception as e:
+        # the connection could not be opened : none of the remaining mails was sent.
+        for mail, message in messages:
+            errors.setdefault(mail.pk, repr(e))
+    finally:
+        try:
+            mail_connection.close()
+        except Exception:
+            logger.warning("mail outbox : could not close the mail connection", exc_info=True)
+    return errors
+
+
+def get_retry_delay(attempts):
+    delay = get_outbox_setting('BACKOFF_SECONDS') * 2 ** (attempts - 1)
+    delay = min(delay, get_outbox_setting('MAX_BACKOFF_SECONDS'))
+    # spread the retries of the mails that failed together.
+    return datetime.timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def record_results(mails, errors):
+    now = timezone.now()
+    max_attempts = get_outbox_setting('MAX_ATTEMPTS')
+    for mail in mails:
+        mail.attempts += 1
+        error = errors.get(mail.pk)
+        if error is None:
+            mail.status = constants.MAIL_STATUS_SENT
+            mail.sent_at = now
+            mail.last_error = None
+        elif mail.attempts >= max_attempts:
+            mail.status = constants.MAIL_STATUS_DEAD
+            mail.last_error = error
+            logger.error(f"mail {mail.pk} to {mail.recipient} dead-lettered after {mail.attempts} attempts : {error}")
+        else:
+            mail.next_attempt_at = now + get_retry_delay(mail.attempts)
+            mail.last_error = error
+            logger.warning(f"mail {mail.pk} to {mail.recipient} failed, retrying at {mail.next_attempt_at} : {error}")
+    OutgoingMail.objects.bulk_update(mails, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
+
+
+def drain(batch_size=None, workers=None, max_mails=None):
+    """
+    Send the due mails until none is left, or max_mails have been processed.
+    Returns a tuple (sent, failed).
+    """
+    batch_size = batch_size or get_outbox_setting('BATCH_SIZE')
+    workers = workers or get_outbox_setting('WORKERS')
+    sent = failed = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='accounts-outbox') as executor:
+        while max_mails is None or sent + failed < max_mails:
+            count = batch_size * workers
+            if max_mails is not None:
+                count = min(count, max_mails - sent - failed)
+            mails = claim(count)
+            if not mails:
+                break
+            batches = [mails[i:i + batch_size] for i in range(0, len(mails), batch_size)]
+            errors = {}
+            for batch_errors in executor.map(send_batch, batches):
+                errors.update(batch_errors)
+            record_results(mails, errors)
+            failed += len(errors)
+            sent += len(mails) - len(errors)
+    return sent, failed
+
+
+def purge_sent(older_than):
+    """
+    Delete the mails sent before now - older_than (a timedelta).
+    """
+    deleted, _ = OutgoingMail.objects.filter(status=constants.MAIL_STATUS_SENT, sent_at__lt=timezone.now() - older_than).delete()
+    return deleted
@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from accounts.customer_ids import CustomerIdAllocator
+from accounts import constants
+import multiprocessing
+import time
+
+
+def allocate_in_worker(block_size, count):
+    """
+    Allocate count customer_ids one at a time, the way the Account.customer_id default does.
+    Every worker has its own allocator, just like every process of a deployment.
+    """
+    allocator = CustomerIdAllocator(BLOCK_SIZE=block_size)
+    try:
+        return [allocator.allocate() for _ in range(count)]
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Measure the customer_id allocations per second across concurrent workers. The allocated ids are consumed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', default='1,2,4,8', help="Comma separated numbers of concurrent workers.")
+        parser.add_argument('--count', type=int, default=10000, help="Number of customer_ids allocated by each worker.")
+        parser.add_argument('--block-size', type=int, default=constants.CUSTOMER_ID_BLOCK_SIZE, help="Number of customer_ids reserved at once.")
+        parser.add_argument('--mode', choices=('thread', 'process'), default='process', help="Run the workers as threads or as processes.")
+
+    def handle(self, *args, **options):
+        try:
+            worker_counts = [int(n) for n in options['workers'].split(',')]
+        except ValueError:
+            raise CommandError("--workers must be a comma separated list of numbers")
+        count = options['count']
+        block_size = options['block_size']
+        self.stdout.write(f"{'workers':>8} {'allocations':>12} {'seconds':>8} {'allocations/s':>14}")
+        for workers in worker_counts:
+            if options['mode'] == 'process':
+                # forked workers must not share the connections of this process.
+                connections.close_all()
+                executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+            else:
+                executor = ThreadPoolExecutor(max_workers=workers)
+            started_at = time.perf_counter()
+            with executor:
+                results = list(executor.map(allocate_in_worker, [block_size] * workers, [count] * workers))
+            elapsed = time.perf_counter() - started_at
+            customer_ids = [customer_id for result in results for customer_id in result]
+            if len(set(customer_ids)) != len(customer_ids):
+                raise CommandError(f"Duplicated customer_ids allocated with {workers} workers")
+            self.stdout.write(f"{workers:>8} {len(customer_ids):>12} {elapsed:>8.2f} {len(customer_ids) / elapsed:>14.0f}")
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts import calibration
+import os
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the PASSWORD_HASHERS at several cost parameters and concurrency levels, recommend the "
+        "parameters meeting a login latency and throughput target, and count the stored hashes by algorithm and cost."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hashers', help="Comma separated hasher paths. Defaults to PASSWORD_HASHERS.")
+        parser.add_argument('--concurrency', default=f'1,2,{os.cpu_count() or 1}', help="Comma separated numbers of concurrent hashes.")
+        parser.add_argument('--count', type=int, default=20, help="Number of hashes measured per concurrency level.")
+        parser.add_argument('--executor', choices=('thread', 'process'), default='thread', help="Hash in threads or in processes, like ACCOUNTS_PASSWORD_HASHING.")
+        parser.add_argument('--target-ms', type=float, default=250, help="Highest accepted p95 hash time of a single login, in milliseconds.")
+        parser.add_argument('--target-rate', type=float, default=10, help="Lowest accepted number of logins per second.")
+        parser.add_argument('--skip-benchmark', action='store_true', help="Only count the stored hashes.")
+        parser.add_argument('--skip-distribution', action='store_true', help="Do not count the stored hashes.")
+
+    def handle(self, *args, **options):
+        if not options['skip_benchmark']:
+            try:
+                levels = [int(level) for level in options['concurrency'].split(',')]
+            except ValueError:
+                raise CommandError("--concurrency must be a comma separated list of numbers")
+            paths = options['hashers'].split(',') if options['hashers'] else None
+            self.benchmark(paths, levels, options)
+        if not options['skip_distribution']:
+            self.distribution()
+
+    def benchmark(self, paths, levels, options):
+        self.stdout.write(f"{'hasher':<45} {'concurrency':>11} {'p50 ms':>8} {'p95 ms':>8} {'hashes/s':>9}")
+
+        def progress(candidate, measure):
+            if 'error' in measure:
+                self.stdout.write(f"{candidate.label():<45} {measure['concurrency']:>11} failed : {measure['error']}")
+                return
+            self.stdout.write(f"{candidate.label():<45} {measure['concurrency']:>11} {measure['p50']:>8.1f} {measure['p95']:>8.1f} {measure['rate']:>9.1f}")
+
+        results = calibration.benchmark(paths, levels, options['count'], options['executor'], progress=progress)
+        self.stdout.write(f"\nRecommendations for a p95 within {options['target_ms']:.0f}ms and {options['target_rate']:.0f} logins/s :")
+        for path, (candidate, reason) in calibration.recommend(results, options['target_ms'], options['target_rate']).items():
+            if candidate is None:
+                self.stdout.write(f"  {path} : {reason}")
+            else:
+                self.stdout.write(f"  {path} : {candidate.label()} ({reason})")
+
+    def distribution(self):
+        distribution = calibration.hash_distribution()
+        total = sum(distribution.values())
+        self.stdout.write(f"\nStored password hashes of {total} users :")
+        self.stdout.write(f"{'algorithm':<20} {'cost':<45} {'users':>10} {'%':>6}  outdated")
+        for (algorithm, cost, outdated), count in distribution.most_common():
+            self.stdout.write(f"{algorithm:<20} {cost:<45} {count:>10} {100 * count / total:>6.1f}  {'yes' if outdated else 'no'}")
+        outdated = sum(count for (algorithm, cost, is_outdated), count in distribution.items() if is_outdated)
+        if outdated:
+            self.stdout.write(f"{outdated} hashes will be upgraded to the preferred hasher when their users log in.")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from accounts import mail_outbox
+import datetime
+import time
+
+
+class Command(BaseCommand):
+    help = "Send the mails waiting in the accounts outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit once no due mail is left instead of polling the outbox.")
+        parser.add_argument('--poll-interval', type=float, default=5, help="Seconds to wait between two polls of an empty outbox.")
+        parser.add_argument('--batch-size', type=int, help="Number of mails sent over one connection.")
+        parser.add_argument('--workers', type=int, help="Number of threads sending mails.")
+        parser.add_argument('--purge-sent-after', type=int, metavar='DAYS', help="Delete the mails sent more than DAYS days ago.")
+
+    def handle(self, *args, **options):
+        while True:
+            started_at = time.monotonic()
+            sent, failed = mail_outbox.drain(batch_size=options['batch_size'], workers=options['workers'])
+            if sent or failed:
+                elapsed = time.monotonic() - started_at
+                self.stdout.write(f"{sent} mails sent, {failed} failed in {elapsed:.2f}s ({(sent + failed) / elapsed:.0f} mails/s)")
+            if options['purge_sent_after'] is not None:
+                deleted = mail_outbox.purge_sent(datetime.timedelta(days=options['purge_sent_after']))
+                if deleted:
+                    self.stdout.write(f"{deleted} sent mails purged")
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
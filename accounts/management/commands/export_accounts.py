@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts import exports
+import time
+
+
+class Command(BaseCommand):
+    help = "Export the accounts as CSV or JSONL, streamed with a constant memory use."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=exports.EXPORT_FORMATS, default='csv')
+        parser.add_argument('--output', '-o', help="File to write. Defaults to the standard output.")
+        parser.add_argument('--account-type', help="Only export the accounts of this type.")
+        parser.add_argument('--email-validated', choices=['yes', 'no'], help="Only export the accounts with, or without, a validated email.")
+        parser.add_argument('--newsletter', choices=['yes', 'no'], help="Only export the accounts subscribed, or not, to the newsletter.")
+
+    def handle(self, *args, **options):
+        try:
+            filters = exports.parse_filters(options)
+        except ValueError as e:
+            raise CommandError(str(e))
+        started_at = time.monotonic()
+        chunks = exports.export_accounts(options['format'], **filters)
+        size = 0
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+                    size += len(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"{size} characters exported to {options['output']} in {time.monotonic() - started_at:.2f}s"))
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts import account_services
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = "Assign a new customer_id to the accounts, in batches streamed in primary key order."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Number of accounts written per transaction.")
+        parser.add_argument('--start-after', type=int, help="Only process the accounts with a primary key greater than this one.")
+        parser.add_argument('--state-file', help="File recording the last processed primary key after each batch.")
+        parser.add_argument('--resume', action='store_true', help="Start after the primary key recorded in --state-file.")
+        parser.add_argument('--only-missing', action='store_true', help="Only process the accounts without customer_id.")
+        parser.add_argument('--dry-run', action='store_true', help="Generate the ids without writing them and report the throughput.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be a positive number")
+        state_file = options['state_file']
+        start_after = options['start_after']
+        if options['resume']:
+            if not state_file:
+                raise CommandError("--resume requires --state-file")
+            if os.path.exists(state_file):
+                with open(state_file) as f:
+                    start_after = int(f.read().strip() or 0)
+        if start_after is not None:
+            self.stdout.write(f"Resuming after account {start_after}")
+
+        started_at = time.monotonic()
+
+        def progress(last_pk, processed):
+            if state_file and not options['dry_run']:
+                with open(state_file, 'w') as f:
+                    f.write(str(last_pk))
+            elapsed = time.monotonic() - started_at
+            self.stdout.write(f"{processed} accounts processed - last account {last_pk} - {processed / elapsed:.0f} accounts/s")
+
+        processed = account_services.generate_customer_ids(
+            batch_size=batch_size,
+            start_after=start_after,
+            only_missing=options['only_missing'],
+            dry_run=options['dry_run'],
+            progress=progress if options['verbosity'] > 0 else None,
+        )
+        elapsed = time.monotonic() - started_at
+        rate = processed / elapsed if elapsed else 0
+        prefix = "[dry-run] " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(f"{prefix}{processed} accounts processed in {elapsed:.2f}s ({rate:.0f} accounts/s)"))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts import imports
+import json
+import time
+
+
+class Command(BaseCommand):
+    help = "Import users and their accounts from a CSV or JSONL file, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import. The CSV files must have a header row.")
+        parser.add_argument('--format', choices=imports.IMPORT_FORMATS, help="Format of the file. Guessed from its extension by default.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Number of rows written per transaction.")
+        parser.add_argument('--workers', type=int, help="Number of processes hashing the passwords, 0 to hash them in this process. Defaults to the number of CPUs.")
+        parser.add_argument('--rejects', help="JSONL file receiving the rejected rows, with the reason. Passwords are left out.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be a positive number")
+        path = options['path']
+        format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        rejects_file = open(options['rejects'], 'w') if options['rejects'] else None
+        started_at = time.monotonic()
+
+        def reject(line_number, row, reason):
+            if rejects_file is not None:
+                rejects_file.write(json.dumps({'line': line_number, 'reason': reason, 'row': row}, default=str) + '\n')
+            if options['verbosity'] > 1:
+                self.stderr.write(f"line {line_number} rejected : {reason}")
+
+        def progress(imported, rejected):
+            elapsed = time.monotonic() - started_at
+            self.stdout.write(f"{imported} accounts imported, {rejected} rows rejected - {(imported + rejected) / elapsed:.0f} rows/s")
+
+        try:
+            with open(path, newline='', encoding='utf-8') as stream:
+                imported, rejected = imports.import_accounts(
+                    imports.read_rows(stream, format),
+                    batch_size=batch_size,
+                    workers=options['workers'],
+                    reject=reject,
+                    progress=progress if options['verbosity'] > 0 else None,
+                )
+        finally:
+            if rejects_file is not None:
+                rejects_file.close()
+        elapsed = time.monotonic() - started_at
+        rate = (imported + rejected) / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f"{imported} accounts imported, {rejected} rows rejected in {elapsed:.2f}s ({rate:.0f} rows/s)"))
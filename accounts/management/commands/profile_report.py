@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts import profiling
+import collections
+import os
+import pstats
+import statistics
+
+
+class Command(BaseCommand):
+    help = "Aggregate the profiles written by ProfilingMiddleware into a report of the hotspots."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', help="Directory of the profiles. Defaults to the DIRECTORY of ACCOUNTS_PROFILING.")
+        parser.add_argument('--view', help="Only aggregate the profiles of the views containing this text.")
+        parser.add_argument('--top', type=int, default=20, help="Number of functions or frames listed.")
+        parser.add_argument('--sort', choices=('cumulative', 'tottime'), default='cumulative', help="Order of the cProfile functions.")
+
+    def handle(self, *args, **options):
+        directory = options['directory'] or profiling.get_profiling_setting('DIRECTORY')
+        if not os.path.isdir(directory):
+            raise CommandError(f"{directory} is not a directory")
+        profiles = collections.defaultdict(list)
+        for name in profiling.list_profiles(directory):
+            info = profiling.parse_profile_filename(name)
+            if options['view'] and options['view'] not in info['view']:
+                continue
+            info['path'] = os.path.join(directory, name)
+            profiles[info['extension']].append(info)
+        if not profiles:
+            self.stdout.write(f"No profile found in {directory}")
+            return
+        self.write_views(profiles['prof'] + profiles['stacks'])
+        if profiles['prof']:
+            self.write_cprofile(profiles['prof'], options['sort'], options['top'])
+        if profiles['stacks']:
+            self.write_stacks(profiles['stacks'], options['top'])
+
+    def write_views(self, infos):
+        by_view = collections.defaultdict(list)
+        for info in infos:
+            by_view[info['view']].append(info)
+        self.stdout.write(f"{'view':<40} {'profiles':>8} {'median ms':>10} {'max ms':>8} {'median queries':>15}")
+        for view, view_infos in sorted(by_view.items(), key=lambda item: -len(item[1])):
+            self.stdout.write(
+                f"{view:<40} {len(view_infos):>8} {statistics.median(info['ms'] for info in view_infos):>10.0f} "
+                f"{max(info['ms'] for info in view_infos):>8} {statistics.median(info['queries'] for info in view_infos):>15.1f}"
+            )
+
+    def write_cprofile(self, infos, sort, top):
+        self.stdout.write(f"\n{len(infos)} cProfile profiles, top {top} functions by {sort} time :")
+        stats = pstats.Stats(infos[0]['path'], stream=self.stdout)
+        for info in infos[1:]:
+            stats.add(info['path'])
+        stats.strip_dirs().sort_stats(sort).print_stats(top)
+
+    def write_stacks(self, infos, top):
+        stacks = collections.Counter()
+        for info in infos:
+            stacks.update(profiling.read_stacks(info['path']))
+        self_counts, inclusive_counts = profiling.stack_hotspots(stacks)
+        total = sum(stacks.values())
+        self.stdout.write(f"\n{len(infos)} stack sampler profiles, {total} samples, top {top} frames :")
+        self.stdout.write(f"{'self %':>7} {'total %':>8}  frame")
+        for label, count in self_counts.most_common(top):
+            self.stdout.write(f"{100 * count / total:>7.1f} {100 * inclusive_counts[label] / total:>8.1f}  {label}")
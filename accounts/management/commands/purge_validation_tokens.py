@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts import account_services
+import datetime
+
+
+class Command(BaseCommand):
+    help = "Clear, reissue or delete the expired email validation tokens of the unvalidated accounts, in short batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=account_services.TOKEN_PURGE_MODES, default='clear',
+            help="clear : remove the expired tokens, keeping their expiry. reissue : give a new token and expiry. "
+                 "delete : delete the inactive users whose token expired more than --grace-days ago.")
+        parser.add_argument('--grace-days', type=int, default=30, help="With --mode delete, days an expired account is kept.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Number of accounts per transaction. Keep it small to hold the row locks briefly.")
+        parser.add_argument('--time-budget', type=float, help="Seconds after which no new batch is started.")
+        parser.add_argument('--pause', type=float, default=0, help="Seconds to sleep between two batches.")
+        parser.add_argument('--notify', action='store_true', help="With --mode reissue, send the new validation links.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the accounts that would be processed.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be a positive number")
+        if options['notify'] and options['mode'] != 'reissue':
+            raise CommandError("--notify requires --mode reissue")
+
+        def progress(summary):
+            self.stdout.write(f"{summary['processed']} accounts processed in {summary['batches']} batches - {summary['elapsed']:.2f}s")
+
+        summary = account_services.purge_validation_tokens(
+            mode=options['mode'],
+            grace_period=datetime.timedelta(days=options['grace_days']),
+            batch_size=options['batch_size'],
+            time_budget=options['time_budget'],
+            pause=options['pause'],
+            notify=options['notify'],
+            dry_run=options['dry_run'],
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+        elapsed = summary['elapsed']
+        rate = summary['processed'] / elapsed if elapsed else 0
+        prefix = "[dry-run] " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{options['mode']} : {summary['processed']} accounts processed in {summary['batches']} batches, "
+            f"{elapsed:.2f}s ({rate:.0f} accounts/s)"
+        ))
+        if not summary['finished']:
+            self.stdout.write(self.style.WARNING("Time budget exhausted : expired accounts are left for the next run."))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts import bloom
+import time
+
+
+class Command(BaseCommand):
+    help = "Rebuild the existence index of the usernames and emails from the users table."
+
+    def handle(self, *args, **options):
+        index = bloom.get_existence_index()
+        if not index.enabled:
+            raise CommandError("The existence index is disabled : set ACCOUNTS_EXISTENCE_INDEX first.")
+        started_at = time.monotonic()
+        count = index.rebuild()
+        self.stdout.write(f"Existence index rebuilt with {count} users in {time.monotonic() - started_at:.2f}s")
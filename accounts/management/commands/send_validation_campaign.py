@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from accounts import campaigns
+
+
+class Command(BaseCommand):
+    help = "Send the validation link to every unvalidated account."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="Number of mails rendered and sent together.")
+        parser.add_argument('--connections', type=int, default=4, help="Number of mail backend connections sending at the same time.")
+        parser.add_argument('--limit', type=int, help="Mail at most this many accounts.")
+        parser.add_argument('--dry-run', action='store_true', help="Count the accounts that would be mailed, without sending or writing anything.")
+
+    def progress(self, result):
+        if self.verbosity > 1:
+            self.stdout.write(f"{result.sent} sent, {result.failed} failed ({result.rate:.0f} mails/s)")
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        result = campaigns.send_validation_campaign(
+            accounts=campaigns.get_campaign_accounts(limit=options['limit']),
+            batch_size=options['batch_size'],
+            connections=options['connections'],
+            dry_run=options['dry_run'],
+            progress=self.progress,
+        )
+        prefix = '[dry-run] ' if options['dry_run'] else ''
+        self.stdout.write(
+            f"{prefix}{result.sent} mails sent, {result.failed} failed, {result.skipped} accounts in cooldown skipped "
+            f"in {result.elapsed:.2f}s ({result.rate:.0f} mails/s)"
+        )
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:40
+
+import accounts.models
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Account',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(blank=True, null=True, upload_to=accounts.models.ident_file_path)),
+                ('date_of_birth', models.DateField(blank=True, null=True)),
+                ('telefon', models.CharField(blank=True, default='', max_length=15, null=True)),
+                ('newsletter', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('customer_id', models.IntegerField(blank=True, default=accounts.models.generate_customer_id, null=True)),
+                ('account_type', models.IntegerField(blank=True, choices=[(0, 'ADMIN'), (1, 'BUSINESS'), (2, 'DEVELOPER'), (3, 'PRIVATE'), (4, 'STAFF'), (5, 'RECHARGE'), (7, 'VENDOR'), (6, 'EXTRA'), (8, 'PARTNER'), (9, 'API USER')], default=3, null=True)),
+                ('account_uuid', models.UUIDField(blank=True, default=uuid.uuid4, editable=False, null=True)),
+                ('email_validation_token', models.CharField(blank=True, default=accounts.models.get_activation_token, max_length=128, null=True)),
+                ('validation_token_expire', models.DateTimeField(blank=True, null=True)),
+                ('email_validated', models.BooleanField(blank=True, default=False, null=True)),
+                ('is_active', models.BooleanField(blank=True, default=False, null=True)),
+                ('reset_token', models.CharField(blank=True, max_length=8, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='created_accounts', to=settings.AUTH_USER_MODEL)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'permissions': (('api_add_account', 'Can add  an account through rest api'), ('api_view_account', 'Can read through a rest api'), ('api_change_account', 'Can edit through a rest api'), ('api_delete_account', 'Can delete through a rest api'), ('api_recharge_customer_account', 'can recharge customer account through api')),
+            },
+        ),
+    ]
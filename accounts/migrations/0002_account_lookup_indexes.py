@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:40
+
+import accounts.models
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import crypto
+
+
+def deduplicate_customer_ids(apps, schema_editor):
+    """
+    customer_id used to be drawn at random without any uniqueness check.
+    Give a new customer_id to every account but the oldest sharing one, so the unique index can be built.
+    """
+    Account = apps.get_model('accounts', 'Account')
+    db_alias = schema_editor.connection.alias
+    accounts = Account.objects.using(db_alias)
+    duplicates = accounts.exclude(customer_id=None).values('customer_id').annotate(count=Count('id')).filter(count__gt=1)
+    for duplicate in duplicates.iterator():
+        pks = accounts.filter(customer_id=duplicate['customer_id']).order_by('pk').values_list('pk', flat=True)[1:]
+        for pk in list(pks):
+            customer_id = int(crypto.get_random_string(length=9, allowed_chars='0123456789'))
+            while accounts.filter(customer_id=customer_id).exists():
+                customer_id = int(crypto.get_random_string(length=9, allowed_chars='0123456789'))
+            accounts.filter(pk=pk).update(customer_id=customer_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_customer_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='account',
+            name='account_uuid',
+            field=models.UUIDField(blank=True, default=uuid.uuid4, editable=False, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='account',
+            name='customer_id',
+            field=models.IntegerField(blank=True, default=accounts.models.generate_customer_id, null=True, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='account',
+            index=models.Index(fields=['account_uuid', 'email_validation_token'], name='accounts_uuid_token_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='account',
+            index=models.Index(condition=models.Q(('email_validated', False)), fields=['validation_token_expire'], name='accounts_token_expire_idx'),
+        ),
+    ]
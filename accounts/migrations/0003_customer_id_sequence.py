@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:42
+
+from django.db import migrations, models
+import secrets
+
+# the sequence name is copied from accounts.constants.CUSTOMER_ID_SEQUENCE : migrations must not change with the code.
+CUSTOMER_ID_SEQUENCE = 'accounts_customer_id_seq'
+
+
+def create_customer_id_sequence(apps, schema_editor):
+    CustomerIdSequence = apps.get_model('accounts', 'CustomerIdSequence')
+    CustomerIdSequence.objects.using(schema_editor.connection.alias).get_or_create(
+        name='customer_id',
+        defaults={'key': secrets.token_hex(32)},
+    )
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f"CREATE SEQUENCE IF NOT EXISTS {CUSTOMER_ID_SEQUENCE}")
+
+
+def drop_customer_id_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f"DROP SEQUENCE IF EXISTS {CUSTOMER_ID_SEQUENCE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_account_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerIdSequence',
+            fields=[
+                ('name', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(default=0)),
+                ('key', models.CharField(max_length=64)),
+            ],
+        ),
+        migrations.RunPython(create_customer_id_sequence, drop_customer_id_sequence),
+    ]
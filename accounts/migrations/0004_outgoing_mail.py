@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:43
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_customer_id_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutgoingMail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('template_name', models.CharField(max_length=255)),
+                ('context', models.JSONField(blank=True, default=dict)),
+                ('subject', models.CharField(max_length=255)),
+                ('recipient', models.EmailField(max_length=254)),
+                ('from_email', models.CharField(blank=True, max_length=255, null=True)),
+                ('status', models.IntegerField(choices=[(0, 'PENDING'), (1, 'SENT'), (2, 'DEAD')], default=0)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 0)), fields=['next_attempt_at'], name='accounts_outbox_pending_idx')],
+            },
+        ),
+    ]
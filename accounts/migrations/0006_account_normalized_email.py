@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:10
+
+from django.db import migrations, models
+
+BACKFILL_CHUNK_SIZE = 2000
+
+
+def backfill_normalized_email(apps, schema_editor):
+    """
+    Copy the lowercased email of the users to their account. Only the oldest account of a
+    duplicated email gets it : the others keep NULL, and can log in by username only.
+    """
+    Account = apps.get_model('accounts', 'Account')
+    accounts = Account.objects.using(schema_editor.connection.alias)
+    seen = set()
+    batch = {}
+    for account_id, email in accounts.order_by('pk').values_list('pk', 'user__email').iterator(chunk_size=BACKFILL_CHUNK_SIZE):
+        normalized_email = (email or '').strip().lower() or None
+        if normalized_email is None or normalized_email in seen:
+            continue
+        seen.add(normalized_email)
+        batch[account_id] = normalized_email
+        if len(batch) >= BACKFILL_CHUNK_SIZE:
+            _update_normalized_emails(accounts, batch)
+            batch = {}
+    if batch:
+        _update_normalized_emails(accounts, batch)
+
+
+def _update_normalized_emails(accounts, emails):
+    # a queryset update : Account instances would run the customer_id default.
+    accounts.filter(pk__in=list(emails)).update(normalized_email=models.Case(
+        *[models.When(pk=account_id, then=models.Value(email)) for account_id, email in emails.items()],
+        output_field=models.CharField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_account_type_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='normalized_email',
+            field=models.CharField(blank=True, editable=False, max_length=254, null=True),
+        ),
+        migrations.RunPython(backfill_normalized_email, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='account',
+            name='normalized_email',
+            field=models.CharField(blank=True, editable=False, max_length=254, null=True, unique=True),
+        ),
+    ]
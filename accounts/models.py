@@ -1,25 +1,43 @@
-from django.db import models
+from django.db import IntegrityError, models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_init, post_save
 from django.dispatch import receiver
 from django.urls import reverse
 from django.utils import timezone
-from django.utils import crypto
 from accounts import constants as ACCOUNT_CONSTANTS
+from accounts.tokens_gen import validation_token_generator
 import uuid
 import secrets
 import datetime
+import logging
+
+logger = logging.getLogger('accounts')
+
+# the email of a User as loaded from, or last saved to, the database. See sync_normalized_email().
+LOADED_EMAIL_ATTR = '_accounts_loaded_email'
 
 def get_activation_token():
     return secrets.token_urlsafe(ACCOUNT_CONSTANTS.TOKEN_LENGTH)
 
+
+def get_normalized_email(email):
+    """
+    Return the form of email stored in Account.normalized_email : stripped and lowercased.
+    """
+    if not email:
+        return None
+    return email.strip().lower() or None
+
+
 def ident_file_path(instance, filename):
     file_ext = filename.split(".")[-1]
     name = "avatar" + "." + file_ext
     return "identifications/ser_{0}_{1}".format(instance.user.id, name)
 
 def generate_customer_id():
-    return crypto.get_random_string(length=9, allowed_chars=ACCOUNT_CONSTANTS.RANDOM_CUSTOMER_ID_CHARACTERS)
+    # imported here since accounts.customer_ids depends on the models of this module.
+    from accounts.customer_ids import allocate_customer_id
+    return allocate_customer_id()
 
 class Account(models.Model):
     """
@@ -33,18 +51,29 @@ class Account(models.Model):
     newsletter = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
-    customer_id = models.IntegerField(default=generate_customer_id, blank=True, null=True)
+    customer_id = models.IntegerField(default=generate_customer_id, unique=True, blank=True, null=True)
     account_type = models.IntegerField(default=ACCOUNT_CONSTANTS.ACCOUNT_PRIVATE, blank=True, null=True, choices=ACCOUNT_CONSTANTS.ACCOUNT_TYPE)
-    account_uuid = models.UUIDField(default=uuid.uuid4, editable=False, blank=True, null=True)
+    account_uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False, blank=True, null=True)
     email_validation_token = models.CharField(max_length=128, default=get_activation_token, blank=True, null=True)
     validation_token_expire = models.DateTimeField(blank=True, null=True)
     email_validated = models.BooleanField(default=False, blank=True, null=True)
     is_active = models.BooleanField(default=False, blank=True, null=True)
     created_by = models.ForeignKey(User, related_name="created_accounts", null=True,blank=True, on_delete=models.SET_NULL)
     reset_token = models.CharField(max_length=8,blank=True, null=True)
+    # the email of the user, see get_normalized_email(). Unique : an email address can only be used
+    # by one account, whatever its case. Logins by email are looked up with it.
+    normalized_email = models.CharField(max_length=254, unique=True, blank=True, null=True, editable=False)
 
 
     class Meta:
+        indexes = [
+            # email_validation and send_validation look an account up by uuid and token.
+            models.Index(fields=['account_uuid', 'email_validation_token'], name='accounts_uuid_token_idx'),
+            # only the accounts still waiting for their validation are looked up by expiration date.
+            models.Index(fields=['validation_token_expire'], name='accounts_token_expire_idx', condition=models.Q(email_validated=False)),
+            # the admin changelist filters by type and pages in primary key order.
+            models.Index(fields=['account_type', 'id'], name='accounts_type_idx'),
+        ]
         permissions = (
             ('api_add_account', "Can add  an account through rest api"),
             ('api_view_account', 'Can read through a rest api'),
@@ -62,7 +91,8 @@ class Account(models.Model):
         return reverse('accounts:account-detail', kwargs={'account_uuid':self.account_uuid})
     
     def get_validation_url(self):
-        return reverse('accounts:email-validation', kwargs={'account_uuid':self.account_uuid, 'token': self.email_validation_token})
+        token = validation_token_generator.make_token(self)
+        return reverse('accounts:email-validation', kwargs={'account_uuid':self.account_uuid, 'token': token})
 
     def full_name(self):
         return self.user.get_full_name()
@@ -76,6 +106,45 @@ class Account(models.Model):
     
 
 
+class CustomerIdSequence(models.Model):
+    """
+    Counter the customer_ids are allocated from, see accounts.customer_ids.
+    key is the secret of the permutation applied to the counter values. It must never change.
+    """
+    name = models.CharField(max_length=32, primary_key=True)
+    next_value = models.BigIntegerField(default=0)
+    key = models.CharField(max_length=64)
+
+    def __str__(self):
+        return self.name
+
+
+class OutgoingMail(models.Model):
+    """
+    A mail waiting in the outbox. The mails are rendered and sent by the drain_mail_outbox command,
+    see accounts.mail_outbox.
+    """
+    template_name = models.CharField(max_length=255)
+    context = models.JSONField(default=dict, blank=True)
+    subject = models.CharField(max_length=255)
+    recipient = models.EmailField(max_length=254)
+    from_email = models.CharField(max_length=255, blank=True, null=True)
+    status = models.IntegerField(default=ACCOUNT_CONSTANTS.MAIL_STATUS_PENDING, choices=ACCOUNT_CONSTANTS.MAIL_STATUS)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at'], name='accounts_outbox_pending_idx', condition=models.Q(status=ACCOUNT_CONSTANTS.MAIL_STATUS_PENDING)),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} - {self.recipient}"
+
+
 @receiver(post_save, sender=User)
 def create_or_update_account(sender,instance, created,  **kwargs):
     """
@@ -86,14 +155,52 @@ def create_or_update_account(sender,instance, created,  **kwargs):
     this slot is executed.
     When a new User created from a views or programmatically, there is no associated account 
     to the new user, so we have to create a new account for that user.
+    Callers creating the account themselves set SKIP_ACCOUNT_CREATION_ATTR on the new user.
     """
-    if created:
+    email_saved = kwargs.get('update_fields') is None or 'email' in kwargs['update_fields']
+    if created and not getattr(instance, ACCOUNT_CONSTANTS.SKIP_ACCOUNT_CREATION_ATTR, False):
         # first check if instance already has a account profile
         # if the user hasn't an associated account profile then we create an Profile account.
         #
         if not Account.objects.filter(user=instance).exists():
-            Account.objects.create(user=instance, validation_token_expire=timezone.now() + datetime.timedelta(hours=ACCOUNT_CONSTANTS.ACTIVATION_DELAY_HOURS))
+            values = {'user': instance, 'validation_token_expire': timezone.now() + datetime.timedelta(hours=ACCOUNT_CONSTANTS.ACTIVATION_DELAY_HOURS)}
+            try:
+                Account.objects.create(normalized_email=get_normalized_email(instance.email), **values)
+            except IntegrityError:
+                logger.error(f"user {instance.username} : email already in use by another account")
+                raise
             print("Account instance created")
+    elif not created and email_saved:
+        sync_normalized_email(instance)
+    if email_saved:
+        setattr(instance, LOADED_EMAIL_ATTR, instance.email)
     return
-        
 
+
+@receiver(post_init, sender=User)
+def remember_loaded_email(sender, instance, **kwargs):
+    # a deferred email is unknown : sync_normalized_email() then writes it.
+    if 'email' in instance.__dict__:
+        setattr(instance, LOADED_EMAIL_ATTR, instance.email)
+
+
+def sync_normalized_email(user):
+    """
+    Copy the email of user to the normalized_email of its account, when it changed since the user
+    was loaded. Raises IntegrityError when another account uses the email : save the user in a
+    transaction, so that its email change is rolled back too.
+    """
+    normalized_email = get_normalized_email(user.email)
+    if hasattr(user, LOADED_EMAIL_ATTR) and get_normalized_email(getattr(user, LOADED_EMAIL_ATTR)) == normalized_email:
+        return
+    # the account loaded along with the user tells whether the email changed, without a query.
+    account = getattr(user, 'account', None) if User.account.is_cached(user) else None
+    if account is not None and account.normalized_email == normalized_email:
+        return
+    try:
+        Account.objects.filter(user=user).exclude(normalized_email=normalized_email).update(normalized_email=normalized_email)
+    except IntegrityError:
+        logger.error(f"user {user.username} : email already in use by another account")
+        raise
+    if account is not None:
+        account.normalized_email = normalized_email
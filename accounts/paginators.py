@@ -0,0 +1,35 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator counting the unfiltered rows of large tables from the planner statistics.
+
+    COUNT(*) reads the whole table on PostgreSQL. When the queryset is not filtered and
+    the statistics give more than ESTIMATE_THRESHOLD rows, that estimate is used instead :
+    the last page may then be empty or incomplete. Filtered querysets and the other
+    databases are counted exactly.
+    """
+    ESTIMATE_THRESHOLD = 100000
+
+    @cached_property
+    def count(self):
+        estimate = self.estimated_count()
+        if estimate is not None and estimate > self.ESTIMATE_THRESHOLD:
+            return estimate
+        return super().count
+
+    def estimated_count(self):
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is None or query.where or query.distinct or query.is_sliced:
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        return row[0] if row and row[0] > 0 else None
@@ -0,0 +1,310 @@
+"""
+Profiles of real accounts requests.
+
+ProfilingMiddleware profiles the requests served by the accounts views :
+ * a SAMPLE_RATE fraction of them with cProfile, written as pstats files (.prof).
+ * with SLOW_REQUEST_MS set, every request is watched by a stack sampler and the ones slower than
+   the threshold are written as collapsed stacks (.stacks), the format of flamegraph.pl.
+   The sampler thread only walks the stacks of the requests in progress every SAMPLE_INTERVAL.
+
+The files are named <time>_<view>_<queries>q_<milliseconds>ms.<prof|stacks> and written to
+DIRECTORY, where only the MAX_FILES most recent ones are kept. The profile_report command
+aggregates them into a report of the hotspots.
+
+    ACCOUNTS_PROFILING = {
+        'ENABLED': True,
+        'SAMPLE_RATE': 0.01,
+        'SLOW_REQUEST_MS': 500,
+        'DIRECTORY': '/var/tmp/accounts-profiles',
+    }
+
+Without ENABLED the middleware removes itself at startup. The middleware is synchronous :
+cProfile would also record the other tasks of an event loop. Only one cProfile profiler can be
+active at a time : a sampled request overlapping another one is watched by the stack sampler
+instead, or not profiled without SLOW_REQUEST_MS. From Python 3.12 cProfile is built on
+sys.monitoring and records every thread of the process : the sampled requests are watched by the
+stack sampler, and written as .stacks whatever their duration.
+"""
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from accounts.instrumentation import get_view_name, is_accounts_view
+import cProfile
+import collections
+import datetime
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger('accounts')
+
+DEFAULT_PROFILING_SETTINGS = {
+    'ENABLED': False,
+    # fraction of the requests profiled with cProfile.
+    'SAMPLE_RATE': 0.01,
+    # requests slower than this many milliseconds are written from the stack samples. None disables the sampler.
+    'SLOW_REQUEST_MS': None,
+    # seconds between two samples of the stacks.
+    'SAMPLE_INTERVAL': 0.005,
+    'DIRECTORY': os.path.join(tempfile.gettempdir(), 'accounts-profiles'),
+    # number of profiles kept in DIRECTORY.
+    'MAX_FILES': 200,
+}
+
+PROFILE_EXTENSIONS = ('prof', 'stacks')
+PROFILE_NAME_RE = re.compile(r'^(?P<time>\d{8}-\d{6}-\d{6})_(?P<view>.+)_(?P<queries>\d+)q_(?P<ms>\d+)ms\.(?P<extension>prof|stacks)$')
+
+
+def get_profiling_setting(name):
+    config = getattr(settings, 'ACCOUNTS_PROFILING', None) or {}
+    return config.get(name, DEFAULT_PROFILING_SETTINGS[name])
+
+
+def profile_filename(view, queries, milliseconds, extension, now=None):
+    now = now or datetime.datetime.now()
+    view = re.sub(r'[^A-Za-z0-9.-]+', '-', view.replace(':', '.'))
+    return f"{now:%Y%m%d-%H%M%S-%f}_{view}_{queries}q_{int(milliseconds)}ms.{extension}"
+
+
+def parse_profile_filename(filename):
+    """
+    Return the dict of the time, view, queries, ms and extension of a profile filename, or None.
+    """
+    match = PROFILE_NAME_RE.match(filename)
+    if match is None:
+        return None
+    info = match.groupdict()
+    info['queries'] = int(info['queries'])
+    info['ms'] = int(info['ms'])
+    return info
+
+
+def list_profiles(directory):
+    """
+    Return the names of the profiles of directory, oldest first.
+    """
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(name for name in names if PROFILE_NAME_RE.match(name))
+
+
+def rotate(directory, max_files):
+    names = list_profiles(directory)
+    for name in names[:max(0, len(names) - max_files)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_filename}:{code.co_name}:{frame.f_lineno}"
+
+
+def collapse(frame):
+    """
+    Return the stack of frame, root first, as a ; separated line.
+    """
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class StackSampler:
+    """
+    Daemon thread counting the stacks of the watched threads every interval seconds.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._watched = {}
+        self._thread = None
+
+    def watch(self, thread_id):
+        with self._lock:
+            self._watched[thread_id] = collections.Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='accounts-stack-sampler', daemon=True)
+                self._thread.start()
+
+    def unwatch(self, thread_id):
+        """
+        Stop watching thread_id. Returns the Counter of its collapsed stacks.
+        """
+        with self._lock:
+            return self._watched.pop(thread_id, collections.Counter())
+
+    def sample(self):
+        with self._lock:
+            if not self._watched:
+                return
+            frames = sys._current_frames()
+            for thread_id, stacks in self._watched.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    stacks[collapse(frame)] += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sample()
+            except Exception:
+                logger.warning("stack sampler : sampling failed", exc_info=True)
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+# held by the request being profiled with cProfile.
+_cprofile_lock = threading.Lock()
+# before Python 3.12, cProfile only records the calls of the thread that enabled it.
+CPROFILE_IS_PER_THREAD = sys.version_info < (3, 12)
+
+
+def get_sampler():
+    global _sampler
+    if _sampler is None:
+        with _sampler_lock:
+            if _sampler is None:
+                _sampler = StackSampler(get_profiling_setting('SAMPLE_INTERVAL'))
+    return _sampler
+
+
+class _RequestProfile:
+
+    def __init__(self, view):
+        self.view = view
+        self.queries = 0
+        self.profiler = None
+        self.thread_id = None
+        # written from the stack samples whatever its duration.
+        self.sampled = False
+        self.started_at = time.perf_counter()
+
+    def count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+
+class ProfilingMiddleware:
+    """
+    Profile a sample of the accounts requests, and the slow ones.
+    """
+    sync_capable = True
+    async_capable = False
+
+    def __init__(self, get_response):
+        if not get_profiling_setting('ENABLED'):
+            raise MiddlewareNotUsed("ACCOUNTS_PROFILING is not enabled")
+        self.get_response = get_response
+        self.sample_rate = get_profiling_setting('SAMPLE_RATE')
+        self.slow_request_ms = get_profiling_setting('SLOW_REQUEST_MS')
+        self.directory = get_profiling_setting('DIRECTORY')
+        self.max_files = get_profiling_setting('MAX_FILES')
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            profile = request.__dict__.pop('_accounts_profile', None)
+            if profile is not None:
+                self.finish(profile)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not is_accounts_view(view_func):
+            return None
+        profiler = None
+        sampled = False
+        if random.random() < self.sample_rate:
+            if not CPROFILE_IS_PER_THREAD:
+                sampled = True
+            elif _cprofile_lock.acquire(blocking=False):
+                profiler = cProfile.Profile()
+                try:
+                    profiler.enable()
+                except ValueError:
+                    # another profiler is active, outside of this middleware.
+                    _cprofile_lock.release()
+                    profiler = None
+        if profiler is None and not sampled and self.slow_request_ms is None:
+            return None
+        profile = _RequestProfile(get_view_name(request, view_func))
+        profile.sampled = sampled
+        connection.execute_wrappers.append(profile.count_query)
+        if profiler is not None:
+            profile.profiler = profiler
+        else:
+            profile.thread_id = threading.get_ident()
+            get_sampler().watch(profile.thread_id)
+        request._accounts_profile = profile
+        return None
+
+    def finish(self, profile):
+        elapsed = (time.perf_counter() - profile.started_at) * 1000
+        try:
+            connection.execute_wrappers.remove(profile.count_query)
+        except ValueError:
+            pass
+        if profile.profiler is not None:
+            profile.profiler.disable()
+            _cprofile_lock.release()
+            self.write(profile, elapsed, 'prof')
+        else:
+            stacks = get_sampler().unwatch(profile.thread_id)
+            if stacks and (profile.sampled or elapsed >= self.slow_request_ms):
+                self.write(profile, elapsed, 'stacks', stacks)
+
+    def write(self, profile, elapsed, extension, stacks=None):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, profile_filename(profile.view, profile.queries, elapsed, extension))
+            if stacks is None:
+                profile.profiler.dump_stats(path)
+            else:
+                with open(path, 'w') as f:
+                    for stack, count in stacks.most_common():
+                        f.write(f"{stack} {count}\n")
+            rotate(self.directory, self.max_files)
+        except OSError:
+            logger.warning(f"profiling : could not write the profile of {profile.view}", exc_info=True)
+            return None
+        logger.info(f"profiling : {profile.view} took {elapsed:.0f}ms, {profile.queries} queries, profile written to {path}")
+        return path
+
+
+def read_stacks(path):
+    """
+    Return the Counter of the collapsed stacks of a .stacks file.
+    """
+    stacks = collections.Counter()
+    with open(path) as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack:
+                stacks[stack] += int(count)
+    return stacks
+
+
+def stack_hotspots(stacks):
+    """
+    Return (self counts, inclusive counts) of the frames of stacks, two Counters.
+    """
+    self_counts = collections.Counter()
+    inclusive_counts = collections.Counter()
+    for stack, count in stacks.items():
+        labels = stack.split(';')
+        self_counts[labels[-1]] += count
+        for label in set(labels):
+            inclusive_counts[label] += count
+    return self_counts, inclusive_counts
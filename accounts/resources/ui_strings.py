@@ -9,4 +9,6 @@ ACCOUNT_INVALID_FORM_DATA = _('Your submitted data is not valid')
 ACCOUNT_UPDATE_SUCCESS_MESSAGE = _("Your account has been successfully updated.")
 ACCOUNT_UPDATE_ERROR_MESSAGE = _("Your account could not be updated. Please check the form and try again.")
 ACCOUNT_REGISTRATION_SUCCESS_MESSAGE = _('Your Account has been created')
-ACCOUNT_REGISTRATION_ERROR_MESSAGE = _('Your Account could not be created. Please check the form and try again')
\ No newline at end of file
+ACCOUNT_REGISTRATION_ERROR_MESSAGE = _('Your Account could not be created. Please check the form and try again')
+SERVICE_BUSY_ERROR = _('The service is busy. Please try again in a few seconds.')
+LOGIN_THROTTLED_ERROR = _('Too many login attempts. Please wait a minute before trying again.')
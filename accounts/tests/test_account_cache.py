@@ -0,0 +1,65 @@
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from accounts.models import Account
+from accounts import account_cache
+import uuid
+
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'accounts': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'accounts-cache-tests'},
+}
+
+
+@override_settings(CACHES=TEST_CACHES, ACCOUNTS_CACHE={'CACHE_ALIAS': 'accounts', 'TIMEOUT': 60})
+class AccountCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='cacheUser', email='cache@unittest.com', first_name='cache', last_name='user')
+
+    def setUp(self):
+        account_cache.get_account_cache().cache.clear()
+        self.account = Account.objects.get(user=self.user)
+
+    def test_read_through(self):
+        with self.assertNumQueries(1):
+            account_cache.get_account(self.account.account_uuid)
+        with self.assertNumQueries(0):
+            account = account_cache.get_account(self.account.account_uuid)
+            self.assertEqual(account.pk, self.account.pk)
+            self.assertEqual(account.user.get_full_name(), 'cache user')
+            self.assertEqual(account.get_absolute_url(), self.account.get_absolute_url())
+
+    def test_unknown_or_invalid_uuid(self):
+        self.assertIsNone(account_cache.get_account(uuid.uuid4()))
+        with self.assertNumQueries(0):
+            self.assertIsNone(account_cache.get_account('not-a-uuid'))
+
+    def test_account_save_invalidates(self):
+        account_cache.get_account(self.account.account_uuid)
+        self.account.telefon = '+237699457812'
+        self.account.save()
+        with self.assertNumQueries(1):
+            account = account_cache.get_account(self.account.account_uuid)
+        self.assertEqual(account.telefon, '+237699457812')
+
+    def test_user_save_invalidates(self):
+        account_cache.get_account(self.account.account_uuid)
+        self.user.first_name = 'renamed'
+        self.user.save()
+        account = account_cache.get_account(self.account.account_uuid)
+        self.assertEqual(account.user.first_name, 'renamed')
+
+    def test_user_delete_invalidates(self):
+        account_cache.get_account(self.account.account_uuid)
+        self.user.delete()
+        self.assertIsNone(account_cache.get_account(self.account.account_uuid))
+
+    def test_cached_user_saves_only_loaded_fields(self):
+        account = account_cache.get_account(self.account.account_uuid)
+        account = account_cache.get_account(self.account.account_uuid)
+        password = User.objects.get(pk=self.user.pk).password
+        account.user.last_name = 'saved'
+        account.user.save()
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.last_name, 'saved')
+        self.assertEqual(user.password, password)
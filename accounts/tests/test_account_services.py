@@ -0,0 +1,314 @@
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.contrib.auth.backends import BaseBackend
+from django.contrib.auth.models import User, AnonymousUser
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import caches
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from accounts.models import Account, CustomerIdSequence, OutgoingMail
+from accounts.account_services import AccountService
+from accounts.customer_ids import CustomerIdAllocator, KeyedPermutation
+from accounts.resources import ui_strings
+from accounts import account_services, hashing
+from unittest import mock
+import datetime
+import itertools
+import re
+
+
+class GenerateCustomerIdsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(7):
+            User.objects.create(username=f'customerUser{i}', email=f'customer{i}@unittest.com')
+
+    def test_ids_are_assigned_in_batches(self):
+        batches = []
+        processed = account_services.generate_customer_ids(batch_size=3, progress=lambda last_pk, count: batches.append(count))
+        self.assertEqual(processed, 7)
+        self.assertEqual(batches, [3, 6, 7])
+        customer_ids = list(Account.objects.values_list('customer_id', flat=True))
+        self.assertEqual(len(set(customer_ids)), 7)
+
+    def test_resume_after_pk(self):
+        pks = list(Account.objects.order_by('pk').values_list('pk', flat=True))
+        Account.objects.update(customer_id=None)
+        processed = account_services.generate_customer_ids(batch_size=3, start_after=pks[4])
+        self.assertEqual(processed, 2)
+        self.assertEqual(Account.objects.filter(customer_id__isnull=True).count(), 5)
+
+    def test_dry_run_writes_nothing(self):
+        before = list(Account.objects.order_by('pk').values_list('customer_id', flat=True))
+        next_value = CustomerIdSequence.objects.get().next_value
+        processed = account_services.generate_customer_ids(batch_size=3, dry_run=True)
+        self.assertEqual(processed, 7)
+        self.assertEqual(list(Account.objects.order_by('pk').values_list('customer_id', flat=True)), before)
+        self.assertEqual(CustomerIdSequence.objects.get().next_value, next_value)
+
+
+LOGIN_TEST_SETTINGS = {
+    'PASSWORD_HASHERS': ['django.contrib.auth.hashers.MD5PasswordHasher'],
+    'SESSION_ENGINE': 'django.contrib.sessions.backends.cache',
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+}
+
+
+def build_request(path='/', data=None):
+    request = RequestFactory().post(path, data or {})
+    SessionMiddleware(lambda request: None).process_request(request)
+    request.user = AnonymousUser()
+    return request
+
+
+class UsernameOnlyBackend(BaseBackend):
+    """
+    Not a ModelBackend : accepts any password of the validated users.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        return User.objects.filter(username=username, account__email_validated=True).first()
+
+    def get_user(self, user_id):
+        return User.objects.filter(pk=user_id).first()
+
+
+@override_settings(**LOGIN_TEST_SETTINGS)
+class LoginPipelineTestCase(TestCase):
+    """
+    The number of queries of every login outcome is fixed.
+    """
+    password = 'unitestpassword'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.validated = cls.create_user('validatedUser', email_validated=True, is_active=True)
+        cls.unvalidated = cls.create_user('unvalidatedUser', email_validated=False, is_active=False)
+        cls.inactive = cls.create_user('inactiveUser', email_validated=True, is_active=False)
+
+    @classmethod
+    def create_user(cls, username, email_validated, is_active):
+        with override_settings(**LOGIN_TEST_SETTINGS):
+            user = User.objects.create_user(username=username, password=cls.password, email=f'{username}@unittest.com', is_active=is_active)
+        Account.objects.filter(user=user).update(email_validated=email_validated, is_active=is_active)
+        return user
+
+    def login(self, username, password, queries):
+        request = build_request(data={'username': username, 'password': password})
+        with self.assertNumQueries(queries):
+            return AccountService.process_login_request(request)
+
+    def test_success(self):
+        result = self.login('validatedUser', self.password, queries=2)
+        self.assertTrue(result['user_logged'])
+        self.assertEqual(result['user'], self.validated)
+
+    @override_settings(AUTHENTICATION_BACKENDS=['accounts.backends.UsernameOrEmailBackend'])
+    def test_success_by_email(self):
+        # the username and the email lookups, then the last_login update.
+        result = self.login('ValidatedUser@UNITTEST.com', self.password, queries=3)
+        self.assertTrue(result['user_logged'])
+        self.assertEqual(result['user'], self.validated)
+
+    def test_email_needs_the_backend(self):
+        result = self.login('validatedUser@unittest.com', self.password, queries=1)
+        self.assertFalse(result['user_logged'])
+
+    @override_settings(AUTHENTICATION_BACKENDS=['accounts.backends.UsernameOrEmailBackend'])
+    def test_username_is_not_taken_over_by_an_email(self):
+        with override_settings(**LOGIN_TEST_SETTINGS):
+            owner = User.objects.create_user(username='owner@unittest.com', password=self.password, email='owner.other@unittest.com')
+            squatter = User.objects.create_user(username='squatter', password='squatterpassword', email='OWNER@unittest.com')
+        Account.objects.filter(user=owner).update(email_validated=True, is_active=True)
+        Account.objects.filter(user=squatter).update(email_validated=True, is_active=True)
+        self.assertEqual(self.login('owner@unittest.com', self.password, queries=3)['user'], owner)
+        self.assertEqual(self.login('owner@unittest.com', 'squatterpassword', queries=3)['user'], squatter)
+
+    def test_bad_password(self):
+        result = self.login('validatedUser', 'wrongpassword', queries=1)
+        self.assertFalse(result['user_logged'])
+        self.assertEqual(result['login_error'], ui_strings.ACCOUNT_INVALID_FORM_DATA)
+
+    def test_unknown_user(self):
+        result = self.login('unknownUser', self.password, queries=1)
+        self.assertFalse(result['user_logged'])
+        self.assertEqual(result['login_error'], ui_strings.ACCOUNT_INVALID_FORM_DATA)
+
+    def test_unknown_user_hashes_a_password(self):
+        with mock.patch('accounts.account_services.hashing.make_password', wraps=hashing.make_password) as make_password:
+            self.login('unknownUser', self.password, queries=1)
+        make_password.assert_called_once_with(self.password)
+
+    @override_settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.AllowAllUsersModelBackend'])
+    def test_backend_is_recorded(self):
+        # the backend decides whether an inactive user may log in.
+        request = build_request(data={'username': 'inactiveUser', 'password': self.password})
+        result = AccountService.process_login_request(request)
+        self.assertTrue(result['user_logged'])
+        self.assertEqual(request.session[BACKEND_SESSION_KEY], 'django.contrib.auth.backends.AllowAllUsersModelBackend')
+
+    @override_settings(AUTHENTICATION_BACKENDS=['accounts.tests.test_account_services.UsernameOnlyBackend'])
+    def test_other_backends_authenticate(self):
+        request = build_request(data={'username': 'validatedUser', 'password': 'anypassword'})
+        result = AccountService.process_login_request(request)
+        self.assertTrue(result['user_logged'])
+        self.assertEqual(request.session[BACKEND_SESSION_KEY], 'accounts.tests.test_account_services.UsernameOnlyBackend')
+
+    def test_unvalidated(self):
+        result = self.login('unvalidatedUser', self.password, queries=1)
+        self.assertFalse(result['user_logged'])
+        self.assertEqual(result['login_error'], ui_strings.LOGIN_ACCOUNT_EMAIL_NON_VALIDATED_ERROR)
+
+    def test_inactive(self):
+        result = self.login('inactiveUser', self.password, queries=1)
+        self.assertFalse(result['user_logged'])
+        self.assertEqual(result['login_error'], ui_strings.LOGIN_USER_INACTIVE_ERROR)
+
+    def test_invalid_form(self):
+        result = self.login('ab', self.password, queries=0)
+        self.assertFalse(result['user_logged'])
+        self.assertIn('form', result)
+
+
+class LocalCustomerIdAllocator(CustomerIdAllocator):
+    """
+    Allocator reserving its blocks in memory, keeping the counter queries out of the budgets : they
+    depend on the database and on the reserved blocks. See test_allocator_query_budget.
+    """
+    counter = itertools.count()
+
+    def _reserve(self, needed):
+        self._permutation = KeyedPermutation(b'tests')
+        start = next(self.counter) * self.block_size
+        return [(start, start + self.block_size)]
+
+
+REGISTRATION_DATA = {
+    'username': 'newUser',
+    'first_name': 'new',
+    'last_name': 'user',
+    'email': 'new@unittest.com',
+    'password1': 'Unit-Test-Passw0rd',
+    'password2': 'Unit-Test-Passw0rd',
+}
+
+
+# some backends log the transaction control statements, others don't.
+TRANSACTION_CONTROL = re.compile(r'^\s*(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE SAVEPOINT)\b', re.IGNORECASE)
+
+
+@override_settings(ACCOUNTS_CUSTOMER_ID_ALLOCATOR={'BACKEND': 'accounts.tests.test_account_services.LocalCustomerIdAllocator'}, **LOGIN_TEST_SETTINGS)
+class RegistrationTestCase(TransactionTestCase):
+    """
+    A TransactionTestCase, so the budgets count the statements of a real transaction.
+    """
+
+    def register(self, data, queries):
+        request = build_request(data=data)
+        with CaptureQueriesContext(connection) as context:
+            result = AccountService.process_registration_request(request)
+        statements = [query['sql'] for query in context.captured_queries if not TRANSACTION_CONTROL.match(query['sql'])]
+        if queries is None:
+            result['statements'] = statements
+        else:
+            self.assertEqual(len(statements), queries, '\n'.join(statements))
+        return result
+
+    def test_registration_query_budget(self):
+        # email check, user INSERT and account INSERT
+        result = self.register(REGISTRATION_DATA, queries=3)
+        self.assertTrue(result['user_created'])
+        account = Account.objects.select_related('user').get(account_uuid=result['account_uuid'])
+        self.assertEqual(account.user.username, 'newUser')
+        self.assertFalse(account.user.is_active)
+        self.assertFalse(account.email_validated)
+        self.assertIsNotNone(account.customer_id)
+        self.assertIsNotNone(account.validation_token_expire)
+        self.assertTrue(account.user.check_password(REGISTRATION_DATA['password1']))
+
+    @override_settings(ACCOUNTS_CUSTOMER_ID_ALLOCATOR={})
+    def test_allocator_query_budget(self):
+        result = self.register(REGISTRATION_DATA, queries=None)
+        self.assertTrue(result['user_created'])
+        # on SQLite the counter reserves the single id it needs inside the registration transaction,
+        # the other databases reserve a block on another connection, out of this capture.
+        counter = [sql for sql in result['statements'] if 'accounts_customeridsequence' in sql or 'nextval' in sql]
+        self.assertLessEqual(len(counter), 3)
+        self.assertEqual(len(result['statements']) - len(counter), 3)
+
+    def test_taken_username(self):
+        User.objects.create(username='newUser', email='other@unittest.com')
+        # email check and the failing user INSERT
+        result = self.register(REGISTRATION_DATA, queries=2)
+        self.assertFalse(result['user_created'])
+        self.assertIn('username', result['form'].errors)
+        self.assertEqual(User.objects.filter(username='newUser').count(), 1)
+        self.assertEqual(Account.objects.count(), 1)
+
+    def test_taken_email(self):
+        User.objects.create(username='otherUser', email='new@unittest.com')
+        result = self.register(REGISTRATION_DATA, queries=1)
+        self.assertFalse(result['user_created'])
+        self.assertIn('email', result['form'].errors)
+
+    def test_taken_email_in_another_case(self):
+        User.objects.create(username='otherUser', email='NEW@unittest.com')
+        result = self.register(REGISTRATION_DATA, queries=1)
+        self.assertFalse(result['user_created'])
+        self.assertIn('email', result['form'].errors)
+
+    def test_email_taken_since_the_check(self):
+        User.objects.create(username='otherUser', email='new@unittest.com')
+        # the email is registered by someone else after the check : the account INSERT fails.
+        with mock.patch('accounts.forms.bloom.may_contain_email', return_value=False):
+            # user INSERT, the failing account INSERT and the email check.
+            result = self.register(REGISTRATION_DATA, queries=3)
+        self.assertFalse(result['user_created'])
+        self.assertIn('email', result['form'].errors)
+        self.assertFalse(User.objects.filter(username='newUser').exists())
+
+    def test_other_account_conflicts_are_raised(self):
+        user = User.objects.create(username='otherUser', email='other@unittest.com')
+        account = Account.objects.get(user=user)
+        with mock.patch('accounts.customer_ids.allocate_customer_id', return_value=account.customer_id):
+            with self.assertRaises(IntegrityError) as context:
+                AccountService.create_user_account(User(username='newUser', email='new@unittest.com'))
+        self.assertNotIsInstance(context.exception, account_services.EmailInUseError)
+
+
+class SendValidationTestCase(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create_user(username='cooldownUser', email='cooldown@unittest.com', password='cooldownpassword')
+        self.account = Account.objects.get(user=self.user)
+
+    @override_settings(ACCOUNTS_VALIDATION_MAIL_COOLDOWN=300)
+    def test_second_request_is_skipped(self):
+        self.assertTrue(AccountService.send_validation(self.account))
+        token = Account.objects.get(pk=self.account.pk).email_validation_token
+        with self.assertNumQueries(0):
+            self.assertTrue(AccountService.send_validation(self.account))
+        self.assertEqual(Account.objects.get(pk=self.account.pk).email_validation_token, token)
+        self.assertEqual(OutgoingMail.objects.count(), 1)
+
+    def test_only_the_token_is_written(self):
+        with CaptureQueriesContext(connection) as queries:
+            AccountService.send_validation(self.account)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('"telefon"', updates[0])
+
+    def test_expired_token_is_sent_again(self):
+        AccountService.send_validation(self.account)
+        Account.objects.filter(pk=self.account.pk).update(validation_token_expire=timezone.now() - datetime.timedelta(minutes=1))
+        account = Account.objects.get(pk=self.account.pk)
+        self.assertTrue(AccountService.send_validation(account))
+        self.assertEqual(OutgoingMail.objects.count(), 2)
+
+    @override_settings(ACCOUNTS_VALIDATION_MAIL_COOLDOWN=0)
+    def test_cooldown_disabled(self):
+        AccountService.send_validation(self.account)
+        AccountService.send_validation(self.account)
+        self.assertEqual(OutgoingMail.objects.count(), 2)
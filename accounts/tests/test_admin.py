@@ -0,0 +1,54 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from accounts.models import Account
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AdminChangelistTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='changelistAdmin', email='admin@unittest.com', password='unitestpassword')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def create_users(self, count, start=0):
+        for i in range(start, start + count):
+            User.objects.create_user(username=f'changelistUser{i}', email=f'changelist{i}@unittest.com')
+
+    def count_queries(self, url, data=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_account_changelist_queries_do_not_grow_with_rows(self):
+        url = reverse('admin:accounts_account_changelist')
+        self.create_users(2)
+        queries = self.count_queries(url)
+        self.create_users(20, start=2)
+        self.assertEqual(self.count_queries(url), queries)
+        self.assertEqual(self.count_queries(url, {'account_type__exact': 3, 'email_validated__exact': 0}), queries)
+
+    def test_user_changelist_queries_do_not_grow_with_rows(self):
+        url = reverse('admin:auth_user_changelist')
+        self.create_users(2)
+        queries = self.count_queries(url)
+        self.create_users(20, start=2)
+        self.assertEqual(self.count_queries(url), queries)
+
+    def test_account_search(self):
+        self.create_users(3)
+        account = Account.objects.get(user__username='changelistUser1')
+        url = reverse('admin:accounts_account_changelist')
+        response = self.client.get(url, {'q': 'changelistUser'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+        response = self.client.get(url, {'q': str(account.customer_id)})
+        self.assertEqual(list(response.context['cl'].result_list), [account])
+        # search is a prefix search : inner substrings do not match.
+        response = self.client.get(url, {'q': 'User1'})
+        self.assertEqual(response.context['cl'].result_count, 0)
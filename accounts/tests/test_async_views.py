@@ -0,0 +1,64 @@
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from accounts.models import Account
+from accounts.account_services import AccountService
+from accounts.resources import ui_strings
+from accounts.tokens_gen import validation_token_generator
+from accounts.tests.test_account_services import LOGIN_TEST_SETTINGS, REGISTRATION_DATA, build_request
+
+
+class FastPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    iterations = 1
+
+
+@override_settings(**LOGIN_TEST_SETTINGS)
+class AsyncLoginTestCase(TestCase):
+    password = 'unitestpassword'
+
+    @classmethod
+    def setUpTestData(cls):
+        with override_settings(**LOGIN_TEST_SETTINGS):
+            cls.user = User.objects.create_user(username='asyncUser', password=cls.password, email='asyncUser@unittest.com')
+        Account.objects.filter(user=cls.user).update(email_validated=True, is_active=True)
+
+    async def test_success(self):
+        request = build_request(data={'username': 'asyncUser', 'password': self.password})
+        result = await AccountService.aprocess_login_request(request)
+        self.assertTrue(result['user_logged'])
+        self.assertEqual(result['user'], self.user)
+        self.assertEqual(request.session['_auth_user_id'], str(self.user.pk))
+
+    async def test_bad_password(self):
+        request = build_request(data={'username': 'asyncUser', 'password': 'wrongpassword'})
+        result = await AccountService.aprocess_login_request(request)
+        self.assertFalse(result['user_logged'])
+        self.assertEqual(result['login_error'], ui_strings.ACCOUNT_INVALID_FORM_DATA)
+
+    @override_settings(PASSWORD_HASHERS=['accounts.tests.test_async_views.FastPBKDF2PasswordHasher', 'django.contrib.auth.hashers.MD5PasswordHasher'])
+    async def test_outdated_hash_is_upgraded(self):
+        request = build_request(data={'username': 'asyncUser', 'password': self.password})
+        result = await AccountService.aprocess_login_request(request)
+        self.assertTrue(result['user_logged'])
+        user = await User.objects.aget(pk=self.user.pk)
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+
+
+@override_settings(**LOGIN_TEST_SETTINGS)
+class AsyncRegistrationTestCase(TestCase):
+
+    async def test_registration(self):
+        result = await AccountService.aprocess_registration_request(build_request(data=REGISTRATION_DATA))
+        self.assertTrue(result['user_created'])
+        account = await Account.objects.select_related('user').aget(account_uuid=result['account_uuid'])
+        self.assertFalse(account.user.is_active)
+        self.assertTrue(account.user.check_password(REGISTRATION_DATA['password1']))
+
+    async def test_email_validation(self):
+        result = await AccountService.aprocess_registration_request(build_request(data=REGISTRATION_DATA))
+        account = await Account.objects.aget(account_uuid=result['account_uuid'])
+        result = await AccountService.avalidate_email(account.account_uuid, validation_token_generator.make_token(account))
+        self.assertTrue(result['validated'])
+        account = await Account.objects.select_related('user').aget(pk=account.pk)
+        self.assertTrue(account.email_validated)
+        self.assertTrue(account.user.is_active)
@@ -0,0 +1,76 @@
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from accounts.backends import get_users_by_username_or_email
+from accounts.models import Account
+from accounts.tests.test_account_services import LOGIN_TEST_SETTINGS
+
+
+@override_settings(AUTHENTICATION_BACKENDS=['accounts.backends.UsernameOrEmailBackend'], **LOGIN_TEST_SETTINGS)
+class UsernameOrEmailBackendTestCase(TestCase):
+    password = 'backendpassword'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='backendUser', email='Backend.User@UnitTest.com', password=self.password)
+        Account.objects.filter(user=self.user).update(email_validated=True)
+
+    def test_account_gets_the_normalized_email(self):
+        self.assertEqual(Account.objects.get(user=self.user).normalized_email, 'backend.user@unittest.com')
+
+    def test_authenticate_by_username(self):
+        self.assertEqual(authenticate(username='backendUser', password=self.password), self.user)
+
+    def test_authenticate_by_email_in_any_case(self):
+        self.assertEqual(authenticate(username='BACKEND.user@unittest.COM', password=self.password), self.user)
+
+    def test_wrong_password(self):
+        self.assertIsNone(authenticate(username='backend.user@unittest.com', password='wrongpassword'))
+
+    def test_unknown_user(self):
+        self.assertIsNone(authenticate(username='nobody@unittest.com', password=self.password))
+
+    def test_lookup_is_one_query(self):
+        with self.assertNumQueries(1):
+            users = get_users_by_username_or_email('backend.user@unittest.com', by_username=False)
+            self.assertEqual(users[0].account.normalized_email, 'backend.user@unittest.com')
+
+    def test_unvalidated_email_is_not_accepted(self):
+        Account.objects.filter(user=self.user).update(email_validated=False)
+        self.assertIsNone(authenticate(username='backend.user@unittest.com', password=self.password))
+
+    def test_username_containing_an_at(self):
+        user = User.objects.create_user(username='at@user', email='other@unittest.com', password=self.password)
+        self.assertEqual(get_users_by_username_or_email('at@user'), [user])
+
+    def test_email_registered_as_another_username(self):
+        owner = User.objects.create_user(username='owner@unittest.com', email='other@unittest.com', password=self.password)
+        squatter = User.objects.create_user(username='squatter', email='OWNER@unittest.com', password='squatterpassword')
+        Account.objects.filter(user=squatter).update(email_validated=True)
+        self.assertEqual(get_users_by_username_or_email('owner@unittest.com'), [owner, squatter])
+        self.assertEqual(authenticate(username='owner@unittest.com', password=self.password), owner)
+        self.assertEqual(authenticate(username='owner@unittest.com', password='squatterpassword'), squatter)
+
+    def test_email_change_is_synced(self):
+        self.user.email = 'Changed@unittest.com'
+        self.user.save()
+        self.assertEqual(Account.objects.get(user=self.user).normalized_email, 'changed@unittest.com')
+        self.assertEqual(get_users_by_username_or_email('changed@unittest.com'), [self.user])
+
+    def test_duplicate_email_is_refused(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user(username='otherUser', email='backend.user@unittest.com')
+        other = User.objects.create_user(username='otherUser', email='other@unittest.com')
+        other.email = 'BACKEND.user@unittest.com'
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            other.save()
+        self.assertEqual(get_users_by_username_or_email('backend.user@unittest.com'), [self.user])
+
+    def test_unchanged_email_is_not_written(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Changed'
+        with self.assertNumQueries(1):
+            user.save()
+        user.email = 'backend.USER@unittest.com'
+        with self.assertNumQueries(1):
+            user.save()
@@ -0,0 +1,31 @@
+from django.test import TestCase
+from accounts.benchmarks import runner, seed
+
+
+class BenchmarkRunnerTestCase(TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(runner.percentile(values, 50), 50)
+        self.assertEqual(runner.percentile(values, 99), 99)
+        self.assertEqual(runner.percentile([3.0], 90), 3.0)
+        self.assertEqual(runner.percentile([], 50), 0.0)
+
+    def test_compare(self):
+        reference = {'p50': 1.0, 'p90': 2.0, 'p99': 10.0, 'max_queries': 2}
+        baseline = {'10000': {'validate_email': reference}}
+        self.assertEqual(runner.compare({'10000': {'validate_email': dict(reference, p99=11.0)}}, baseline, latency=True), [])
+        self.assertEqual(runner.compare({'10000': {'validate_email': dict(reference, p50=1.4)}}, baseline, latency=True), [])
+        self.assertEqual(len(runner.compare({'10000': {'validate_email': dict(reference, p99=20.0, max_queries=3)}}, baseline, latency=True)), 2)
+        self.assertEqual(runner.compare({'100000': {'validate_email': dict(reference, p99=20.0)}}, baseline, latency=True), [])
+        # by default, only the query counts are compared.
+        self.assertEqual(runner.compare({'10000': {'validate_email': dict(reference, p99=20.0)}}, baseline), [])
+        self.assertEqual(len(runner.compare({'10000': {'validate_email': dict(reference, max_queries=3)}}, baseline)), 1)
+
+    def test_run(self):
+        seed.seed(200)
+        self.assertEqual(seed.seeded_count(), 200)
+        results = runner.run(200, iterations=5, warmup=1)
+        self.assertEqual(set(results), set(runner.OPERATIONS))
+        self.assertEqual(results['account_context']['max_queries'], 1)
+        self.assertEqual(seed.seeded_count(), 200)
@@ -0,0 +1,87 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from accounts import bloom
+from accounts.account_services import AccountService
+
+EXISTENCE_INDEX_SETTINGS = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'ACCOUNTS_EXISTENCE_INDEX': {'BACKEND': 'accounts.bloom.ExistenceIndex', 'CAPACITY': 1000},
+}
+
+
+class BloomFilterTestCase(TestCase):
+
+    def test_no_false_negatives(self):
+        bloom_filter = bloom.BloomFilter(1000, 0.01)
+        values = [f'user{i}' for i in range(1000)]
+        bloom_filter.update(values)
+        self.assertTrue(all(value in bloom_filter for value in values))
+        false_positives = sum(f'other{i}' in bloom_filter for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_dumps_loads(self):
+        bloom_filter = bloom.BloomFilter(100)
+        bloom_filter.add('value')
+        self.assertIn('value', bloom.BloomFilter.loads(bloom_filter.dumps()))
+
+
+@override_settings(**EXISTENCE_INDEX_SETTINGS)
+class ExistenceIndexTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user(username='existingUser', email='existing@unittest.com', password='unitestpassword')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_maybe_until_built(self):
+        self.assertTrue(bloom.may_contain_username('unknownUser'))
+        self.assertEqual(bloom.rebuild(), 1)
+        self.assertFalse(bloom.may_contain_username('unknownUser'))
+        self.assertTrue(bloom.may_contain_username('existingUser'))
+        self.assertTrue(bloom.may_contain_email('Existing@unittest.com'))
+
+    def test_new_users_are_seen_by_other_processes(self):
+        bloom.rebuild()
+        other_process = bloom.ExistenceIndex(CAPACITY=1000)
+        self.assertFalse(other_process.may_contain(bloom.username_key('newUser')))
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user(username='newUser', email='new@unittest.com')
+        self.assertTrue(other_process.may_contain(bloom.username_key('newUser')))
+        self.assertTrue(other_process.may_contain(bloom.email_key('new@unittest.com')))
+
+    def test_delta_is_added_on_commit(self):
+        bloom.rebuild()
+        index = bloom.get_existence_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user(username='newUser')
+            # a rebuild now would skip a delta numbered before the commit, and miss the user.
+            self.assertEqual(cache.get(index.counter_key), 0)
+        self.assertEqual(cache.get(index.counter_key), 1)
+        self.assertTrue(bloom.may_contain_username('newUser'))
+
+    def test_missing_delta_answers_maybe(self):
+        bloom.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user(username='newUser')
+        cache.delete(bloom.get_existence_index().delta_key(1))
+        self.assertTrue(bloom.ExistenceIndex(CAPACITY=1000).may_contain(bloom.username_key('unknownUser')))
+
+    def test_unknown_user_login_without_query(self):
+        bloom.rebuild()
+        with self.assertNumQueries(0):
+            self.assertEqual(AccountService.get_login_users('unknownUser'), [])
+
+    def test_availability(self):
+        bloom.rebuild()
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('accounts:availability'), {'username': 'freeUser', 'email': 'free@unittest.com'})
+        self.assertEqual(response.json(), {
+            'username': {'value': 'freeUser', 'available': True},
+            'email': {'value': 'free@unittest.com', 'available': True},
+        })
+        response = self.client.get(reverse('accounts:availability'), {'username': 'existingUser'})
+        self.assertFalse(response.json()['username']['available'])
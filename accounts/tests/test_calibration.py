@@ -0,0 +1,47 @@
+from django.contrib.auth import hashers
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from accounts import calibration
+import io
+
+PBKDF2 = 'django.contrib.auth.hashers.PBKDF2PasswordHasher'
+MD5 = 'django.contrib.auth.hashers.MD5PasswordHasher'
+
+
+class CalibrationTestCase(TestCase):
+
+    def test_candidates(self):
+        candidates = calibration.get_candidates(PBKDF2)
+        iterations = hashers.PBKDF2PasswordHasher.iterations
+        self.assertEqual([candidate.params['iterations'] for candidate in candidates], [iterations // 4, iterations // 2, iterations, iterations * 2])
+        self.assertEqual([candidate.params for candidate in calibration.get_candidates(MD5)], [{}])
+
+    def test_recommend(self):
+        cheap = calibration.Candidate(PBKDF2, {'iterations': 1000})
+        expensive = calibration.Candidate(PBKDF2, {'iterations': 100000})
+        results = [
+            (cheap, [{'concurrency': 1, 'p50': 1, 'p95': 2, 'rate': 500}]),
+            (expensive, [{'concurrency': 1, 'p50': 100, 'p95': 120, 'rate': 8}, {'concurrency': 4, 'p50': 110, 'p95': 130, 'rate': 30}]),
+        ]
+        self.assertIs(calibration.recommend(results, 250, 10)[PBKDF2][0], expensive)
+        self.assertIs(calibration.recommend(results, 100, 10)[PBKDF2][0], cheap)
+        self.assertIsNone(calibration.recommend(results, 1, 10)[PBKDF2][0])
+
+    @override_settings(PASSWORD_HASHERS=[PBKDF2, MD5])
+    def test_hash_distribution(self):
+        User.objects.create(username='md5User', password=hashers.make_password('calibrationpassword', hasher='md5'))
+        User.objects.create(username='pbkdf2User', password=hashers.make_password('calibrationpassword'))
+        User.objects.create_user(username='unusableUser')
+        distribution = calibration.hash_distribution()
+        self.assertEqual(distribution[('pbkdf2_sha256', f'iterations={hashers.PBKDF2PasswordHasher.iterations}', False)], 1)
+        self.assertEqual(distribution[('unusable', '', False)], 1)
+        self.assertEqual(distribution[('md5', '', True)], 1)
+
+    @override_settings(PASSWORD_HASHERS=[MD5])
+    def test_command(self):
+        User.objects.create_user(username='md5User', password='calibrationpassword')
+        out = io.StringIO()
+        call_command('calibrate_hashers', concurrency='1,2', count=4, stdout=out)
+        self.assertIn(f'{MD5} : md5', out.getvalue())
+        self.assertIn('Stored password hashes of 1 users', out.getvalue())
@@ -0,0 +1,64 @@
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from accounts.models import Account, OutgoingMail
+from accounts.account_services import AccountService
+from accounts import campaigns
+import datetime
+import io
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class ValidationCampaignTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # registered users are inactive until they validate their email.
+        for i in range(7):
+            cls.register(f'campaignUser{i}', f'campaign{i}@unittest.com')
+        Account.objects.filter(user__username='campaignUser0').update(validation_token_expire=timezone.now() - datetime.timedelta(days=1))
+        # imported users are active before they validate their email.
+        imported, account = cls.register('importedUser', 'imported@unittest.com')
+        User.objects.filter(pk=imported.pk).update(is_active=True)
+        validated, account = cls.register('validatedUser', 'validated@unittest.com')
+        Account.objects.filter(user=validated).update(email_validated=True, is_active=True)
+        User.objects.filter(pk=validated.pk).update(is_active=True)
+
+    @classmethod
+    def register(cls, username, email):
+        return AccountService.create_user_account(User(username=username, email=email, password=make_password(None)))
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_campaign(self):
+        tokens = dict(Account.objects.values_list('pk', 'email_validation_token'))
+        result = campaigns.send_validation_campaign(batch_size=3, connections=2)
+        self.assertEqual((result.sent, result.failed, result.skipped), (8, 0, 0))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), sorted([f'campaign{i}@unittest.com' for i in range(7)] + ['imported@unittest.com']))
+        self.assertFalse(OutgoingMail.objects.exists())
+        expired = Account.objects.get(user__username='campaignUser0')
+        self.assertNotEqual(expired.email_validation_token, tokens[expired.pk])
+        self.assertGreater(expired.validation_token_expire, timezone.now())
+        valid = Account.objects.get(user__username='campaignUser1')
+        self.assertEqual(valid.email_validation_token, tokens[valid.pk])
+        self.assertIn(valid.get_validation_url(), mail.outbox[[message.to[0] for message in mail.outbox].index('campaign1@unittest.com')].body)
+
+    @override_settings(ACCOUNTS_VALIDATION_MAIL_COOLDOWN=300)
+    def test_cooldown(self):
+        AccountService.send_validation(Account.objects.get(user__username='campaignUser1'))
+        result = campaigns.send_validation_campaign()
+        self.assertEqual((result.sent, result.skipped), (7, 1))
+        self.assertFalse(AccountService.send_validation(Account.objects.get(user__username='validatedUser')))
+        self.assertTrue(AccountService.send_validation(Account.objects.get(user__username='campaignUser2')))
+        self.assertEqual(OutgoingMail.objects.count(), 1)
+
+    def test_command_dry_run(self):
+        out = io.StringIO()
+        call_command('send_validation_campaign', dry_run=True, limit=5, stdout=out)
+        self.assertIn('[dry-run] 5 mails sent', out.getvalue())
+        self.assertEqual(mail.outbox, [])
@@ -0,0 +1,43 @@
+from django.test import TestCase, RequestFactory
+from django.contrib.auth.models import User, AnonymousUser
+from accounts.models import Account
+from accounts.account_services import AccountService
+from accounts.context_processors import account_context
+
+
+class AccountContextTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='contextUser', email='context@unittest.com', first_name='context', last_name='user')
+        cls.other = User.objects.create(username='otherUser', email='other@unittest.com', first_name='other', last_name='user')
+
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def test_anonymous_user_has_no_account(self):
+        self.request.user = AnonymousUser()
+        with self.assertNumQueries(0):
+            context = account_context(self.request)
+        self.assertIsNone(context['account'])
+
+    def test_account_is_lazy(self):
+        with self.assertNumQueries(0):
+            account_context(self.request)
+
+    def test_account_is_loaded_once_per_request(self):
+        context = account_context(self.request)
+        with self.assertNumQueries(1):
+            self.assertEqual(context['account'].user, self.user)
+            account = AccountService.get_request_account(self.request)
+            self.assertEqual(account.pk, self.user.account.pk)
+            same = AccountService.get_request_account(self.request, account.account_uuid)
+            self.assertIs(same, account)
+
+    def test_other_account_is_not_memoized(self):
+        other_account = Account.objects.get(user=self.other)
+        with self.assertNumQueries(1):
+            account = AccountService.get_request_account(self.request, other_account.account_uuid)
+        self.assertEqual(account.pk, other_account.pk)
+        with self.assertNumQueries(1):
+            AccountService.get_request_account(self.request)
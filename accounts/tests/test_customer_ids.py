@@ -0,0 +1,67 @@
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.db import connection
+from accounts.models import Account, CustomerIdSequence
+from accounts.customer_ids import CustomerIdAllocator, KeyedPermutation
+from accounts import customer_ids as customer_ids_allocator
+from accounts import constants
+
+
+class KeyedPermutationTestCase(TestCase):
+    def test_is_a_permutation(self):
+        permutation = KeyedPermutation(b'secret', domain=1000)
+        self.assertEqual(sorted(permutation.permute(value) for value in range(1000)), list(range(1000)))
+
+    def test_depends_on_the_key(self):
+        values = range(100)
+        first = [KeyedPermutation(b'first').permute(value) for value in values]
+        second = [KeyedPermutation(b'second').permute(value) for value in values]
+        self.assertNotEqual(first, second)
+        self.assertTrue(all(0 <= value < constants.CUSTOMER_ID_SPACE for value in first))
+
+    def test_rejects_values_out_of_domain(self):
+        with self.assertRaises(ValueError):
+            KeyedPermutation(b'secret', domain=10).permute(10)
+
+
+class CustomerIdAllocatorTestCase(TestCase):
+    def test_allocated_ids_are_unique(self):
+        first, second = CustomerIdAllocator(BLOCK_SIZE=7), CustomerIdAllocator(BLOCK_SIZE=7)
+        customer_ids = first.allocate_many(20) + second.allocate_many(20) + [first.allocate() for _ in range(10)]
+        self.assertEqual(len(set(customer_ids)), 50)
+
+    def test_ids_are_not_sequential(self):
+        customer_ids = CustomerIdAllocator().allocate_many(10)
+        self.assertNotEqual(customer_ids, sorted(customer_ids))
+
+    def test_reservation_inside_a_transaction_is_not_kept(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("only SQLite reserves inside the transaction of the caller")
+        allocator = CustomerIdAllocator(BLOCK_SIZE=50)
+        allocator.allocate()
+        self.assertEqual(allocator._ranges, [])
+
+    def test_reservation_inside_a_transaction_is_made_apart(self):
+        if connection.vendor in ('sqlite', 'postgresql'):
+            self.skipTest("the counter is not a row updated apart on this database")
+        allocator = CustomerIdAllocator(BLOCK_SIZE=50)
+        with self.assertNumQueries(0):
+            allocator.allocate()
+        start, end = allocator._ranges[0]
+        self.assertEqual(end - start, 49)
+
+    def test_account_default(self):
+        users = [User.objects.create(username=f'allocatorUser{i}') for i in range(5)]
+        customer_ids = set(Account.objects.filter(user__in=users).values_list('customer_id', flat=True))
+        self.assertEqual(len(customer_ids), 5)
+        self.assertNotIn(None, customer_ids)
+
+    def test_legacy_ids_are_skipped(self):
+        user = User.objects.create(username='legacyUser')
+        account = Account.objects.get(user=user)
+        for check_taken in (False, True):
+            # the next allocated id, already given to an account before the allocator existed.
+            legacy_id = CustomerIdAllocator().preview_many(CustomerIdSequence.objects.get().next_value + 1)[-1]
+            Account.objects.filter(pk=account.pk).update(customer_id=legacy_id)
+            with override_settings(ACCOUNTS_CUSTOMER_ID_ALLOCATOR={'CHECK_TAKEN': check_taken}):
+                self.assertEqual(customer_ids_allocator.allocate_customer_id() == legacy_id, not check_taken)
@@ -0,0 +1,49 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from accounts.models import Account
+from accounts import exports
+import csv
+import io
+import json
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ExportAccountsTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(5):
+            user = User.objects.create_user(username=f'exportUser{i}', email=f'export{i}@unittest.com', first_name='Export', last_name=str(i))
+            Account.objects.filter(user=user).update(newsletter=i % 2 == 0, email_validated=True)
+        cls.admin = User.objects.create_superuser(username='exportAdmin', email='admin@unittest.com', password='unitestpassword')
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            content = ''.join(exports.export_accounts('csv'))
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]['username'], 'exportUser0')
+        self.assertEqual(rows[0]['account_type'], 'PRIVATE')
+
+    def test_filters(self):
+        filters = exports.parse_filters({'newsletter': 'yes', 'email_validated': '1'})
+        lines = ''.join(exports.export_accounts('jsonl', **filters)).splitlines()
+        self.assertEqual([json.loads(line)['username'] for line in lines], ['exportUser0', 'exportUser2', 'exportUser4'])
+        with self.assertRaises(ValueError):
+            exports.parse_filters({'account_type': '42'})
+
+    def test_admin_export(self):
+        self.client.force_login(self.admin)
+        self.assertContains(self.client.get(reverse('admin:accounts_account_changelist')), reverse('admin:accounts_account_export'))
+        response = self.client.get(reverse('admin:accounts_account_export'), {'format': 'jsonl', 'newsletter': 'no'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('export_accounts', newsletter='yes', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 4)
@@ -0,0 +1,57 @@
+from concurrent.futures import Future
+from unittest import mock
+from django.contrib.auth.models import User
+from django.test import RequestFactory, TestCase, override_settings
+from accounts import hashing
+from accounts.decorators import shed_hashing_overload
+from accounts.forms import AccountPasswordChangeForm
+from accounts.tests.test_account_services import LOGIN_TEST_SETTINGS
+
+
+class BlockedExecutor:
+    """
+    Executor whose calls never complete, so that they stay in flight.
+    """
+
+    def submit(self, func, *args):
+        return Future()
+
+
+@override_settings(ACCOUNTS_PASSWORD_HASHING={'MAX_WORKERS': 1, 'MAX_QUEUE': 2, 'RETRY_AFTER': 7}, **LOGIN_TEST_SETTINGS)
+class HashingExecutorTestCase(TestCase):
+
+    def test_hashes_in_executor(self):
+        encoded = hashing.make_password('unitestpassword')
+        self.assertTrue(encoded.startswith('md5$'))
+        stats = hashing.get_stats()
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertGreaterEqual(stats['completed'], 1)
+
+    def test_queue_full(self):
+        with mock.patch.object(hashing, 'get_executor', return_value=BlockedExecutor()):
+            futures = [hashing.submit(hashing.hashers.make_password, 'password') for _ in range(2)]
+            with self.assertRaises(hashing.HashingQueueFull):
+                hashing.submit(hashing.hashers.make_password, 'password')
+            for future in futures:
+                future.cancel()
+        self.assertEqual(hashing.get_stats()['in_flight'], 0)
+
+    def test_queue_full_answers_503(self):
+        @shed_hashing_overload
+        def view(request):
+            raise hashing.HashingQueueFull()
+        response = view(RequestFactory().post('/accounts/login/'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '7')
+
+    def test_password_change_form(self):
+        with override_settings(**LOGIN_TEST_SETTINGS):
+            user = User.objects.create_user(username='hashingUser', password='oldpassword')
+        form = AccountPasswordChangeForm(user, {'old_password': 'wrongpassword', 'new_password1': 'N3w-passw0rd!', 'new_password2': 'N3w-passw0rd!'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('old_password', form.errors)
+        form = AccountPasswordChangeForm(user, {'old_password': 'oldpassword', 'new_password1': 'N3w-passw0rd!', 'new_password2': 'N3w-passw0rd!'})
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('N3w-passw0rd!'))
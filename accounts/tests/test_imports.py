@@ -0,0 +1,74 @@
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from accounts.models import Account
+from accounts import imports
+from accounts.tests.test_account_services import LOGIN_TEST_SETTINGS
+import io
+import json
+import os
+import tempfile
+
+CSV_ROWS = """username,email,first_name,last_name,password,newsletter,account_type,date_of_birth
+importedUser1,imported1@unittest.com,Imported,One,importpassword,yes,1,1980-05-01
+importedUser2,imported2@unittest.com,Imported,Two,,no,,
+importedUser1,duplicate@unittest.com,Imported,Duplicate,,,,
+ab,short@unittest.com,Too,Short,,,,
+importedUser3,not-an-email,Bad,Email,,,,
+existingUser,existing@unittest.com,Already,There,,,,
+importedUser4,imported4@unittest.com,Imported,Four,,,42,
+"""
+
+
+@override_settings(**LOGIN_TEST_SETTINGS)
+class ImportAccountsTestCase(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(username='existingUser', email='existing@unittest.com')
+
+    @override_settings(ACCOUNTS_CUSTOMER_ID_ALLOCATOR={'CHECK_TAKEN': False})
+    def test_import(self):
+        rejected = []
+        with self.assertNumQueries(7):
+            # 1 username and email check, then SAVEPOINT, users INSERT, accounts INSERT, RELEASE,
+            # and the CustomerIdSequence UPDATE and SELECT.
+            result = imports.import_accounts(
+                imports.read_rows(io.StringIO(CSV_ROWS)),
+                batch_size=100, workers=0,
+                reject=lambda line_number, row, reason: rejected.append((line_number, row['username'])),
+            )
+        self.assertEqual(result, (2, 5))
+        self.assertEqual(rejected, [(4, 'importedUser1'), (5, 'ab'), (6, 'importedUser3'), (8, 'importedUser4'), (7, 'existingUser')])
+        account = Account.objects.select_related('user').get(user__username='importedUser1')
+        self.assertTrue(account.user.check_password('importpassword'))
+        self.assertTrue(account.newsletter)
+        self.assertEqual(account.account_type, 1)
+        self.assertIsNotNone(account.customer_id)
+        self.assertFalse(Account.objects.get(user__username='importedUser2').user.has_usable_password())
+
+    def test_emails_are_unique_whatever_their_case(self):
+        rows = [
+            (1, {'username': 'caseUser1', 'email': 'Case@unittest.com'}),
+            (2, {'username': 'caseUser2', 'email': 'case@UNITTEST.com'}),
+            (3, {'username': 'caseUser3', 'email': 'EXISTING@unittest.com'}),
+        ]
+        rejected = []
+        result = imports.import_accounts(rows, workers=0, reject=lambda line_number, row, reason: rejected.append(line_number))
+        self.assertEqual(result, (1, 2))
+        self.assertEqual(rejected, [2, 3])
+        self.assertEqual(Account.objects.get(user__username='caseUser1').normalized_email, 'case@unittest.com')
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'accounts.jsonl')
+            rejects = os.path.join(directory, 'rejects.jsonl')
+            with open(path, 'w') as f:
+                f.write(json.dumps({'username': 'jsonUser', 'email': 'json@unittest.com', 'password_hash': make_password('jsonpassword')}) + '\n')
+                f.write('not json\n')
+            out = io.StringIO()
+            call_command('import_accounts', path, workers=0, rejects=rejects, stdout=out)
+            with open(rejects) as f:
+                self.assertEqual(json.loads(f.read())['line'], 2)
+        self.assertIn('1 accounts imported, 1 rows rejected', out.getvalue())
+        self.assertTrue(User.objects.get(username='jsonUser').check_password('jsonpassword'))
@@ -0,0 +1,50 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.db import connection
+from django.utils import timezone
+from accounts.models import Account
+import unittest
+
+
+class AccountIndexesTestCase(TestCase):
+    """
+    Checks with EXPLAIN that the account lookups done by the views use an index.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create(username=f'indexUser{i}', email=f'index{i}@unittest.com') for i in range(20)]
+        cls.account = Account.objects.get(user=cls.users[0])
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # the planner prefers a sequential scan on tiny tables.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        elif connection.vendor != 'sqlite':
+            raise unittest.SkipTest(f"no EXPLAIN check for the {connection.vendor} backend")
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan', plan)
+        else:
+            self.assertNotIn('SCAN accounts_account', plan)
+            self.assertIn('USING', plan)
+
+    def test_lookup_by_uuid(self):
+        self.assertUsesIndex(Account.objects.filter(account_uuid=self.account.account_uuid))
+
+    def test_lookup_by_uuid_and_token(self):
+        self.assertUsesIndex(Account.objects.filter(account_uuid=self.account.account_uuid, email_validation_token=self.account.email_validation_token))
+
+    def test_lookup_by_user(self):
+        self.assertUsesIndex(Account.objects.filter(user=self.users[0]))
+
+    def test_lookup_by_customer_id(self):
+        self.assertUsesIndex(Account.objects.filter(customer_id=self.account.customer_id))
+
+    def test_lookup_of_expired_unvalidated_accounts(self):
+        self.assertUsesIndex(Account.objects.filter(email_validated=False, validation_token_expire__lt=timezone.now()))
+
+    def test_lookup_by_normalized_email(self):
+        self.assertUsesIndex(Account.objects.select_related('user').filter(normalized_email='index0@unittest.com'))
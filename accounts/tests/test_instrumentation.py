@@ -0,0 +1,84 @@
+from django.contrib.auth.models import User
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, modify_settings, override_settings
+from django.urls import reverse
+from accounts.models import Account
+from accounts.decorators import instrument_view
+from accounts.tests.test_account_services import LOGIN_TEST_SETTINGS
+from accounts import instrumentation
+
+INSTRUMENTATION_SETTINGS = {'ENABLED': True, 'LOG_REQUESTS': True}
+
+
+class HistogramTestCase(TestCase):
+
+    def test_render(self):
+        registry = instrumentation.Registry()
+        for value in (0.002, 0.02, 20):
+            registry.observe('accounts_view_duration_seconds', 'accounts:login', value)
+        text = registry.render()
+        self.assertIn('# TYPE accounts_view_duration_seconds histogram', text)
+        self.assertIn('accounts_view_duration_seconds_bucket{view="accounts:login",le="0.0025"} 1', text)
+        self.assertIn('accounts_view_duration_seconds_bucket{view="accounts:login",le="0.025"} 2', text)
+        self.assertIn('accounts_view_duration_seconds_bucket{view="accounts:login",le="+Inf"} 3', text)
+        self.assertIn('accounts_view_duration_seconds_count{view="accounts:login"} 3', text)
+
+    def test_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            instrumentation.InstrumentationMiddleware(lambda request: HttpResponse())
+        self.assertIsNone(instrumentation.current_span())
+
+
+@override_settings(ACCOUNTS_INSTRUMENTATION=INSTRUMENTATION_SETTINGS, **LOGIN_TEST_SETTINGS)
+@modify_settings(MIDDLEWARE={'append': 'accounts.instrumentation.InstrumentationMiddleware'})
+class InstrumentationMiddlewareTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='timedUser', email='timed@unittest.com', password='timedpassword')
+        Account.objects.filter(user=user).update(email_validated=True, is_active=True)
+
+    def setUp(self):
+        instrumentation.registry.clear()
+
+    def test_login_timings(self):
+        with self.assertLogs('accounts', 'INFO') as logs:
+            self.client.post(reverse('accounts:login'), {'username': 'timedUser', 'password': 'timedpassword'})
+        timings = [line for line in logs.output if 'view timings' in line]
+        self.assertEqual(len(timings), 1)
+        self.assertIn('"view": "accounts:login"', timings[0])
+        _cumulative, hashing_time, count = instrumentation.registry.get_histogram('accounts_view_hashing_seconds', 'accounts:login').snapshot()
+        self.assertEqual(count, 1)
+        self.assertGreater(hashing_time, 0)
+        _cumulative, queries, count = instrumentation.registry.get_histogram('accounts_view_queries', 'accounts:login').snapshot()
+        self.assertGreater(queries, 0)
+
+    def test_metrics(self):
+        self.client.get(reverse('accounts:login'))
+        # no address is allowed by default : a proxy on the same host would make them all local.
+        self.assertEqual(self.client.get(reverse('accounts:metrics')).status_code, 403)
+        with override_settings(ACCOUNTS_INSTRUMENTATION={**INSTRUMENTATION_SETTINGS, 'METRICS_ALLOWED_IPS': ['127.0.0.1']}):
+            response = self.client.get(reverse('accounts:metrics'))
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn('accounts_view_render_seconds_count{view="accounts:login"} 1', content)
+        self.assertIn('accounts_hashing_in_flight 0', content)
+        self.client.force_login(User.objects.create(username='metricsStaff', is_staff=True))
+        self.assertEqual(self.client.get(reverse('accounts:metrics'), REMOTE_ADDR='10.0.0.1').status_code, 200)
+
+    def test_decorator(self):
+        @instrument_view
+        def view(request):
+            instrumentation.record(instrumentation.MAIL, 0.5)
+            return HttpResponse()
+
+        view(RequestFactory().get('/'))
+        _cumulative, mail_time, count = instrumentation.registry.get_histogram('accounts_view_mail_seconds', f'{__name__}.{self.test_decorator.__qualname__}.<locals>.view').snapshot()
+        self.assertEqual((mail_time, count), (0.5, 1))
+
+
+class MetricsDisabledTestCase(TestCase):
+
+    def test_not_found(self):
+        self.assertEqual(self.client.get(reverse('accounts:metrics')).status_code, 404)
@@ -0,0 +1,73 @@
+from django.test import TestCase, override_settings
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.utils import timezone
+from accounts.models import OutgoingMail
+from accounts import account_services, constants, mail_outbox
+import datetime
+
+TEST_TEMPLATES = [{
+    'BACKEND': 'django.template.backends.django.DjangoTemplates',
+    'OPTIONS': {
+        'loaders': [('django.template.loaders.locmem.Loader', {'validation.html': '<p>Hello {{ FULL_NAME }}</p>'})],
+    },
+}]
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionError("mail server unavailable")
+
+
+def validation_email_context(recipient):
+    return {
+        'template_name': 'validation.html',
+        'title': 'Validation de votre adresse mail',
+        'recipient_email': recipient,
+        'context': {'FULL_NAME': 'user1 user_lastname1'},
+    }
+
+
+@override_settings(TEMPLATES=TEST_TEMPLATES, EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', DEFAULT_FROM_EMAIL='noreply@unittest.com')
+class MailOutboxTestCase(TestCase):
+    def test_send_validation_mail_only_enqueues(self):
+        account_services.send_validation_mail(validation_email_context('user1@unittest.com'))
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutgoingMail.objects.filter(status=constants.MAIL_STATUS_PENDING).count(), 1)
+
+    def test_drain_sends_pending_mails(self):
+        for i in range(5):
+            account_services.send_validation_mail(validation_email_context(f'user{i}@unittest.com'))
+        sent, failed = mail_outbox.drain(batch_size=2, workers=2)
+        self.assertEqual((sent, failed), (5, 0))
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].alternatives[0].content, '<p>Hello user1 user_lastname1</p>')
+        self.assertEqual(OutgoingMail.objects.filter(status=constants.MAIL_STATUS_SENT).count(), 5)
+        self.assertEqual(mail_outbox.drain(), (0, 0))
+
+    def test_mails_not_due_are_not_sent(self):
+        outgoing = mail_outbox.enqueue('validation.html', 'title', 'user1@unittest.com')
+        OutgoingMail.objects.filter(pk=outgoing.pk).update(next_attempt_at=timezone.now() + datetime.timedelta(minutes=5))
+        self.assertEqual(mail_outbox.drain(), (0, 0))
+
+    @override_settings(EMAIL_BACKEND='accounts.tests.test_mail_outbox.FailingEmailBackend', ACCOUNTS_MAIL_OUTBOX={'MAX_ATTEMPTS': 2, 'BACKOFF_SECONDS': 10})
+    def test_failed_mails_are_retried_then_dead_lettered(self):
+        outgoing = mail_outbox.enqueue('validation.html', 'title', 'user1@unittest.com')
+        self.assertEqual(mail_outbox.drain(), (0, 1))
+        outgoing.refresh_from_db()
+        self.assertEqual(outgoing.status, constants.MAIL_STATUS_PENDING)
+        self.assertEqual(outgoing.attempts, 1)
+        self.assertGreater(outgoing.next_attempt_at, timezone.now() + datetime.timedelta(seconds=7))
+        self.assertIn('mail server unavailable', outgoing.last_error)
+
+        OutgoingMail.objects.filter(pk=outgoing.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(mail_outbox.drain(), (0, 1))
+        outgoing.refresh_from_db()
+        self.assertEqual(outgoing.status, constants.MAIL_STATUS_DEAD)
+        self.assertEqual(mail_outbox.drain(), (0, 0))
+
+    def test_purge_sent(self):
+        mail_outbox.enqueue('validation.html', 'title', 'user1@unittest.com')
+        mail_outbox.drain()
+        OutgoingMail.objects.update(sent_at=timezone.now() - datetime.timedelta(days=10))
+        self.assertEqual(mail_outbox.purge_sent(datetime.timedelta(days=7)), 1)
@@ -16,7 +16,7 @@ user1 = {
 user2 = {
     'username' : 'unitTest2',
     'password': 'unitestpassword',
-    'email' : 'user1@unittest.com',
+    'email' : 'user2@unittest.com',
     'first_name': 'user2',
     'last_name': 'user_lastname2',
 
@@ -27,7 +27,7 @@ user3 = {
     'first_name': 'user3',
     'last_name': 'user_lastname3',
     'password': 'unitestpassword',
-    'email' : 'user1@unittest.com',
+    'email' : 'user3@unittest.com',
 }
 
 users  = [user1, user2, user3]
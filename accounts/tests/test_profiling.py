@@ -0,0 +1,107 @@
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import TestCase, modify_settings, override_settings
+from django.urls import reverse
+from accounts.tests.test_account_services import LOGIN_TEST_SETTINGS
+from accounts import profiling
+from unittest import mock
+import io
+import os
+import shutil
+import tempfile
+
+
+class ProfileFilesTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_filename(self):
+        name = profiling.profile_filename('accounts:login', 3, 812.4, 'prof')
+        info = profiling.parse_profile_filename(name)
+        self.assertEqual((info['view'], info['queries'], info['ms'], info['extension']), ('accounts.login', 3, 812, 'prof'))
+        self.assertIsNone(profiling.parse_profile_filename('notes.txt'))
+
+    def test_rotate(self):
+        for i in range(5):
+            open(os.path.join(self.directory, f'20260101-00000{i}-000000_accounts.login_1q_10ms.prof'), 'w').close()
+        profiling.rotate(self.directory, 2)
+        self.assertEqual(profiling.list_profiles(self.directory), ['20260101-000003-000000_accounts.login_1q_10ms.prof', '20260101-000004-000000_accounts.login_1q_10ms.prof'])
+
+    def test_stack_hotspots(self):
+        self_counts, inclusive_counts = profiling.stack_hotspots({'a;b;c': 3, 'a;b': 1, 'a;d': 2})
+        self.assertEqual(self_counts['c'], 3)
+        self.assertEqual(inclusive_counts['a'], 6)
+        self.assertEqual(inclusive_counts['b'], 4)
+
+    def test_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            profiling.ProfilingMiddleware(lambda request: HttpResponse())
+
+
+@modify_settings(MIDDLEWARE={'append': 'accounts.profiling.ProfilingMiddleware'})
+class ProfilingMiddlewareTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def sample_on_unwatch(self):
+        sampler = profiling.get_sampler()
+        original_unwatch = sampler.unwatch
+
+        def unwatch(thread_id):
+            # a request of the test client is faster than the sampling interval.
+            sampler.sample()
+            return original_unwatch(thread_id)
+
+        sampler.unwatch = unwatch
+        self.addCleanup(delattr, sampler, 'unwatch')
+
+    @mock.patch('accounts.profiling.CPROFILE_IS_PER_THREAD', True)
+    def test_sampled_request(self):
+        with override_settings(ACCOUNTS_PROFILING={'ENABLED': True, 'SAMPLE_RATE': 1, 'DIRECTORY': self.directory}, **LOGIN_TEST_SETTINGS):
+            self.client.get(reverse('accounts:availability'), {'username': 'someone'})
+            self.client.get(reverse('accounts:availability'), {'username': 'someone'})
+        names = profiling.list_profiles(self.directory)
+        self.assertEqual(len(names), 2)
+        self.assertEqual(profiling.parse_profile_filename(names[0])['view'], 'accounts.availability')
+        out = io.StringIO()
+        call_command('profile_report', directory=self.directory, top=5, stdout=out)
+        self.assertIn('accounts.availability', out.getvalue())
+        self.assertIn('2 cProfile profiles', out.getvalue())
+
+    @mock.patch('accounts.profiling.CPROFILE_IS_PER_THREAD', False)
+    def test_sampled_request_without_per_thread_cprofile(self):
+        # Python 3.12+ : cProfile would record the other requests too.
+        self.sample_on_unwatch()
+        settings = {'ENABLED': True, 'SAMPLE_RATE': 1, 'SAMPLE_INTERVAL': 0.001, 'DIRECTORY': self.directory}
+        with override_settings(ACCOUNTS_PROFILING=settings, **LOGIN_TEST_SETTINGS):
+            self.client.get(reverse('accounts:availability'), {'username': 'someone'})
+        names = profiling.list_profiles(self.directory)
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names[0].endswith('.stacks'))
+
+    @mock.patch('accounts.profiling.CPROFILE_IS_PER_THREAD', True)
+    def test_overlapping_sampled_request_is_skipped(self):
+        # another request is being profiled with cProfile.
+        self.assertTrue(profiling._cprofile_lock.acquire(blocking=False))
+        self.addCleanup(profiling._cprofile_lock.release)
+        with override_settings(ACCOUNTS_PROFILING={'ENABLED': True, 'SAMPLE_RATE': 1, 'DIRECTORY': self.directory}, **LOGIN_TEST_SETTINGS):
+            response = self.client.get(reverse('accounts:availability'), {'username': 'someone'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(profiling.list_profiles(self.directory), [])
+
+    def test_slow_request(self):
+        self.sample_on_unwatch()
+        settings = {'ENABLED': True, 'SAMPLE_RATE': 0, 'SLOW_REQUEST_MS': 0, 'SAMPLE_INTERVAL': 0.001, 'DIRECTORY': self.directory}
+        with override_settings(ACCOUNTS_PROFILING=settings, **LOGIN_TEST_SETTINGS):
+            self.client.get(reverse('accounts:availability'), {'username': 'someone'})
+        names = profiling.list_profiles(self.directory)
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names[0].endswith('.stacks'))
+        out = io.StringIO()
+        call_command('profile_report', directory=self.directory, stdout=out)
+        self.assertIn('stack sampler profiles', out.getvalue())
@@ -0,0 +1,63 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from accounts.models import Account, OutgoingMail
+from accounts import account_services
+import datetime
+import io
+
+
+class PurgeValidationTokensTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        for i, expire in enumerate([now - datetime.timedelta(days=60)] * 3 + [now - datetime.timedelta(days=1)] * 2 + [now + datetime.timedelta(days=1)]):
+            user = User.objects.create_user(username=f'purgeUser{i}', email=f'purge{i}@unittest.com', is_active=False)
+            Account.objects.filter(user=user).update(validation_token_expire=expire)
+        validated = User.objects.create_user(username='validatedUser', email='validated@unittest.com')
+        Account.objects.filter(user=validated).update(email_validated=True, validation_token_expire=now - datetime.timedelta(days=60))
+
+    def test_clear(self):
+        summary = account_services.purge_validation_tokens('clear', batch_size=2)
+        self.assertEqual((summary['processed'], summary['batches'], summary['finished']), (5, 3, True))
+        self.assertEqual(Account.objects.filter(email_validation_token=None).count(), 5)
+        self.assertEqual(Account.objects.get(user__username='validatedUser').validation_token_expire.date(), (timezone.now() - datetime.timedelta(days=60)).date())
+
+    def test_reissue_and_notify(self):
+        old_tokens = set(Account.objects.values_list('email_validation_token', flat=True))
+        summary = account_services.purge_validation_tokens('reissue', batch_size=10, notify=True)
+        self.assertEqual(summary['processed'], 5)
+        self.assertFalse(Account.objects.filter(email_validated=False, validation_token_expire__lt=timezone.now()).exists())
+        self.assertFalse(old_tokens & set(Account.objects.filter(user__username__in=['purgeUser0', 'purgeUser3']).values_list('email_validation_token', flat=True)))
+        self.assertEqual(OutgoingMail.objects.count(), 5)
+
+    def test_delete_after_grace_period(self):
+        summary = account_services.purge_validation_tokens('delete', grace_period=datetime.timedelta(days=30))
+        self.assertEqual(summary['processed'], 3)
+        self.assertFalse(User.objects.filter(username__in=['purgeUser0', 'purgeUser1', 'purgeUser2']).exists())
+        self.assertEqual(Account.objects.count(), 4)
+
+    def test_cleared_accounts_are_deleted(self):
+        account_services.purge_validation_tokens('clear')
+        self.assertEqual(account_services.purge_validation_tokens('clear')['processed'], 0)
+        summary = account_services.purge_validation_tokens('delete', grace_period=datetime.timedelta(days=30))
+        self.assertEqual(summary['processed'], 3)
+
+    def test_accounts_without_expiry_are_kept(self):
+        # e.g. created by an admin or imported : they never had a validation deadline.
+        Account.objects.filter(user__username='purgeUser0').update(email_validation_token=None, validation_token_expire=None)
+        summary = account_services.purge_validation_tokens('delete', grace_period=datetime.timedelta(days=30))
+        self.assertEqual(summary['processed'], 2)
+        self.assertTrue(User.objects.filter(username='purgeUser0').exists())
+
+    def test_time_budget(self):
+        summary = account_services.purge_validation_tokens('clear', batch_size=1, time_budget=0)
+        self.assertEqual((summary['processed'], summary['finished']), (0, False))
+
+    def test_command_dry_run(self):
+        out = io.StringIO()
+        call_command('purge_validation_tokens', mode='delete', grace_days=30, dry_run=True, stdout=out)
+        self.assertIn('[dry-run] delete : 3 accounts processed', out.getvalue())
+        self.assertEqual(User.objects.count(), 7)
@@ -0,0 +1,67 @@
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from accounts import throttling
+from accounts.account_services import AccountService
+from accounts.resources import ui_strings
+from accounts.tests.test_account_services import LOGIN_TEST_SETTINGS, build_request
+
+
+class LocalThrottleBackendTestCase(TestCase):
+
+    def test_bucket_refills(self):
+        backend = throttling.LocalThrottleBackend(PERIOD=60)
+        with mock.patch('accounts.throttling.time.monotonic', return_value=1000.0):
+            self.assertTrue(all(backend.hit('key', 3) for _ in range(3)))
+            self.assertFalse(backend.hit('key', 3))
+        with mock.patch('accounts.throttling.time.monotonic', return_value=1020.0):
+            self.assertTrue(backend.hit('key', 3))
+            self.assertFalse(backend.hit('key', 3))
+
+    def test_least_recently_used_keys_are_evicted(self):
+        backend = throttling.LocalThrottleBackend(MAX_KEYS=10)
+        for i in range(100):
+            backend.hit(f'key{i}', 3)
+        self.assertEqual(len(backend._buckets), 10)
+        self.assertIn('key99', backend._buckets)
+        self.assertNotIn('key0', backend._buckets)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CacheThrottleBackendTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_sliding_window(self):
+        backend = throttling.CacheThrottleBackend(PERIOD=60)
+        with mock.patch('accounts.throttling.time.time', return_value=6000.0):
+            self.assertTrue(all(backend.hit('key', 4) for _ in range(4)))
+            self.assertFalse(backend.hit('key', 4))
+        # halfway through the next window, half of the previous attempts still count.
+        with mock.patch('accounts.throttling.time.time', return_value=6090.0):
+            self.assertTrue(backend.hit('key', 4))
+            self.assertTrue(backend.hit('key', 4))
+            self.assertFalse(backend.hit('key', 4))
+
+
+@override_settings(ACCOUNTS_LOGIN_THROTTLE={'BACKEND': 'accounts.throttling.LocalThrottleBackend', 'USERNAME_LIMIT': 2, 'IP_LIMIT': 10}, **LOGIN_TEST_SETTINGS)
+class LoginThrottleTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        with override_settings(**LOGIN_TEST_SETTINGS):
+            User.objects.create_user(username='throttledUser', password='unitestpassword')
+
+    def login(self, username):
+        return AccountService.process_login_request(build_request(data={'username': username, 'password': 'wrongpassword'}))
+
+    def test_rejected_before_any_query(self):
+        self.login('throttledUser')
+        self.login('ThrottledUser')
+        with self.assertNumQueries(0):
+            result = self.login('throttledUser')
+        self.assertTrue(result['throttled'])
+        self.assertEqual(result['login_error'], ui_strings.LOGIN_THROTTLED_ERROR)
+        self.assertNotIn('throttled', self.login('otherUser'))
@@ -0,0 +1,105 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from accounts.models import Account
+from accounts.account_services import AccountService
+from accounts.tests.test_account_services import TRANSACTION_CONTROL
+from accounts.tokens_gen import ExpiredToken, InvalidToken, validation_token_generator
+from unittest import mock
+import datetime
+import time
+import uuid
+
+
+class ValidationTokenTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='tokenUser', email='token@unittest.com', is_active=False)
+        Account.objects.filter(user=user).update(validation_token_expire=timezone.now() + datetime.timedelta(hours=1))
+        cls.account = Account.objects.get(user=user)
+
+    def test_token_round_trip(self):
+        token = validation_token_generator.make_token(self.account)
+        self.assertEqual(validation_token_generator.check_token(self.account.account_uuid, token), self.account.email_validation_token)
+        self.assertEqual(resolve(self.account.get_validation_url()).kwargs['token'], token)
+
+    def test_rejected_without_query(self):
+        token = validation_token_generator.make_token(self.account)
+        with self.assertNumQueries(0):
+            with self.assertRaises(InvalidToken):
+                validation_token_generator.check_token(uuid.uuid4(), token)
+            with self.assertRaises(InvalidToken):
+                validation_token_generator.check_token(self.account.account_uuid, token[:-1] + ('A' if token[-1] != 'A' else 'B'))
+            result = AccountService.validate_email(self.account.account_uuid, 'garbage:token:value')
+        self.assertFalse(result['validated'])
+
+    def test_expired_token(self):
+        token = validation_token_generator.make_token(self.account)
+        later = time.time() + datetime.timedelta(hours=49).total_seconds()
+        with mock.patch('django.core.signing.time.time', return_value=later):
+            with self.assertRaises(ExpiredToken):
+                validation_token_generator.check_token(self.account.account_uuid, token)
+
+    def test_validation(self):
+        token = validation_token_generator.make_token(self.account)
+        result = AccountService.validate_email(self.account.account_uuid, token)
+        self.assertTrue(result['validated'])
+        account = Account.objects.select_related('user').get(pk=self.account.pk)
+        self.assertTrue(account.email_validated)
+        self.assertTrue(account.user.is_active)
+        # the link is void once used, but its account is reported as validated.
+        self.assertEqual(AccountService.validate_email(self.account.account_uuid, token)['message'], "Email already validated")
+        self.assertIsNone(Account.objects.get(pk=self.account.pk).email_validation_token)
+
+    def test_legacy_token(self):
+        legacy_token = self.account.email_validation_token
+        with override_settings(ACCOUNTS_LEGACY_VALIDATION_TOKENS_UNTIL=timezone.now() - datetime.timedelta(days=1)):
+            with self.assertNumQueries(0):
+                self.assertFalse(AccountService.validate_email(self.account.account_uuid, legacy_token)['validated'])
+        # without the setting, the window is closed.
+        with self.assertNumQueries(0):
+            self.assertFalse(AccountService.validate_email(self.account.account_uuid, legacy_token)['validated'])
+        with override_settings(ACCOUNTS_LEGACY_VALIDATION_TOKENS_UNTIL=timezone.now() + datetime.timedelta(days=1)):
+            self.assertTrue(AccountService.validate_email(self.account.account_uuid, legacy_token)['validated'])
+
+
+class EmailValidationPipelineTestCase(TransactionTestCase):
+    """
+    A TransactionTestCase, so the budget counts the statements of a real transaction.
+    """
+
+    def setUp(self):
+        user = User.objects.create_user(username='pipelineUser', email='pipeline@unittest.com', is_active=False)
+        Account.objects.filter(user=user).update(validation_token_expire=timezone.now() + datetime.timedelta(hours=1))
+        self.account = Account.objects.get(user=user)
+        self.token = validation_token_generator.make_token(self.account)
+
+    def validate(self, token, queries):
+        with CaptureQueriesContext(connection) as context:
+            result = AccountService.validate_email(self.account.account_uuid, token)
+        statements = [query['sql'] for query in context.captured_queries if not TRANSACTION_CONTROL.match(query['sql'])]
+        self.assertEqual(len(statements), queries, '\n'.join(statements))
+        return result
+
+    def test_validation_query_budget(self):
+        # the account UPDATE and the user UPDATE.
+        result = self.validate(self.token, queries=2)
+        self.assertTrue(result['validated'])
+        self.assertTrue(User.objects.get(username='pipelineUser').is_active)
+
+    def test_double_click(self):
+        self.validate(self.token, queries=2)
+        # the conditional UPDATE matches nothing, then the account is found validated.
+        result = self.validate(self.token, queries=2)
+        self.assertTrue(result['validated'])
+        self.assertEqual(result['message'], "Email already validated")
+
+    def test_expired(self):
+        Account.objects.filter(pk=self.account.pk).update(validation_token_expire=timezone.now() - datetime.timedelta(minutes=1))
+        result = self.validate(self.token, queries=2)
+        self.assertFalse(result['validated'])
+        self.assertFalse(User.objects.get(username='pipelineUser').is_active)
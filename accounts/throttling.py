@@ -0,0 +1,168 @@
+"""
+Login throttle.
+
+Login attempts are counted per username and per client IP before the password is hashed,
+so a credential stuffing burst is rejected without paying for the password hashes.
+
+The throttle is opt-in and configured with the ACCOUNTS_LOGIN_THROTTLE setting :
+
+    ACCOUNTS_LOGIN_THROTTLE = {
+        'BACKEND': 'accounts.throttling.CacheThrottleBackend',
+        'CACHE_ALIAS': 'default',
+        'USERNAME_LIMIT': 5,
+        'IP_LIMIT': 20,
+        'PERIOD': 60,
+    }
+
+which allows USERNAME_LIMIT attempts per username and IP_LIMIT attempts per IP over any
+PERIOD seconds. Two backends are available :
+ * CacheThrottleBackend counts the attempts in the Django cache, shared by all the processes.
+   It keeps two counters per key : the current and the previous fixed windows. The attempts of
+   the sliding window are estimated by weighting the previous window by its overlap.
+ * LocalThrottleBackend keeps a token bucket per key in the process. The buckets are kept in
+   LRU order and at most MAX_KEYS of them are kept. Use it for tests and single process servers.
+
+The client IP is taken from REMOTE_ADDR : behind a proxy, it must be set from the forwarded
+headers by the proxy or by a middleware.
+"""
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+import hashlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger('accounts')
+
+DEFAULT_LOGIN_THROTTLE_BACKEND = 'accounts.throttling.NullThrottleBackend'
+
+
+class NullThrottleBackend:
+    """
+    Lets every attempt through. This is the default backend.
+    """
+    enabled = False
+
+    def __init__(self, USERNAME_LIMIT=5, IP_LIMIT=20, PERIOD=60, **kwargs):
+        self.username_limit = USERNAME_LIMIT
+        self.ip_limit = IP_LIMIT
+        self.period = PERIOD
+
+    def hit(self, key, limit):
+        """
+        Count an attempt on key. Returns False when key already reached limit attempts over
+        the last period : the attempt is then not counted.
+        """
+        return True
+
+    def allow(self, request, username):
+        """
+        Count a login attempt for username from the client of request.
+        Returns False when the attempt must be rejected.
+        """
+        ip = request.META.get('REMOTE_ADDR')
+        if ip and self.ip_limit and not self.hit(f"ip:{ip}", self.ip_limit):
+            logger.warning(f"login throttled for the IP {ip}")
+            return False
+        if self.username_limit and not self.hit(f"user:{username.lower()}", self.username_limit):
+            logger.warning(f"login throttled for the username {username}")
+            return False
+        return True
+
+
+class LocalThrottleBackend(NullThrottleBackend):
+    """
+    Token buckets in the memory of the process.
+    A bucket holds up to limit tokens, refilled at limit tokens per period, and an attempt takes one.
+    """
+    enabled = True
+
+    def __init__(self, MAX_KEYS=10000, **kwargs):
+        super().__init__(**kwargs)
+        self.max_keys = MAX_KEYS
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.pop(key, None)
+            if bucket is None:
+                tokens = limit
+            else:
+                tokens, updated = bucket
+                tokens = min(limit, tokens + (now - updated) * limit / self.period)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed
+
+
+class CacheThrottleBackend(NullThrottleBackend):
+    """
+    Sliding window counters in the Django cache.
+    """
+    enabled = True
+    key_prefix = 'accounts:throttle'
+
+    def __init__(self, CACHE_ALIAS='default', **kwargs):
+        super().__init__(**kwargs)
+        self.cache_alias = CACHE_ALIAS
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def window_key(self, key, window):
+        # usernames may hold characters some cache backends refuse in keys.
+        digest = hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+        return f"{self.key_prefix}:{digest}:{window}"
+
+    def hit(self, key, limit):
+        now = time.time()
+        window, offset = divmod(now, self.period)
+        current_key = self.window_key(key, int(window))
+        previous_key = self.window_key(key, int(window) - 1)
+        counts = self.cache.get_many([current_key, previous_key])
+        previous = counts.get(previous_key, 0)
+        current = counts.get(current_key, 0)
+        if previous * (1 - offset / self.period) + current >= limit:
+            return False
+        # a counter is read during its window and the next one.
+        self.cache.add(current_key, 0, timeout=int(2 * self.period) + 1)
+        try:
+            self.cache.incr(current_key)
+        except ValueError:
+            # the counter was evicted between add() and incr().
+            self.cache.set(current_key, 1, timeout=int(2 * self.period) + 1)
+        return True
+
+
+_backend = None
+
+
+def get_login_throttle():
+    global _backend
+    if _backend is None:
+        config = dict(getattr(settings, 'ACCOUNTS_LOGIN_THROTTLE', None) or {})
+        backend_class = import_string(config.pop('BACKEND', 'accounts.throttling.CacheThrottleBackend') if config else DEFAULT_LOGIN_THROTTLE_BACKEND)
+        _backend = backend_class(**config)
+    return _backend
+
+
+def allow_login(request, username):
+    return get_login_throttle().allow(request, username)
+
+
+@receiver(setting_changed)
+def reset_login_throttle(sender, setting, **kwargs):
+    global _backend
+    if setting == 'ACCOUNTS_LOGIN_THROTTLE':
+        _backend = None
@@ -1,10 +1,89 @@
+"""
+Email validation tokens.
 
+The validation links carry a token signed with SECRET_KEY and timestamped :
+
+    <fingerprint>:<timestamp>:<signature>
+
+The signature covers the account_uuid of the link and the fingerprint, the nonce stored in
+Account.email_validation_token when the link was issued. A forged, altered or expired token is
+rejected without any query. A valid one is accepted by a single conditional UPDATE matching the
+stored nonce, so a link is void once the account is validated or a new link was issued.
+
+Links issued before signed tokens carry the bare nonce. They are only accepted until the
+ACCOUNTS_LEGACY_VALIDATION_TOKENS_UNTIL setting (a datetime) : set it ACTIVATION_DELAY_HOURS
+after the upgrade, when all the old links have expired. Without the setting they are rejected.
+"""
+from django.conf import settings
+from django.core import signing
 from django.utils import timezone
 from accounts import constants
-import secrets
 import datetime
+import re
+import secrets
+import uuid
 
 
 def get_activation_token():
     return secrets.token_urlsafe(constants.TOKEN_LENGTH)
 
+
+# nonces of get_activation_token() : TOKEN_LENGTH random bytes, base64 encoded.
+LEGACY_TOKEN_RE = re.compile(r'^[A-Za-z0-9_-]{%d}$' % len(secrets.token_urlsafe(constants.TOKEN_LENGTH)))
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class ExpiredToken(InvalidToken):
+    pass
+
+
+class ValidationTokenGenerator:
+    salt = 'accounts.tokens_gen.ValidationTokenGenerator'
+
+    def __init__(self):
+        self.signer = signing.TimestampSigner(salt=self.salt)
+
+    @property
+    def max_age(self):
+        return datetime.timedelta(hours=constants.ACTIVATION_DELAY_HOURS)
+
+    def make_token(self, account):
+        """
+        Return the signed token of the current validation nonce of account.
+        """
+        signed = self.signer.sign(f"{account.account_uuid.hex}:{account.email_validation_token}")
+        # the account_uuid is already in the link : it is left out of the token.
+        return signed.split(':', 1)[1]
+
+    def legacy_tokens_accepted(self):
+        until = getattr(settings, 'ACCOUNTS_LEGACY_VALIDATION_TOKENS_UNTIL', None)
+        return until is not None and timezone.now() < until
+
+    def check_token(self, account_uuid, token):
+        """
+        Return the nonce token was issued for. No query is run.
+        Raises ExpiredToken or InvalidToken.
+        """
+        if not account_uuid or not token:
+            raise InvalidToken("account or token missing")
+        try:
+            account_uuid = account_uuid if isinstance(account_uuid, uuid.UUID) else uuid.UUID(str(account_uuid))
+        except ValueError:
+            raise InvalidToken("invalid account")
+        if ':' not in token:
+            if LEGACY_TOKEN_RE.match(token) and self.legacy_tokens_accepted():
+                return token
+            raise InvalidToken("invalid token")
+        try:
+            value = self.signer.unsign(f"{account_uuid.hex}:{token}", max_age=self.max_age)
+        except signing.SignatureExpired:
+            raise ExpiredToken("token has expired")
+        except signing.BadSignature:
+            raise InvalidToken("invalid token")
+        return value.split(':', 1)[1]
+
+
+validation_token_generator = ValidationTokenGenerator()
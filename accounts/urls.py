@@ -16,6 +16,8 @@ urlpatterns = [
     path('password-change-done/', views.password_change_done_views, name='password-change-done'),
     path('password-reset/', auth_views.PasswordResetView.as_view(success_url=reverse_lazy('accounts:password-reset-done')), name='password-reset'),
     path('password-reset-done/', auth_views.PasswordResetDoneView.as_view(), name='password-reset-done'),
+    path('availability/', views.availability, name='availability'),
+    path('metrics/', views.metrics, name='metrics'),
     path('register/', views.register, name='register'),
     path('registration-complete/<uuid:account_uuid>/', views.registration_complete, name='registration-complete'),
     path('registration-complete/', views.registration_complete, name='registration-complete'),
@@ -1,13 +1,16 @@
 from django.contrib.auth.models import User
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import redirect
+from django.http import Http404, HttpResponse, JsonResponse
+from django.views.decorators.http import require_GET
 from django.contrib import auth, messages
 from django.utils.translation import gettext as _
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth import update_session_auth_hash
-from accounts import constants as Account_Constants, account_services
-from accounts.models import Account
-from accounts.forms import  AccountCreationForm, UserSignUpForm, UpdateAccountForm, UpdateUserForm
+from accounts import constants as Account_Constants, account_services, bloom, instrumentation
+from accounts.models import Account, get_normalized_email
+from accounts.forms import  AccountCreationForm, UserSignUpForm, UpdateAccountForm, UpdateUserForm, AccountPasswordChangeForm
+from accounts.decorators import shed_hashing_overload
+from accounts.instrumentation import render
 from accounts.account_services import AccountService
 from accounts.resources import ui_strings
 from django.conf import settings
@@ -16,6 +19,7 @@ import logging
 logger = logging.getLogger('accounts')
 
 # Create your views here.
+@shed_hashing_overload
 def login(request):
     """
     Log in view
@@ -23,6 +27,7 @@ def login(request):
     page_title = _("Login")
     template_name = 'accounts/registration/login.html'
     context = {}
+    status = 200
     if request.method == 'POST':
         next_url = request.POST.get('next', '/')
         result = AccountService.process_login_request(request)
@@ -38,6 +43,8 @@ def login(request):
             context['has_login_error'] = True
             context['login_error'] = error_msg
             form = result.get('form')
+            if result.get('throttled'):
+                status = 429
     else:
         form = AccountService.get_authentication_form()
 
@@ -51,7 +58,7 @@ def login(request):
         'form': form,
         'registration_form': register_form,
     })
-    return render(request, template_name, context)
+    return render(request, template_name, context, status=status)
 
 
 def logout(request):
@@ -62,6 +69,7 @@ def logout(request):
     return redirect('home')
 
 
+@shed_hashing_overload
 def register(request):
     """
     User registration view
@@ -73,13 +81,7 @@ def register(request):
         result = AccountService.process_registration_request(request)
         if result['user_created']:
             messages.add_message(request, messages.SUCCESS, ui_strings.ACCOUNT_REGISTRATION_SUCCESS_MESSAGE)
-            user = result['user']
-            user.refresh_from_db()
-            try:
-                account_uuid = user.account.account_uuid
-            except Exception:
-                account_uuid = None
-            return redirect("accounts:registration-complete", account_uuid=account_uuid)
+            return redirect("accounts:registration-complete", account_uuid=result['account_uuid'])
         else:
             messages.add_message(request, messages.ERROR, ui_strings.ACCOUNT_REGISTRATION_ERROR_MESSAGE)
             user_form = result['form']
@@ -97,32 +99,41 @@ def register(request):
     }
     return render(request, template_name, context)
 
+@require_GET
+def availability(request):
+    """
+    Tell whether the username and/or email given in the query string are available,
+    for the live validation of the registration form. Values ruled out by the existence
+    index are answered without a query.
+    """
+    result = {}
+    username = request.GET.get('username')
+    if username:
+        available = not bloom.may_contain_username(username) or not User.objects.filter(username=username).exists()
+        result['username'] = {'value': username, 'available': available}
+    email = request.GET.get('email')
+    if email:
+        available = not bloom.may_contain_email(email) or not Account.objects.filter(normalized_email=get_normalized_email(email)).exists()
+        result['email'] = {'value': email, 'available': available}
+    return JsonResponse(result)
+
+@require_GET
+def metrics(request):
+    """
+    The accounts metrics in the Prometheus text format, for staff users and METRICS_ALLOWED_IPS.
+    """
+    if not instrumentation.is_enabled():
+        raise Http404("Instrumentation is not enabled")
+    allowed_ips = instrumentation.get_instrumentation_setting('METRICS_ALLOWED_IPS')
+    if not request.user.is_staff and request.META.get('REMOTE_ADDR') not in allowed_ips:
+        return HttpResponse(status=403)
+    return HttpResponse(instrumentation.render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 def send_validation(request, account_uuid):
-    account = get_object_or_404(Account, account_uuid=account_uuid)
-    email_sent = False
-    queryset = Account.objects.filter(account_uuid=account_uuid, email_validated=True)
-    if not queryset.exists():
-        logger.debug(f" account {account} not validated. sending validation link now")
-        token = AccountService.generate_email_validation_token()
-        expiration_date = AccountService.get_token_expire_time()
-        account.email_validation_token = token
-        account.validation_token_expire = expiration_date
-        account.save()
-        #queryset.update(email_validation_token=token, validation_token_expire=expiration_date)
-        #account.refresh_from_db()
-        email_context = {
-            'template_name': settings.DJANGO_VALIDATION_EMAIL_TEMPLATE,
-            'title': 'Validation de votre adresse mail',
-            'recipient_email': account.user.email,
-            'context':{
-                'SITE_NAME': settings.SITE_NAME,
-                'SITE_HOST': settings.SITE_HOST,
-                'FULL_NAME': account.user.get_full_name(),
-                'validation_url' : settings.SITE_HOST + account.get_validation_url()
-            }
-        }
-        account_services.send_validation_mail(email_context)
-        email_sent = True
+    account = AccountService.get_account(account_uuid)
+    if account is None:
+        raise Http404("No Account found")
+    email_sent = AccountService.send_validation(account)
         
     if email_sent:
         messages.add_message(request, messages.INFO, "Validation has been sent")
@@ -143,10 +154,9 @@ def email_validation(request, account_uuid=None, token=None):
     logger.info("Account email validation...")
     template_name = "registration/email_validation.html"
     page_title = "Email Validation"
-    account = get_object_or_404(Account, account_uuid=account_uuid, email_validation_token=token)
     result = AccountService.validate_email(account_uuid=account_uuid, token=token)
     context = {
-        'account'   : account,
+        'account_uuid': account_uuid,
         'validated' : result['validated'],
         'msg'       : result['message'],
         'page_title': page_title
@@ -155,6 +165,7 @@ def email_validation(request, account_uuid=None, token=None):
 
 
 @login_required
+@shed_hashing_overload
 def password_change_views(request):
     """ 
         This view is called when the user want to change its password
@@ -164,7 +175,7 @@ def password_change_views(request):
     success_url = 'accounts:password-change-done'
     if request.method == 'POST':
         postdata = request.POST.copy()
-        form = PasswordChangeForm(request.user, postdata)
+        form = AccountPasswordChangeForm(request.user, postdata)
         if form.is_valid():
             user = form.save()
             update_session_auth_hash(request, user)
@@ -177,7 +188,7 @@ def password_change_views(request):
         else:
             messages.error(request, ui_strings.ACCOUNT_INVALID_FORM_DATA)
     else:
-        form = PasswordChangeForm(request.user)
+        form = AccountPasswordChangeForm(request.user)
     
     context = {
         'page_title': page_title,
@@ -207,11 +218,9 @@ def registration_complete(request, account_uuid=None):
     """
     new_user = None
     if account_uuid is not None:
-        try:
-            account = Account.objects.get(account_uuid=account_uuid)
+        account = AccountService.get_account(account_uuid)
+        if account is not None:
             new_user = account.user
-        except User.DoesNotExist:
-            pass
     template_name = "registration/registration_complete.html"
     page_title = _('Registration Confirmation')
     context = {
@@ -252,7 +261,9 @@ def user_account(request):
     template_name = "accounts/account.html"
     page_title = _('My Account')
     name = request.user.get_full_name()
-    current_account = get_object_or_404(Account, user=request.user)
+    current_account = AccountService.get_request_account(request)
+    if current_account is None:
+        raise Http404("No Account found")
     context = {
         'name'          : name,
         'page_title'    : page_title,
@@ -264,7 +275,9 @@ def user_account(request):
 @login_required
 def account_details(request, account_uuid=None):
     page_title = _("Account Details")
-    instance = get_object_or_404(Account, account_uuid=account_uuid)
+    instance = AccountService.get_request_account(request, account_uuid)
+    if instance is None:
+        raise Http404("No Account found")
     template_name = "accounts/account_detail.html"
     #form = AccountForm(request.POST or None, instance=instance)
     context = {
@@ -279,7 +292,9 @@ def account_details(request, account_uuid=None):
 def account_update(request, account_uuid=None):
     
     page_title = _("Edit my account")
-    instance = get_object_or_404(Account, account_uuid=account_uuid)
+    instance = AccountService.get_request_account(request, account_uuid)
+    if instance is None:
+        raise Http404("No Account found")
     template_name = "accounts/account_update.html"
     if request.method == "POST":
         userForm = UpdateUserForm(request.POST.copy(), instance=request.user)